@@ -12,10 +12,49 @@ CRYPTO_BOT_API_URL = "https://pay.crypt.bot/api"
 CRYPTO_MIN_AMOUNT = 0.1  # Минимальная сумма в USDT
 CRYPTO_CURRENCY = "USDT"
 CRYPTO_NETWORK = "TRC20"  # Сеть для USDT
+CRYPTO_POOL_SIZE = 20  # Соединений с API в пуле
+CRYPTO_KEEPALIVE_TIMEOUT = 60  # Сколько держать простаивающее соединение (в секундах)
+CRYPTO_CONNECT_TIMEOUT = 5  # Таймаут подключения (в секундах)
+CRYPTO_REQUEST_TIMEOUT = 15  # Таймаут запроса целиком (в секундах)
+CRYPTO_MAX_RETRIES = 3  # Повторов для идемпотентных методов
+CRYPTO_RETRY_BASE_DELAY = 0.5  # Базовая пауза перед повтором, растет вдвое (в секундах)
+CRYPTO_BREAKER_THRESHOLD = 5  # Неудачных запросов подряд до размыкания
+CRYPTO_BREAKER_RESET = 30  # Через сколько секунд пробовать снова после размыкания
+CRYPTO_RATES_TTL = 60  # Сколько секунд курсы обмена считаются свежими
+CRYPTO_BALANCE_TTL = 30  # Сколько секунд баланс приложения считается свежим
+CRYPTO_CACHE_STALE_TTL = 300  # Сколько еще секунд отдавать устаревшее значение, обновляя его в фоне
 
 # Настройки базы данных
 DATABASE_URL = "sqlite+aiosqlite:///database.db"
 
+# Профиль движка SQLite: "tuned" (PRAGMA ниже) или "default" (настройки драйвера)
+DB_PROFILE = "tuned"
+DB_ECHO = False  # Логировать каждый SQL-запрос (только для отладки)
+
+# PRAGMA, выполняемые на каждом новом соединении профиля "tuned"
+DB_PRAGMAS = {
+    "journal_mode": "WAL",  # Читатели не блокируют писателя
+    "synchronous": "NORMAL",  # В режиме WAL безопасно, fsync только на чекпоинтах
+    "mmap_size": 256 * 1024 * 1024,  # 256 МБ файла читаются через mmap
+    "cache_size": -64000,  # Кэш страниц 64 МБ на соединение
+    "busy_timeout": 5000,  # Ожидание блокировки (мс) вместо ошибки "database is locked"
+    "temp_store": "MEMORY",  # Временные таблицы и сортировки в памяти
+}
+
+# Пул соединений только для чтения (каталог, профили, отчеты).
+# Запись всегда идет через одно соединение писателя
+DB_READ_POOL_SIZE = 5
+DB_READ_MAX_OVERFLOW = 10
+DB_POOL_TIMEOUT = 30  # Секунды ожидания свободного соединения (для писателя - очереди на запись)
+
+# Резервное копирование через SQLite backup API
+BACKUP_PAGES_PER_STEP = 1024  # Страниц за один шаг копирования
+BACKUP_STEP_SLEEP = 0.01  # Пауза между шагами (в секундах)
+BACKUP_FULL_INTERVAL = 24  # Новая полная копия не реже чем раз в столько часов
+BACKUP_KEEP_HOURLY = 24  # Хранить последних снимков
+BACKUP_KEEP_DAILY = 7  # Хранить по снимку за день, дней
+BACKUP_KEEP_WEEKLY = 4  # Хранить по снимку за неделю, недель
+
 # Доступные сервисы
 AVAILABLE_SERVICES = {
     "whatsapp": "WhatsApp",
@@ -33,6 +72,68 @@ AVAILABLE_SERVICES = {
 # Настройки времени аренды (в часах)
 RENTAL_PERIODS = [1, 4, 12, 24]
 
+# Количество объявлений на одной странице каталога
+LISTINGS_PAGE_SIZE = 10
+
+# Интервал сверки книги объявлений с базой данных (в секундах)
+ORDER_BOOK_CHECK_INTERVAL = 600
+
+# Интервал сверки журнала проводок с балансами пользователей (в секундах)
+LEDGER_RECONCILE_INTERVAL = 3600
+
+# Репутация продавцов: байесовская оценка с затуханием старых отзывов
+REPUTATION_PRIOR = 4.0  # Оценка продавца без отзывов
+REPUTATION_PRIOR_WEIGHT = 5  # Сколько отзывов весит априорная оценка
+REPUTATION_HALF_LIFE_DAYS = 180  # Через столько дней вес отзыва уменьшается вдвое
+REPUTATION_REFRESH_INTERVAL = 3600  # Интервал полного пересчета (в секундах)
+REPUTATION_BATCH_SIZE = 5000  # Строк за одну выборку и пользователей за один UPDATE при пересчете
+
+# Кэш пользователей для обработчиков (database.user_cache)
+USER_CACHE_SIZE = 10000  # Сколько пользователей держать в памяти
+USER_CACHE_TTL = 30  # Сколько секунд доверять записи; изменения из других процессов видны не позже
+
+# Интервал перезагрузки списков заблокированных и администраторов (в секундах)
+GATEKEEPER_REFRESH_INTERVAL = 60
+
+# Ограничение частоты запросов пользователя (utils.middlewares.ThrottlingMiddleware):
+# ключ обработчика (флаг throttling_key) -> (запросов в секунду, подряд без ожидания)
+THROTTLE_RATES = {
+    "default": (2, 10),
+    "catalogue": (0.5, 4),  # Каталог и обновление списка объявлений
+    "stats": (0.1, 2),  # Статистика для администраторов
+}
+THROTTLE_CALLBACK_DEBOUNCE = 1.0  # Повторное нажатие той же кнопки раньше этого срока игнорируется (в секундах)
+
+# Хранилище состояний диалогов (FSM) в SQLite
+FSM_FLUSH_INTERVAL = 0.2  # Как часто сбрасывать накопленные изменения в базу (в секундах)
+FSM_CACHE_TTL = 60  # Сколько секунд доверять локальной копии, прежде чем перечитать базу
+FSM_STATE_TTL = 86400  # Через сколько секунд бездействия состояние удаляется
+FSM_CLEANUP_INTERVAL = 3600  # Интервал удаления устаревших состояний (в секундах)
+
+# Рассылка объявлений (лимит Telegram - около 30 сообщений в секунду на бота)
+BROADCAST_RATE = 25  # Сообщений в секунду
+BROADCAST_BURST = 5  # Сообщений подряд без ожидания
+BROADCAST_CONCURRENCY = 20  # Одновременных запросов к Bot API
+BROADCAST_BATCH_SIZE = 500  # Пользователей за одну выборку; после каждой сохраняется прогресс
+BROADCAST_MAX_RETRIES = 5  # Повторов при сетевых ошибках и ошибках сервера
+BROADCAST_RETRY_DELAY = 1  # Первая пауза перед повтором, удваивается (в секундах)
+BROADCAST_PROGRESS_INTERVAL = 5  # Не чаще раза в столько секунд обновлять прогресс у админа
+BROADCAST_LEASE = 300  # Аренда рассылки процессом, продлевается после каждой пачки (в секундах)
+
+# Очередь выплат через CryptoBot
+PAYOUT_AUTO_APPROVE_LIMIT = 50  # Выплаты до этой суммы (USDT) уходят без одобрения администратора
+PAYOUT_CONCURRENCY = 5  # Одновременных переводов
+PAYOUT_BATCH_SIZE = 50  # Выплат, забираемых из очереди за раз
+PAYOUT_POLL_INTERVAL = 5  # Как часто проверять очередь без новых заявок (в секундах)
+PAYOUT_RECONCILE_DELAY = 60  # Через сколько секунд выяснять судьбу перевода без ответа (в секундах)
+PAYOUT_MAX_ATTEMPTS = 5  # После стольких неудачных отправок выплата возвращается администратору
+
+# Проверка оплаты счетов через getInvoices (на случай, если веб-хук не дошел)
+INVOICE_POLL_MIN_INTERVAL = 5  # Интервал сразу после создания или оплаты счета (в секундах)
+INVOICE_POLL_MAX_INTERVAL = 60  # Интервал растет вдвое после каждой проверки без изменений до этого предела
+INVOICE_BATCH_SIZE = 100  # Счетов в одном запросе getInvoices
+INVOICE_FORGET_AFTER = 86400  # Счет, которого нет в ответе CryptoBot, считается истекшим через столько секунд
+
 # Комиссия платформы (5%)
 PLATFORM_FEE = 0.05
 
@@ -45,6 +146,21 @@ WEBHOOK_HOST = ""  # Например: https://your-domain.com
 WEBHOOK_PATH = "/crypto-pay-webhook"
 WEBHOOK_URL = f"{WEBHOOK_HOST}{WEBHOOK_PATH}" if WEBHOOK_HOST else ""
 
+# Обновления Telegram через веб-хук (если WEBHOOK_HOST пуст - long polling)
+TELEGRAM_WEBHOOK_PATH = "/telegram-webhook"
+TELEGRAM_WEBHOOK_URL = f"{WEBHOOK_HOST}{TELEGRAM_WEBHOOK_PATH}" if WEBHOOK_HOST else ""
+WEBHOOK_SECRET = ""  # Секрет для X-Telegram-Bot-Api-Secret-Token (пустой - случайный при каждом запуске)
+WEBHOOK_MAX_CONNECTIONS = 40  # Сколько соединений Telegram может держать одновременно
+WEBHOOK_MAX_CONCURRENT_UPDATES = 100  # Обновлений в обработке одновременно
+WEBHOOK_MAX_BODY_SIZE = 1024 * 1024  # Максимальный размер тела запроса (в байтах)
+
+# Несколько процессов-обработчиков (0 - все в одном процессе)
+CLUSTER_WORKERS = 0  # Число процессов-обработчиков за приемным процессом
+CLUSTER_SOCKET_DIR = "/tmp"  # Каталог Unix-сокетов обработчиков
+CLUSTER_WORKER_CONCURRENCY = 100  # Обновлений в обработке одновременно в одном процессе
+CLUSTER_START_TIMEOUT = 30  # Сколько ждать запуска процесса-обработчика (в секундах)
+CLUSTER_BOOK_SYNC_INTERVAL = 10  # Интервал сверки книги объявлений в процессах-обработчиках (в секундах)
+
 # Настройки веб-сервера
 WEBAPP_HOST = "localhost"
 WEBAPP_PORT = 8080
@@ -3,7 +3,10 @@ import time
 from database.backup import backup_database
 
 async def run_auto_backup():
-    """Запускает автоматическое резервное копирование каждый час"""
+    """
+    Запускает автоматическое резервное копирование каждый час:
+    сжатые инкрементные снимки с хранением по часам, дням и неделям
+    """
     print("🔄 Запущен сервис автоматического резервного копирования")
     while True:
         await backup_database()
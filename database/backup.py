@@ -1,34 +1,279 @@
+import argparse
 import asyncio
+import gzip
+import hashlib
+import re
 import shutil
-from datetime import datetime
+import sqlite3
+import struct
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timedelta
 from pathlib import Path
+from typing import List, Optional
+
+# Добавляем корневую директорию проекта в PYTHONPATH
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
 from database.db import DB_PATH
+from config import (
+    BACKUP_PAGES_PER_STEP, BACKUP_STEP_SLEEP, BACKUP_FULL_INTERVAL,
+    BACKUP_KEEP_HOURLY, BACKUP_KEEP_DAILY, BACKUP_KEEP_WEEKLY
+)
+
+BACKUP_DIR = Path("database/backups")
+TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+# roxort_<время>_full.db.gz - полная копия (база);
+# roxort_<время>_diff_<время базы>.pages.gz - страницы, изменившиеся относительно базы
+SNAPSHOT_PATTERN = re.compile(r"roxort_(\d{8}_\d{6})_(?:full|diff_(\d{8}_\d{6}))\.(?:db|pages)\.gz$")
+
+# Файл разницы: заголовок (размер страницы, число страниц), затем записи (номер страницы, страница)
+DIFF_MAGIC = b"RXDIFF1\n"
+PAGES_HEADER = struct.Struct(">IQ")
+PAGE_NUMBER = struct.Struct(">Q")
+
+# Размер отпечатка страницы, по которому ищутся изменения относительно базы
+PAGE_HASH_SIZE = 16
+
+@dataclass
+class Snapshot:
+    """Резервная копия на момент created_at"""
+    path: Path
+    created_at: datetime
+    base: datetime  # время полной копии, от которой строится снимок
+
+    @property
+    def is_full(self) -> bool:
+        return self.created_at == self.base
+
+def list_snapshots(backup_dir: Path = BACKUP_DIR) -> List[Snapshot]:
+    """Все снимки в каталоге, от старых к новым"""
+    snapshots = []
+    for path in backup_dir.glob("roxort_*.gz"):
+        match = SNAPSHOT_PATTERN.match(path.name)
+        if not match:
+            continue
+        created_at = datetime.strptime(match.group(1), TIMESTAMP_FORMAT)
+        base = datetime.strptime(match.group(2), TIMESTAMP_FORMAT) if match.group(2) else created_at
+        snapshots.append(Snapshot(path, created_at, base))
+    return sorted(snapshots, key=lambda snapshot: snapshot.created_at)
+
+def _hashes_path(full: Path) -> Path:
+    """Отпечатки страниц полной копии: размер страницы и по PAGE_HASH_SIZE байт на страницу"""
+    return full.with_name(full.name.replace(".db.gz", ".hashes"))
+
+def _page_hash(page: bytes) -> bytes:
+    return hashlib.blake2b(page, digest_size=PAGE_HASH_SIZE).digest()
+
+def _copy_database(target: Path) -> str:
+    """
+    Копирует базу через SQLite online backup API и проверяет копию.
+    Выполняется в рабочем потоке. Источник держит одну транзакцию чтения,
+    поэтому копия соответствует одному снимку WAL, а запись в базу
+    между шагами продолжается и не заставляет копирование начинаться заново.
+    Возвращает результат PRAGMA integrity_check.
+    """
+    source = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    destination = sqlite3.connect(target)
+    try:
+        source.execute("BEGIN")
+        source.execute("SELECT count(*) FROM sqlite_master").fetchall()
+        source.backup(destination, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP)
+        source.rollback()
+        return "; ".join(row[0] for row in destination.execute("PRAGMA integrity_check"))
+    finally:
+        destination.close()
+        source.close()
+
+def _write_full(staging: Path, target: Path, page_size: int):
+    """Потоково сжимает копию целиком и сохраняет отпечатки ее страниц"""
+    partial = target.with_name(target.name + ".partial")
+    with open(staging, "rb") as source, gzip.open(partial, "wb") as output, \
+            open(_hashes_path(target), "wb") as hashes:
+        hashes.write(struct.pack(">I", page_size))
+        while page := source.read(page_size):
+            output.write(page)
+            hashes.write(_page_hash(page))
+    partial.replace(target)
+
+def _write_diff(staging: Path, target: Path, base_hashes: bytes, page_size: int) -> int:
+    """Потоково сжимает только страницы, отличающиеся от базы; возвращает их количество"""
+    page_count = staging.stat().st_size // page_size
+    changed = 0
+    partial = target.with_name(target.name + ".partial")
+    with open(staging, "rb") as source, gzip.open(partial, "wb") as output:
+        output.write(DIFF_MAGIC + PAGES_HEADER.pack(page_size, page_count))
+        for page_no in range(page_count):
+            page = source.read(page_size)
+            offset = page_no * PAGE_HASH_SIZE
+            if base_hashes[offset:offset + PAGE_HASH_SIZE] != _page_hash(page):
+                output.write(PAGE_NUMBER.pack(page_no) + page)
+                changed += 1
+    partial.replace(target)
+    return changed
+
+def make_snapshot(backup_dir: Path = BACKUP_DIR, now: Optional[datetime] = None) -> Optional[Snapshot]:
+    """
+    Создает снимок: разницу с действующей полной копией или, если ее нет
+    или она старше BACKUP_FULL_INTERVAL часов, новую полную копию.
+    Разница всегда считается от полной копии, а не от предыдущего снимка,
+    поэтому любой снимок восстанавливается из двух файлов и удаляется независимо.
+    """
+    now = now or datetime.now()
+    staging = backup_dir / f"roxort_{now:{TIMESTAMP_FORMAT}}.staging.db"
+    try:
+        integrity = _copy_database(staging)
+        if integrity != "ok":
+            print(f"❌ Резервная копия не прошла проверку целостности: {integrity}")
+            return None
+
+        connection = sqlite3.connect(staging)
+        try:
+            page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+        finally:
+            connection.close()
+
+        bases = [snapshot for snapshot in list_snapshots(backup_dir) if snapshot.is_full]
+        base = bases[-1] if bases else None
+        base_hashes = b""
+        if base and now - base.created_at < timedelta(hours=BACKUP_FULL_INTERVAL):
+            hashes_path = _hashes_path(base.path)
+            if hashes_path.exists():
+                data = hashes_path.read_bytes()
+                if struct.unpack(">I", data[:4])[0] == page_size:
+                    base_hashes = data[4:]
+
+        if not base_hashes:
+            target = backup_dir / f"roxort_{now:{TIMESTAMP_FORMAT}}_full.db.gz"
+            _write_full(staging, target, page_size)
+            print(f"✅ Полная резервная копия создана: {target}")
+            return Snapshot(target, now, now)
+
+        target = backup_dir / (
+            f"roxort_{now:{TIMESTAMP_FORMAT}}_diff_{base.created_at:{TIMESTAMP_FORMAT}}.pages.gz"
+        )
+        changed = _write_diff(staging, target, base_hashes, page_size)
+        print(f"✅ Инкрементная резервная копия создана: {target} (изменено страниц: {changed})")
+        return Snapshot(target, now, base.created_at)
+    finally:
+        staging.unlink(missing_ok=True)
+
+def apply_retention(backup_dir: Path = BACKUP_DIR, now: Optional[datetime] = None) -> List[Path]:
+    """
+    Удаляет снимки, не попавшие ни в один уровень хранения:
+    последние BACKUP_KEEP_HOURLY снимков, последний снимок каждого из
+    BACKUP_KEEP_DAILY последних дней и каждой из BACKUP_KEEP_WEEKLY последних недель.
+    Полная копия хранится, пока на нее ссылается хотя бы один оставленный снимок.
+    """
+    now = now or datetime.now()
+    snapshots = list_snapshots(backup_dir)
+    keep = {snapshot.created_at for snapshot in snapshots[-BACKUP_KEEP_HOURLY:]}
+
+    latest_per_day = {}
+    latest_per_week = {}
+    for snapshot in snapshots:
+        latest_per_day[snapshot.created_at.date()] = snapshot
+        latest_per_week[snapshot.created_at.isocalendar()[:2]] = snapshot
+
+    for snapshot in latest_per_day.values():
+        if now - snapshot.created_at < timedelta(days=BACKUP_KEEP_DAILY):
+            keep.add(snapshot.created_at)
+    for snapshot in latest_per_week.values():
+        if now - snapshot.created_at < timedelta(weeks=BACKUP_KEEP_WEEKLY):
+            keep.add(snapshot.created_at)
+
+    needed_bases = {snapshot.base for snapshot in snapshots if snapshot.created_at in keep}
+    removed = []
+    for snapshot in snapshots:
+        if snapshot.created_at in keep or snapshot.created_at in needed_bases:
+            continue
+        snapshot.path.unlink(missing_ok=True)
+        if snapshot.is_full:
+            _hashes_path(snapshot.path).unlink(missing_ok=True)
+        removed.append(snapshot.path)
+        print(f"🗑️ Удален старый бэкап: {snapshot.path}")
+    return removed
+
+def restore_snapshot(at: datetime, output: Path, backup_dir: Path = BACKUP_DIR) -> Snapshot:
+    """
+    Восстанавливает базу на момент at (последний снимок не позже at) в файл output:
+    распаковывает полную копию и накладывает на нее страницы из файла разницы.
+    """
+    snapshots = list_snapshots(backup_dir)
+    candidates = [snapshot for snapshot in snapshots if snapshot.created_at <= at]
+    if not candidates:
+        raise FileNotFoundError(f"Нет резервных копий на момент {at}")
+    snapshot = candidates[-1]
+    base = next((s for s in snapshots if s.is_full and s.created_at == snapshot.base), None)
+    if base is None:
+        raise FileNotFoundError(f"Не найдена полная копия для {snapshot.path.name}")
+
+    partial = output.with_name(output.name + ".partial")
+    with gzip.open(base.path, "rb") as source, open(partial, "wb") as target:
+        shutil.copyfileobj(source, target)
+
+    if not snapshot.is_full:
+        with gzip.open(snapshot.path, "rb") as diff, open(partial, "r+b") as target:
+            if diff.read(len(DIFF_MAGIC)) != DIFF_MAGIC:
+                raise ValueError(f"Поврежденный файл разницы: {snapshot.path}")
+            page_size, page_count = PAGES_HEADER.unpack(diff.read(PAGES_HEADER.size))
+            while record := diff.read(PAGE_NUMBER.size):
+                (page_no,) = PAGE_NUMBER.unpack(record)
+                target.seek(page_no * page_size)
+                target.write(diff.read(page_size))
+            target.truncate(page_count * page_size)
+
+    connection = sqlite3.connect(partial)
+    try:
+        integrity = "; ".join(row[0] for row in connection.execute("PRAGMA integrity_check"))
+    finally:
+        connection.close()
+    if integrity != "ok":
+        partial.unlink(missing_ok=True)
+        raise ValueError(f"Восстановленная база не прошла проверку целостности: {integrity}")
+
+    partial.replace(output)
+    return snapshot
 
 async def backup_database():
     """Создает резервную копию базы данных"""
     try:
         # Создаем директорию для бэкапов, если её нет
-        backup_dir = Path("database/backups")
-        backup_dir.mkdir(exist_ok=True)
-        
-        # Формируем имя файла бэкапа с текущей датой и временем
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_path = backup_dir / f"roxort_backup_{timestamp}.db"
-        
-        # Копируем файл базы данных
-        shutil.copy2(DB_PATH, backup_path)
-        
-        print(f"✅ Резервная копия создана: {backup_path}")
-        
-        # Удаляем старые бэкапы (оставляем только последние 24)
-        backups = sorted(backup_dir.glob("roxort_backup_*.db"))
-        if len(backups) > 24:
-            for old_backup in backups[:-24]:
-                old_backup.unlink()
-                print(f"🗑️ Удален старый бэкап: {old_backup}")
-        
+        BACKUP_DIR.mkdir(exist_ok=True)
+
+        # Копирование, сравнение страниц и сжатие идут в отдельном потоке, не блокируя бота
+        snapshot = await asyncio.to_thread(make_snapshot, BACKUP_DIR)
+
+        # Удаляем снимки, вышедшие из всех уровней хранения
+        if snapshot:
+            await asyncio.to_thread(apply_retention, BACKUP_DIR)
+
     except Exception as e:
         print(f"❌ Ошибка при создании резервной копии: {e}")
 
+def main():
+    parser = argparse.ArgumentParser(description="Резервные копии базы данных")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("backup", help="Создать резервную копию (по умолчанию)")
+    commands.add_parser("list", help="Показать резервные копии")
+    restore = commands.add_parser("restore", help="Восстановить базу на момент времени")
+    restore.add_argument("--at", help="Момент времени, например \"2024-05-01 13:00\" (по умолчанию последний снимок)")
+    restore.add_argument("--output", required=True, help="Файл для восстановленной базы")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for snapshot in list_snapshots():
+            kind = "полная" if snapshot.is_full else f"разница с {snapshot.base:%Y-%m-%d %H:%M:%S}"
+            size = snapshot.path.stat().st_size / 1024
+            print(f"{snapshot.created_at:%Y-%m-%d %H:%M:%S}  {kind:32} {size:10.1f} КБ")
+    elif args.command == "restore":
+        at = datetime.fromisoformat(args.at) if args.at else datetime.max
+        snapshot = restore_snapshot(at, Path(args.output))
+        print(f"✅ База на момент {snapshot.created_at:%Y-%m-%d %H:%M:%S} восстановлена в {args.output}")
+    else:
+        asyncio.run(backup_database())
+
 if __name__ == "__main__":
-    asyncio.run(backup_database()) 
\ No newline at end of file
+    main()
\ No newline at end of file
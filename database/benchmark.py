@@ -0,0 +1,322 @@
+import argparse
+import asyncio
+import logging
+import random
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в PYTHONPATH
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from sqlalchemy import insert, select, event, func
+from database.db import Base, read_session, write_session, create_db_engine
+from database.models import User, PhoneListing, Transaction
+from database.listings import LISTING_ORDERS, get_listings_page, get_active_listings, encode_cursor
+from database.order_book import BookEntry
+from database.ledger import transfer, user_account, to_micro, reconcile, SYSTEM_OPENING
+from database.purchases import purchase_listing, PurchaseError
+from config import AVAILABLE_SERVICES, RENTAL_PERIODS, DB_PROFILE
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+SELLERS = 50
+BUYERS = 1000
+
+async def seed(engine, listings: int, sellers: int = SELLERS, buyers: int = BUYERS,
+               balance_micro: int = 10 ** 12):
+    """Создает схему и заполняет базу тестовыми пользователями и объявлениями"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    now = datetime.utcnow()
+    services = list(AVAILABLE_SERVICES)
+    async with write_session() as session:
+        await session.execute(insert(User), [
+            {"telegram_id": user_id, "username": f"user{user_id}", "balance_micro": balance_micro}
+            for user_id in range(1, sellers + buyers + 1)
+        ])
+        await session.execute(insert(PhoneListing), [
+            {
+                "seller_id": random.randint(1, sellers),
+                "service": random.choice(services),
+                "phone_number": f"+7900{i:07d}",
+                "rental_period": random.choice(RENTAL_PERIODS),
+                "price": round(random.uniform(1, 100), 2),
+                "is_active": True,
+                "created_at": now - timedelta(seconds=i)
+            }
+            for i in range(listings)
+        ])
+        await session.commit()
+
+async def run_concurrently(operations, concurrency: int):
+    """
+    Выполняет корутины с ограничением параллельности.
+    Возвращает задержки успешных операций (в секундах) и число ошибок
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def run(operation):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await operation
+            except Exception as e:
+                errors += 1
+                logger.debug(f"Операция завершилась ошибкой: {e}")
+                return
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(run(operation) for operation in operations))
+    return latencies, errors
+
+async def buy(listing_id: int):
+    try:
+        await purchase_listing(listing_id, random.randint(SELLERS + 1, SELLERS + BUYERS))
+    except PurchaseError:
+        pass
+
+async def browse():
+    """Открывает каталог и листает до трех страниц вперед"""
+    service = random.choice([None, *AVAILABLE_SERVICES])
+    order = random.choice(list(LISTING_ORDERS))
+    after = None
+    for _ in range(random.randint(1, 3)):
+        async with read_session() as session:
+            listings, _, has_next = await get_listings_page(
+                session, service, random.randint(SELLERS + 1, SELLERS + BUYERS), order, after
+            )
+        if not has_next:
+            break
+        after = encode_cursor(BookEntry.from_listing(listings[-1]), order)
+
+def percentile(values, share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
+
+@asynccontextmanager
+async def temporary_database(profile: str, directory: str = None):
+    """Временная база: write_session и read_session привязываются к ней на время блока"""
+    directory = tempfile.mkdtemp(dir=directory)
+    path = Path(directory) / "benchmark.db"
+    engine = create_db_engine(profile, path, echo=False)
+    write_session.configure(bind=engine)
+    # Пул читателей подключается к файлу, созданному писателем при заполнении
+    reader = create_db_engine(profile, path, echo=False, read_only=True)
+    read_session.configure(bind=reader)
+    try:
+        yield engine
+    finally:
+        await engine.dispose()
+        await reader.dispose()
+        shutil.rmtree(directory, ignore_errors=True)
+
+async def bench_profile(profile: str, args) -> dict:
+    """Замеряет пропускную способность покупок и просмотра каталога для профиля"""
+    async with temporary_database(profile, args.dir) as engine:
+        await seed(engine, args.listings)
+        listing_ids = random.sample(range(1, args.listings + 1), args.purchases * 3)
+
+        # Последовательно: стоимость одной операции без конкуренции
+        started = time.perf_counter()
+        for listing_id in listing_ids[args.purchases * 2:]:
+            await buy(listing_id)
+        sequential_purchases = args.purchases / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for _ in range(args.pages // 4):
+            await browse()
+        sequential_pages = (args.pages // 4) / (time.perf_counter() - started)
+
+        # Параллельно: args.concurrency одновременных пользователей
+        started = time.perf_counter()
+        done, purchase_errors = await run_concurrently(
+            [buy(i) for i in listing_ids[:args.purchases]], args.concurrency
+        )
+        purchases = len(done) / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        done, browse_errors = await run_concurrently([browse() for _ in range(args.pages)], args.concurrency)
+        pages = len(done) / (time.perf_counter() - started)
+
+        # Смешанная нагрузка: просмотр каталога во время потока покупок
+        started = time.perf_counter()
+        buying = asyncio.create_task(
+            run_concurrently([buy(i) for i in listing_ids[args.purchases:args.purchases * 2]], args.concurrency)
+        )
+        latencies, mixed_browse_errors = await run_concurrently(
+            [browse() for _ in range(args.pages)], args.concurrency
+        )
+        mixed_pages = len(latencies) / (time.perf_counter() - started)
+        _, mixed_purchase_errors = await buying
+
+        return {
+            "seq purchases/s": sequential_purchases,
+            "seq browse/s": sequential_pages,
+            "purchases/s": purchases,
+            "browse/s": pages,
+            "mixed browse/s": mixed_pages,
+            "mixed browse p95, ms": percentile(latencies, 0.95) * 1000,
+            "errors": purchase_errors + browse_errors + mixed_browse_errors + mixed_purchase_errors,
+        }
+
+async def load_sellers_one_by_one(session):
+    """Прежняя загрузка каталога: объявления, затем продавец каждого отдельным запросом"""
+    result = await session.scalars(
+        select(PhoneListing)
+        .where(PhoneListing.is_active == True)
+        .order_by(PhoneListing.created_at.desc())
+    )
+    return [(listing, await session.get(User, listing.seller_id)) for listing in result.all()]
+
+async def load_sellers_joined(session):
+    """Текущая загрузка каталога: объявления вместе с продавцами одним JOIN"""
+    return [(listing, listing.seller) for listing in await get_active_listings(session)]
+
+async def bench_queries(args):
+    """
+    Считает запросы к базе и время загрузки каталога с продавцами:
+    по запросу на продавца против одного JOIN. Продавцов столько же, сколько
+    объявлений, поэтому загрузка по одному делает запрос почти на каждое.
+    """
+    print(f"{'объявлений':>12}{'по одному':>12}{'мс':>10}{'JOIN':>8}{'мс':>10}")
+    for size in args.sizes:
+        async with temporary_database(DB_PROFILE, args.dir) as engine:
+            await seed(engine, size, sellers=size, buyers=0)
+            queries = 0
+
+            def count(*_):
+                nonlocal queries
+                queries += 1
+
+            event.listen(engine.sync_engine, "before_cursor_execute", count)
+            row = [size]
+            for load in (load_sellers_one_by_one, load_sellers_joined):
+                queries = 0
+                started = time.perf_counter()
+                # Новая сессия на каждый замер: продавцы не берутся из карты идентичности
+                async with write_session() as session:
+                    rows = await load(session)
+                elapsed = (time.perf_counter() - started) * 1000
+                assert len(rows) == size and all(seller is not None for _, seller in rows)
+                row += [queries, elapsed]
+            event.remove(engine.sync_engine, "before_cursor_execute", count)
+        print(f"{row[0]:12}{row[1]:12}{row[2]:10.1f}{row[3]:8}{row[4]:10.1f}")
+
+async def bench_contention(args) -> bool:
+    """
+    Стресс-тест покупок: args.attempts одновременных попыток купить
+    args.hot_listings объявлений покупателями с ограниченным балансом.
+    Проверяет, что объявление не продано дважды, баланс не ушел в минус,
+    сумма балансов не изменилась и журнал сходится с балансами.
+    """
+    sellers, buyers = 10, args.buyers
+    async with temporary_database(DB_PROFILE, args.dir) as engine:
+        await seed(engine, args.hot_listings, sellers=sellers, buyers=buyers, balance_micro=0)
+        # Стартовые балансы покупателей проводятся через журнал, чтобы сверка сходилась
+        async with write_session() as session:
+            for user_id in range(sellers + 1, sellers + buyers + 1):
+                await transfer(session, f"opening:{user_id}", SYSTEM_OPENING, user_account(user_id),
+                               to_micro(args.buyer_balance), "opening")
+            await session.commit()
+
+        reasons = {}
+
+        async def attempt(listing_id: int, buyer_id: int):
+            try:
+                await purchase_listing(listing_id, buyer_id)
+                reason = "sold"
+            except PurchaseError as e:
+                reason = e.reason
+            reasons[reason] = reasons.get(reason, 0) + 1
+
+        attempts = [
+            attempt(random.randint(1, args.hot_listings), random.randint(sellers + 1, sellers + buyers))
+            for _ in range(args.attempts)
+        ]
+        started = time.perf_counter()
+        latencies, errors = await run_concurrently(attempts, args.concurrency)
+        elapsed = time.perf_counter() - started
+
+        async with read_session() as session:
+            sold = await session.scalar(select(func.count()).where(PhoneListing.is_active == False))
+            transactions = await session.scalar(select(func.count(Transaction.id)))
+            sold_twice = await session.scalar(
+                select(func.count()).select_from(
+                    select(Transaction.listing_id)
+                    .group_by(Transaction.listing_id)
+                    .having(func.count() > 1)
+                    .subquery()
+                )
+            )
+            negative = await session.scalar(select(func.count()).where(User.balance_micro < 0))
+            total = await session.scalar(select(func.sum(User.balance_micro)))
+        report = await reconcile()
+
+    print(f"Попыток покупки: {args.attempts} ({args.concurrency} одновременно) за {elapsed:.2f} с, "
+          f"p95 {percentile(latencies, 0.95) * 1000:.1f} мс, исключений {errors}")
+    print("Результаты: " + ", ".join(f"{reason} {count}" for reason, count in sorted(reasons.items())))
+    checks = {
+        "продано объявлений = транзакций": sold == transactions == reasons.get("sold", 0),
+        "нет объявлений, проданных дважды": sold_twice == 0,
+        "нет отрицательных балансов": negative == 0,
+        "сумма балансов не изменилась": total == buyers * to_micro(args.buyer_balance),
+        "журнал сходится с балансами": report.ok,
+    }
+    for name, passed in checks.items():
+        print(f"{'✅' if passed else '❌'} {name}")
+    return errors == 0 and all(checks.values())
+
+async def main():
+    parser = argparse.ArgumentParser(description="Нагрузочные сценарии базы данных")
+    parser.add_argument("--scenario", choices=["profiles", "contention", "queries"], default="profiles",
+                        help="profiles - сравнение профилей движка SQLite, "
+                             "contention - конкурентные покупки одних объявлений, "
+                             "queries - число запросов при загрузке каталога с продавцами")
+    parser.add_argument("--profiles", nargs="+", default=["default", "tuned"])
+    parser.add_argument("--listings", type=int, default=20000)
+    parser.add_argument("--purchases", type=int, default=500)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--dir", default=None, help="Каталог для временных баз (по умолчанию системный)")
+    parser.add_argument("--hot-listings", type=int, default=50, help="contention: объявлений в продаже")
+    parser.add_argument("--buyers", type=int, default=300, help="contention: покупателей")
+    parser.add_argument("--buyer-balance", type=float, default=60, help="contention: баланс покупателя")
+    parser.add_argument("--attempts", type=int, default=600, help="contention: попыток покупки")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000],
+                        help="queries: размеры каталога")
+    args = parser.parse_args()
+
+    if args.scenario == "queries":
+        random.seed(1)
+        await bench_queries(args)
+        return
+
+    if args.scenario == "contention":
+        random.seed(1)
+        if not await bench_contention(args):
+            sys.exit(1)
+        return
+
+    results = {}
+    for profile in args.profiles:
+        random.seed(1)
+        results[profile] = await bench_profile(profile, args)
+
+    metrics = list(next(iter(results.values())))
+    print(f"{'':24}" + "".join(f"{profile:>12}" for profile in results))
+    for metric in metrics:
+        print(f"{metric:24}" + "".join(f"{results[p][metric]:12.1f}" for p in results))
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
@@ -4,28 +4,90 @@ from pathlib import Path
 # Определяем путь к базе данных
 DB_PATH = Path(__file__).parent / "roxort.db"
 
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from contextlib import asynccontextmanager
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 from sqlalchemy.pool import NullPool
 from typing import AsyncGenerator
-from config import DATABASE_URL
+from config import (
+    DATABASE_URL, DB_PROFILE, DB_ECHO, DB_PRAGMAS,
+    DB_READ_POOL_SIZE, DB_READ_MAX_OVERFLOW, DB_POOL_TIMEOUT
+)
 
 class Base(DeclarativeBase):
     pass
 
-# Создаем движок базы данных
-engine = create_async_engine(
-    f"sqlite+aiosqlite:///{DB_PATH}",
-    echo=True
-)
+def create_db_engine(
+    profile: str = DB_PROFILE,
+    path: Path = DB_PATH,
+    echo: bool = DB_ECHO,
+    read_only: bool = False
+) -> AsyncEngine:
+    """
+    Создает движок SQLite с выбранным профилем:
+    "default" - настройки драйвера как есть,
+    "tuned" - PRAGMA из config.DB_PRAGMAS на каждом соединении; писатель
+    получает ровно одно соединение, читатели - пул соединений mode=ro
+    """
+    url = f"sqlite+aiosqlite:///file:{path}?mode=ro&uri=true" if read_only \
+        else f"sqlite+aiosqlite:///{path}"
+
+    if profile == "default":
+        return create_async_engine(url, echo=echo)
+    if profile != "tuned":
+        raise ValueError(f"Неизвестный профиль базы данных: {profile}")
+
+    if read_only:
+        pool_size, max_overflow = DB_READ_POOL_SIZE, DB_READ_MAX_OVERFLOW
+        # Режим журнала хранится в файле БД и задается писателем
+        pragmas = {name: value for name, value in DB_PRAGMAS.items() if name != "journal_mode"}
+        pragmas["query_only"] = "ON"
+    else:
+        # Писатели ждут единственное соединение в очереди пула,
+        # а не в цикле busy_timeout внутри SQLite
+        pool_size, max_overflow = 1, 0
+        pragmas = DB_PRAGMAS
+
+    new_engine = create_async_engine(
+        url,
+        echo=echo,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=DB_POOL_TIMEOUT
+    )
+
+    @event.listens_for(new_engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    return new_engine
 
-# Создаем фабрику сессий
-async_session = sessionmaker(
-    engine,
+# Создаем движки базы данных: один писатель и пул читателей
+write_engine = create_db_engine()
+read_engine = create_db_engine(read_only=True)
+
+# Создаем фабрики сессий.
+# write_session - для обработчиков, которые изменяют данные (одно соединение на всех),
+# read_session - для просмотра каталога, профилей и отчетов (не ждут писателя)
+write_session = sessionmaker(
+    write_engine,
+    class_=AsyncSession,
+    expire_on_commit=False
+)
+read_session = sessionmaker(
+    read_engine,
     class_=AsyncSession,
     expire_on_commit=False
 )
 
+# Прежние имена: движок и сессии по умолчанию пишут через писателя
+engine = write_engine
+async_session = write_session
+
 # Функция для получения сессии как контекстного менеджера
 async def get_session() -> AsyncSession:
     """Получение сессии для работы с базой данных"""
@@ -35,6 +97,22 @@ async def get_session() -> AsyncSession:
     finally:
         await session.close()
 
+@asynccontextmanager
+async def immediate_session():
+    """
+    Сессия в транзакции BEGIN IMMEDIATE: блокировка на запись берется сразу,
+    поэтому проверки и изменения внутри нее не пересекаются с другими писателями.
+    Фиксируется при успешном выходе, откатывается при исключении.
+    """
+    async with write_session() as session:
+        await session.execute(text("BEGIN IMMEDIATE"))
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+
 async def init_db() -> bool:
     """Инициализация подключения к базе данных"""
     try:
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, Mapping, Optional, Set
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert
+from database.db import read_session, write_session
+from database.models import FsmState
+from config import FSM_FLUSH_INTERVAL, FSM_CACHE_TTL, FSM_STATE_TTL, FSM_CLEANUP_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class _Entry:
+    """Локальная копия состояния диалога"""
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    loaded_at: float = field(default_factory=time.monotonic)
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище состояний aiogram в таблице fsm_states.
+    Чтения обслуживаются из локальной копии (не старше FSM_CACHE_TTL секунд),
+    записи только помечают ключ измененным: фоновая задача раз в
+    FSM_FLUSH_INTERVAL секунд сохраняет все измененные ключи одной транзакцией,
+    поэтому несколько set_state/update_data одного шага диалога дают одну запись.
+    Состояния без изменений дольше FSM_STATE_TTL секунд удаляются.
+    Несколько процессов бота могут делить одну базу, если обновления одного
+    пользователя обрабатывает один процесс за раз.
+    """
+
+    def __init__(self, key_builder: Optional[KeyBuilder] = None):
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self._entries: Dict[str, _Entry] = {}
+        self._dirty: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._last_cleanup = time.monotonic()
+
+    async def _load(self, key: str) -> _Entry:
+        """Читает состояние из базы, устаревшие записи считаются пустыми"""
+        cutoff = datetime.utcnow() - timedelta(seconds=FSM_STATE_TTL)
+        async with read_session() as session:
+            row = (await session.execute(
+                select(FsmState.state, FsmState.data)
+                .where(FsmState.key == key, FsmState.updated_at >= cutoff)
+            )).first()
+        if row is None:
+            return _Entry()
+        return _Entry(state=row.state, data=json.loads(row.data))
+
+    async def _get(self, key: str) -> _Entry:
+        entry = self._entries.get(key)
+        if entry is not None and (key in self._dirty or time.monotonic() - entry.loaded_at < FSM_CACHE_TTL):
+            return entry
+        entry = await self._load(key)
+        # Пока шло чтение, ключ мог быть изменен в этом процессе
+        if key in self._dirty:
+            return self._entries[key]
+        self._entries[key] = entry
+        return entry
+
+    def _mark_dirty(self, key: str, entry: _Entry):
+        entry.loaded_at = time.monotonic()
+        self._entries[key] = entry
+        self._dirty.add(key)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        name = self.key_builder.build(key)
+        entry = await self._get(name)
+        entry.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(name, entry)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get(self.key_builder.build(key))).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise ValueError(f"Данные должны быть словарем, получено {type(data).__name__}")
+        name = self.key_builder.build(key)
+        entry = await self._get(name)
+        entry.data = dict(data)
+        self._mark_dirty(name, entry)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._get(self.key_builder.build(key))).data)
+
+    async def flush(self):
+        """Сохраняет все измененные ключи одной транзакцией"""
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+
+        now = datetime.utcnow()
+        rows, cleared = [], []
+        for key in keys:
+            entry = self._entries[key]
+            if entry.state is None and not entry.data:
+                cleared.append(key)
+            else:
+                rows.append({"key": key, "state": entry.state, "data": json.dumps(entry.data), "updated_at": now})
+
+        try:
+            async with write_session() as session:
+                if rows:
+                    query = insert(FsmState)
+                    await session.execute(
+                        query.on_conflict_do_update(
+                            index_elements=["key"],
+                            set_={
+                                "state": query.excluded.state,
+                                "data": query.excluded.data,
+                                "updated_at": query.excluded.updated_at
+                            }
+                        ),
+                        rows
+                    )
+                if cleared:
+                    await session.execute(delete(FsmState).where(FsmState.key.in_(cleared)))
+                await session.commit()
+        except asyncio.CancelledError:
+            self._dirty |= keys
+            raise
+        except Exception as e:
+            # Ключи вернутся в следующую запись вместе с изменениями, сделанными за это время
+            self._dirty |= keys
+            logger.error(f"Ошибка при сохранении состояний FSM ({len(keys)} ключей): {e}")
+
+    async def cleanup(self) -> int:
+        """Удаляет состояния, не менявшиеся дольше FSM_STATE_TTL, и старые локальные копии"""
+        cutoff = datetime.utcnow() - timedelta(seconds=FSM_STATE_TTL)
+        async with write_session() as session:
+            result = await session.execute(delete(FsmState).where(FsmState.updated_at < cutoff))
+            await session.commit()
+
+        expired = time.monotonic() - FSM_CACHE_TTL
+        for key in [key for key, entry in self._entries.items()
+                    if key not in self._dirty and entry.loaded_at < expired]:
+            del self._entries[key]
+
+        if result.rowcount:
+            logger.info(f"Удалено устаревших состояний FSM: {result.rowcount}")
+        return result.rowcount
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FSM_FLUSH_INTERVAL)
+            await self.flush()
+            if time.monotonic() - self._last_cleanup >= FSM_CLEANUP_INTERVAL:
+                self._last_cleanup = time.monotonic()
+                try:
+                    await self.cleanup()
+                except Exception as e:
+                    logger.error(f"Ошибка при удалении устаревших состояний FSM: {e}")
+
+    async def close(self) -> None:
+        """Останавливает фоновую запись и сохраняет оставшиеся изменения"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+# Общее хранилище состояний диалогов
+fsm_storage = SQLiteStorage()
\ No newline at end of file
@@ -0,0 +1,57 @@
+import logging
+from typing import Set
+from sqlalchemy import select, or_
+from database.db import read_session
+from database.models import User
+from config import ADMIN_IDS
+
+logger = logging.getLogger(__name__)
+
+class Gatekeeper:
+    """
+    Множества заблокированных пользователей и администраторов в памяти
+    процесса. Строится при запуске по таблице users, затем обновляется
+    обработчиками блокировки и периодической перезагрузкой, поэтому
+    проверки в GatekeeperMiddleware не обращаются к базе.
+    Администраторы - ADMIN_IDS и пользователи с is_admin.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.blocked: Set[int] = set()
+        self.admins: Set[int] = set(ADMIN_IDS)
+
+    async def load(self):
+        """Перестраивает множества по таблице users"""
+        async with read_session() as session:
+            result = await session.execute(
+                select(User.telegram_id, User.is_blocked, User.is_admin)
+                .where(or_(User.is_blocked == True, User.is_admin == True))
+            )
+            rows = result.all()
+
+        self.blocked = {row.telegram_id for row in rows if row.is_blocked}
+        self.admins = set(ADMIN_IDS) | {row.telegram_id for row in rows if row.is_admin}
+        if not self.loaded:
+            logger.info(
+                f"Списки доступа загружены: заблокировано {len(self.blocked)}, "
+                f"администраторов {len(self.admins)}"
+            )
+        self.loaded = True
+
+    def is_admin(self, user_id: int) -> bool:
+        return user_id in self.admins
+
+    def is_blocked(self, user_id: int) -> bool:
+        """Администратора заблокировать нельзя"""
+        return user_id in self.blocked and user_id not in self.admins
+
+    def set_blocked(self, user_id: int, blocked: bool):
+        """Вызывается после фиксации изменения is_blocked"""
+        if blocked:
+            self.blocked.add(user_id)
+        else:
+            self.blocked.discard(user_id)
+
+# Общие списки доступа
+gatekeeper = Gatekeeper()
\ No newline at end of file
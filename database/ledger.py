@@ -0,0 +1,214 @@
+import logging
+from dataclasses import dataclass, field
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select, update, func, literal, cast, String, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.db import read_session
+from database.models import User, LedgerEntry
+from database.user_cache import mark_user_changed
+
+logger = logging.getLogger(__name__)
+
+# Количество микро-единиц в одном USDT
+MICRO = 1_000_000
+
+# Системные счета (внешний мир и источники средств платформы)
+SYSTEM_DEPOSITS = "system:deposits"
+SYSTEM_WITHDRAWALS = "system:withdrawals"
+SYSTEM_PAYOUTS = "system:payouts"  # удержание на время выплаты
+SYSTEM_PROMO = "system:promo"
+SYSTEM_ADMIN = "system:admin"
+SYSTEM_DISPUTES = "system:disputes"
+SYSTEM_OPENING = "system:opening"
+
+# Размер пачки строк при потоковой сверке
+RECONCILE_BATCH_SIZE = 5000
+
+USER_PREFIX = "user:"
+
+class InsufficientFunds(Exception):
+    """На счете пользователя недостаточно средств для списания"""
+
+    def __init__(self, user_id: int, amount: int):
+        super().__init__(f"Недостаточно средств у {user_id} для списания {amount}")
+        self.user_id = user_id
+        self.amount = amount
+
+def to_micro(amount) -> int:
+    """Переводит сумму в USDT (float/str/Decimal) в целые микро-USDT"""
+    return int((Decimal(str(amount)) * MICRO).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def from_micro(amount: int) -> float:
+    """Переводит микро-USDT в USDT для отображения"""
+    return amount / MICRO
+
+def user_account(user_id: int) -> str:
+    """Имя счета пользователя в журнале"""
+    return f"{USER_PREFIX}{user_id}"
+
+def _account_user_id(account: str) -> Optional[int]:
+    if account.startswith(USER_PREFIX):
+        return int(account[len(USER_PREFIX):])
+    return None
+
+async def transfer(
+    session: AsyncSession,
+    txn_id: str,
+    debit: str,
+    credit: str,
+    amount: int,
+    kind: str,
+    allow_overdraft: bool = False
+) -> bool:
+    """
+    Проводит перевод amount микро-USDT со счета debit на счет credit
+    и обновляет кэш balance_micro пользователей в той же транзакции.
+    Повторный вызов с тем же txn_id ничего не меняет и возвращает False.
+    Списание с пользователя без allow_overdraft защищено условием
+    balance_micro >= amount; при нехватке средств бросает InsufficientFunds,
+    и вызывающий код должен откатить сессию.
+    Фиксация (commit) остается за вызывающим кодом.
+    """
+    if amount <= 0:
+        raise ValueError(f"Сумма перевода должна быть положительной: {amount}")
+
+    # Первая проводка одновременно служит проверкой идемпотентности
+    result = await session.execute(
+        insert(LedgerEntry)
+        .values(txn_id=txn_id, account=debit, amount=-amount, kind=kind)
+        .on_conflict_do_nothing(index_elements=["txn_id", "account"])
+    )
+    if result.rowcount == 0:
+        logger.info(f"Операция {txn_id} уже проведена")
+        return False
+
+    await session.execute(
+        insert(LedgerEntry).values(txn_id=txn_id, account=credit, amount=amount, kind=kind)
+    )
+
+    debit_user = _account_user_id(debit)
+    if debit_user is not None:
+        query = update(User).where(User.telegram_id == debit_user)
+        if not allow_overdraft:
+            query = query.where(User.balance_micro >= amount)
+        result = await session.execute(
+            query.values(balance_micro=User.balance_micro - amount)
+        )
+        if result.rowcount != 1:
+            raise InsufficientFunds(debit_user, amount)
+        mark_user_changed(session, debit_user)
+
+    credit_user = _account_user_id(credit)
+    if credit_user is not None:
+        await session.execute(
+            update(User)
+            .where(User.telegram_id == credit_user)
+            .values(balance_micro=User.balance_micro + amount)
+        )
+        mark_user_changed(session, credit_user)
+
+    return True
+
+async def rebuild_balances(session: AsyncSession) -> int:
+    """
+    Пересчитывает кэш balance_micro всех пользователей по журналу
+    одним UPDATE. Возвращает количество обновленных пользователей.
+    """
+    ledger_sum = (
+        select(func.coalesce(func.sum(LedgerEntry.amount), 0))
+        .where(LedgerEntry.account == literal(USER_PREFIX) + cast(User.telegram_id, String))
+        .scalar_subquery()
+    )
+    result = await session.execute(update(User).values(balance_micro=ledger_sum))
+    mark_user_changed(session)
+    return result.rowcount
+
+@dataclass
+class ReconcileReport:
+    """Результат сверки журнала"""
+    entries: int = 0
+    transactions: int = 0
+    # Итог по всему журналу (должен быть 0)
+    total: int = 0
+    # Операции, проводки которых в сумме не равны нулю: txn_id -> сумма
+    unbalanced: Dict[str, int] = field(default_factory=dict)
+    # Расхождения кэша: telegram_id -> (balance_micro, сумма по журналу)
+    mismatched: Dict[int, Tuple[int, int]] = field(default_factory=dict)
+    # Пользователи с отрицательной суммой по журналу
+    negative: List[int] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.total == 0 and not (self.unbalanced or self.mismatched or self.negative)
+
+async def reconcile() -> ReconcileReport:
+    """
+    Сверяет весь журнал за один потоковый проход:
+    проводки читаются пачками в порядке txn_id (по уникальному индексу),
+    поэтому баланс каждой операции проверяется без накопления в памяти,
+    а в памяти держатся только суммы по счетам пользователей.
+    Затем суммы сравниваются с кэшем users.balance_micro.
+    """
+    report = ReconcileReport()
+    account_sums: Dict[int, int] = {}
+
+    async with read_session() as session:
+        # Оба прохода читают один снимок WAL, поэтому параллельные записи не дают ложных расхождений
+        await session.execute(text("BEGIN"))
+        stream = await session.stream(
+            select(LedgerEntry.txn_id, LedgerEntry.account, LedgerEntry.amount)
+            .order_by(LedgerEntry.txn_id)
+            .execution_options(yield_per=RECONCILE_BATCH_SIZE)
+        )
+
+        # Строки разбираются пачками: построчная асинхронная итерация в разы медленнее
+        current_txn, txn_sum = None, 0
+        async for rows in stream.partitions():
+            for txn_id, account, amount in rows:
+                if txn_id != current_txn:
+                    if current_txn is not None and txn_sum != 0:
+                        report.unbalanced[current_txn] = txn_sum
+                    current_txn, txn_sum = txn_id, 0
+                    report.transactions += 1
+                txn_sum += amount
+                report.total += amount
+
+                user_id = _account_user_id(account)
+                if user_id is not None:
+                    account_sums[user_id] = account_sums.get(user_id, 0) + amount
+            report.entries += len(rows)
+
+        if current_txn is not None and txn_sum != 0:
+            report.unbalanced[current_txn] = txn_sum
+
+        users = await session.stream(
+            select(User.telegram_id, User.balance_micro)
+            .execution_options(yield_per=RECONCILE_BATCH_SIZE)
+        )
+        async for rows in users.partitions():
+            for user_id, cached in rows:
+                expected = account_sums.pop(user_id, 0)
+                if cached != expected:
+                    report.mismatched[user_id] = (cached, expected)
+                if expected < 0:
+                    report.negative.append(user_id)
+
+    # Проводки по счетам несуществующих пользователей
+    for user_id, expected in account_sums.items():
+        report.mismatched[user_id] = (0, expected)
+
+    if report.ok:
+        logger.info(
+            f"Сверка журнала: {report.entries} проводок, "
+            f"{report.transactions} операций, расхождений нет"
+        )
+    else:
+        logger.error(
+            f"Сверка журнала: итог {report.total}, "
+            f"несбалансированных операций {len(report.unbalanced)}, "
+            f"расхождений кэша {len(report.mismatched)}, "
+            f"отрицательных балансов {len(report.negative)}"
+        )
+    return report
\ No newline at end of file
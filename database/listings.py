@@ -0,0 +1,117 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import contains_eager
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.models import PhoneListing, User
+from config import LISTINGS_PAGE_SIZE
+
+# Доступные варианты сортировки каталога: колонка ключа и направление
+LISTING_ORDERS = {
+    "new": (PhoneListing.created_at, True),
+    "price_asc": (PhoneListing.price, False),
+    "price_desc": (PhoneListing.price, True),
+    "best": (User.reputation, True),
+}
+
+# Формат даты в курсоре (помещается в callback_data)
+CURSOR_DATE_FORMAT = "%Y%m%d%H%M%S%f"
+
+def active_listings_query(
+    service: Optional[str] = None,
+    exclude_seller_id: Optional[int] = None
+):
+    """Строит запрос активных объявлений вместе с продавцами (один JOIN)"""
+    query = (
+        select(PhoneListing)
+        .join(PhoneListing.seller)
+        .options(contains_eager(PhoneListing.seller))
+        .where(PhoneListing.is_active == True)
+    )
+
+    if service is not None:
+        query = query.where(PhoneListing.service == service)
+    if exclude_seller_id is not None:
+        query = query.where(PhoneListing.seller_id != exclude_seller_id)
+
+    return query
+
+async def get_active_listings(
+    session: AsyncSession,
+    service: Optional[str] = None,
+    exclude_seller_id: Optional[int] = None,
+    order: str = "new"
+) -> List[PhoneListing]:
+    """Возвращает активные объявления с загруженным продавцом (listing.seller)"""
+    column, descending = LISTING_ORDERS[order]
+    query = active_listings_query(service, exclude_seller_id)
+    if descending:
+        query = query.order_by(column.desc(), PhoneListing.id.desc())
+    else:
+        query = query.order_by(column.asc(), PhoneListing.id.asc())
+
+    result = await session.scalars(query)
+    return list(result.unique().all())
+
+def encode_cursor(listing, order: str) -> str:
+    """
+    Кодирует позицию объявления в каталоге в строку для callback_data.
+    Принимает запись книги объявлений (database.order_book.BookEntry).
+    """
+    if order == "new":
+        key = listing.created_at.strftime(CURSOR_DATE_FORMAT)
+    elif order == "best":
+        key = repr(listing.seller_reputation)
+    else:
+        key = repr(listing.price)
+    return f"{key}:{listing.id}"
+
+def decode_cursor(cursor: str, order: str) -> Tuple:
+    """Обратное преобразование для encode_cursor"""
+    key, listing_id = cursor.split(":")
+    if order == "new":
+        return datetime.strptime(key, CURSOR_DATE_FORMAT), int(listing_id)
+    return float(key), int(listing_id)
+
+async def get_listings_page(
+    session: AsyncSession,
+    service: Optional[str] = None,
+    exclude_seller_id: Optional[int] = None,
+    order: str = "new",
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = LISTINGS_PAGE_SIZE
+) -> Tuple[List[PhoneListing], bool, bool]:
+    """
+    Возвращает страницу каталога по курсору (keyset-пагинация по ключу сортировки и id).
+    Стоимость запроса не зависит от номера страницы.
+    Результат: (объявления, есть_предыдущая, есть_следующая)
+    """
+    column, descending = LISTING_ORDERS[order]
+    key = tuple_(column, PhoneListing.id)
+    query = active_listings_query(service, exclude_seller_id)
+
+    # При движении назад идем в обратном порядке и затем разворачиваем страницу
+    backwards = before is not None
+
+    if after is not None:
+        cursor = tuple_(*decode_cursor(after, order))
+        query = query.where(key < cursor if descending else key > cursor)
+    elif backwards:
+        cursor = tuple_(*decode_cursor(before, order))
+        query = query.where(key > cursor if descending else key < cursor)
+
+    if descending != backwards:
+        query = query.order_by(column.desc(), PhoneListing.id.desc())
+    else:
+        query = query.order_by(column.asc(), PhoneListing.id.asc())
+
+    result = await session.scalars(query.limit(limit + 1))
+    listings = list(result.unique().all())
+    has_more = len(listings) > limit
+    listings = listings[:limit]
+
+    if backwards:
+        listings.reverse()
+        return listings, has_more, True
+    return listings, after is not None, has_more
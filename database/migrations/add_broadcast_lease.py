@@ -0,0 +1,47 @@
+from sqlalchemy import text
+import logging
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Поля аренды рассылки и их определения
+LEASE_COLUMNS = {
+    'owner': "VARCHAR",
+    'lease_until': "DATETIME",
+}
+
+async def upgrade(conn):
+    """Добавляет в таблицу broadcasts владельца рассылки и срок его аренды"""
+    try:
+        result = await conn.execute(text("PRAGMA table_info(broadcasts)"))
+        columns = [row[1] for row in result]
+        if not columns:
+            logger.info("Таблицы broadcasts еще нет, миграция не требуется")
+            return
+        
+        for name, definition in LEASE_COLUMNS.items():
+            if name in columns:
+                logger.info(f"Поле {name} уже существует в таблице broadcasts")
+                continue
+            await conn.execute(text(f"ALTER TABLE broadcasts ADD COLUMN {name} {definition}"))
+            logger.info(f"Поле {name} добавлено в таблицу broadcasts")
+            
+    except Exception as e:
+        logger.error(f"Ошибка при добавлении аренды рассылок: {e}")
+        raise
+
+async def downgrade(conn):
+    """Удаляет поля аренды из таблицы broadcasts"""
+    try:
+        result = await conn.execute(text("PRAGMA table_info(broadcasts)"))
+        columns = [row[1] for row in result]
+        
+        for name in LEASE_COLUMNS:
+            if name in columns:
+                await conn.execute(text(f"ALTER TABLE broadcasts DROP COLUMN {name}"))
+                logger.info(f"Поле {name} удалено из таблицы broadcasts")
+            
+    except Exception as e:
+        logger.error(f"Ошибка при удалении аренды рассылок: {e}")
+        raise
\ No newline at end of file
@@ -0,0 +1,84 @@
+from sqlalchemy import text
+import logging
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def upgrade(conn):
+    """Создает журнал проводок и переносит в него балансы пользователей"""
+    try:
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS ledger_entries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                txn_id VARCHAR NOT NULL,
+                account VARCHAR NOT NULL,
+                amount BIGINT NOT NULL,
+                kind VARCHAR NOT NULL,
+                created_at DATETIME,
+                CONSTRAINT uq_ledger_txn_account UNIQUE (txn_id, account)
+            )
+        """))
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_ledger_account ON ledger_entries(account)"
+        ))
+
+        result = await conn.execute(text("PRAGMA table_info(users)"))
+        columns = [row[1] for row in result]
+
+        if 'balance_micro' not in columns:
+            await conn.execute(text(
+                "ALTER TABLE users ADD COLUMN balance_micro BIGINT NOT NULL DEFAULT 0"
+            ))
+            logger.info("Поле balance_micro успешно добавлено в таблицу users")
+
+        if 'balance' not in columns:
+            logger.info("Балансы уже перенесены в журнал проводок")
+            return
+
+        # Входящие остатки: проводка пользователю и встречная проводка system:opening
+        await conn.execute(text("""
+            INSERT OR IGNORE INTO ledger_entries (txn_id, account, amount, kind, created_at)
+            SELECT 'opening:' || telegram_id, 'user:' || telegram_id,
+                   CAST(ROUND(balance * 1000000) AS INTEGER), 'opening', CURRENT_TIMESTAMP
+            FROM users
+            WHERE CAST(ROUND(COALESCE(balance, 0) * 1000000) AS INTEGER) != 0
+        """))
+        await conn.execute(text("""
+            INSERT OR IGNORE INTO ledger_entries (txn_id, account, amount, kind, created_at)
+            SELECT 'opening:' || telegram_id, 'system:opening',
+                   -CAST(ROUND(balance * 1000000) AS INTEGER), 'opening', CURRENT_TIMESTAMP
+            FROM users
+            WHERE CAST(ROUND(COALESCE(balance, 0) * 1000000) AS INTEGER) != 0
+        """))
+        await conn.execute(text("""
+            UPDATE users SET balance_micro = COALESCE((
+                SELECT SUM(amount) FROM ledger_entries
+                WHERE account = 'user:' || users.telegram_id
+            ), 0)
+        """))
+        await conn.execute(text("ALTER TABLE users DROP COLUMN balance"))
+        logger.info("Балансы пользователей перенесены в журнал проводок")
+
+    except Exception as e:
+        logger.error(f"Ошибка при создании журнала проводок: {e}")
+        raise
+
+async def downgrade(conn):
+    """Возвращает поле balance и удаляет журнал проводок"""
+    try:
+        result = await conn.execute(text("PRAGMA table_info(users)"))
+        columns = [row[1] for row in result]
+
+        if 'balance' not in columns:
+            await conn.execute(text("ALTER TABLE users ADD COLUMN balance FLOAT DEFAULT 0.0"))
+        if 'balance_micro' in columns:
+            await conn.execute(text("UPDATE users SET balance = balance_micro / 1000000.0"))
+            await conn.execute(text("ALTER TABLE users DROP COLUMN balance_micro"))
+
+        await conn.execute(text("DROP TABLE IF EXISTS ledger_entries"))
+        logger.info("Журнал проводок удален, балансы возвращены в users.balance")
+
+    except Exception as e:
+        logger.error(f"Ошибка при удалении журнала проводок: {e}")
+        raise
\ No newline at end of file
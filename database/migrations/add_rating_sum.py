@@ -0,0 +1,56 @@
+from sqlalchemy import text
+import logging
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def upgrade(conn):
+    """Добавляет поле rating_sum и заполняет рейтинги по отзывам"""
+    try:
+        result = await conn.execute(text("PRAGMA table_info(users)"))
+        columns = [row[1] for row in result]
+        
+        if 'rating_sum' in columns:
+            logger.info("Поле rating_sum уже существует в таблице users")
+            return
+        
+        await conn.execute(text(
+            "ALTER TABLE users ADD COLUMN rating_sum INTEGER NOT NULL DEFAULT 0"
+        ))
+        
+        # Один проход GROUP BY по отзывам, как в database.ratings.rebuild_ratings
+        await conn.execute(text("UPDATE users SET rating_sum = 0, total_reviews = 0, rating = 5.0"))
+        await conn.execute(text("""
+            UPDATE users
+            SET rating_sum = totals.rating_sum,
+                total_reviews = totals.total_reviews,
+                rating = CAST(totals.rating_sum AS FLOAT) / totals.total_reviews
+            FROM (
+                SELECT reviewed_id, SUM(rating) AS rating_sum, COUNT(*) AS total_reviews
+                FROM reviews
+                GROUP BY reviewed_id
+            ) AS totals
+            WHERE users.telegram_id = totals.reviewed_id
+        """))
+        logger.info("Поле rating_sum добавлено, рейтинги пересчитаны по отзывам")
+            
+    except Exception as e:
+        logger.error(f"Ошибка при добавлении поля rating_sum: {e}")
+        raise
+
+async def downgrade(conn):
+    """Удаляет поле rating_sum из таблицы users"""
+    try:
+        result = await conn.execute(text("PRAGMA table_info(users)"))
+        columns = [row[1] for row in result]
+        
+        if 'rating_sum' in columns:
+            await conn.execute(text("ALTER TABLE users DROP COLUMN rating_sum"))
+            logger.info("Поле rating_sum удалено из таблицы users")
+        else:
+            logger.info("Поле rating_sum не существует в таблице users")
+            
+    except Exception as e:
+        logger.error(f"Ошибка при удалении поля rating_sum: {e}")
+        raise
\ No newline at end of file
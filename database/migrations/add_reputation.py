@@ -0,0 +1,54 @@
+from sqlalchemy import text
+import logging
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Поля репутации и их определения
+REPUTATION_COLUMNS = {
+    'reputation': "FLOAT NOT NULL DEFAULT 4.0",
+    'reputation_sum': "FLOAT NOT NULL DEFAULT 0",
+    'reputation_weight': "FLOAT NOT NULL DEFAULT 0",
+    'reputation_at': "DATETIME",
+}
+
+async def upgrade(conn):
+    """Добавляет поля репутации и индекс для сортировки продавцов"""
+    try:
+        result = await conn.execute(text("PRAGMA table_info(users)"))
+        columns = [row[1] for row in result]
+        
+        for name, definition in REPUTATION_COLUMNS.items():
+            if name in columns:
+                logger.info(f"Поле {name} уже существует в таблице users")
+                continue
+            await conn.execute(text(f"ALTER TABLE users ADD COLUMN {name} {definition}"))
+            logger.info(f"Поле {name} добавлено в таблицу users")
+        
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_user_reputation ON users (reputation)"
+        ))
+        # Значения заполнит пересчет репутации при запуске бота
+        # (database.reputation.rebuild_reputation)
+            
+    except Exception as e:
+        logger.error(f"Ошибка при добавлении полей репутации: {e}")
+        raise
+
+async def downgrade(conn):
+    """Удаляет поля репутации из таблицы users"""
+    try:
+        await conn.execute(text("DROP INDEX IF EXISTS idx_user_reputation"))
+        
+        result = await conn.execute(text("PRAGMA table_info(users)"))
+        columns = [row[1] for row in result]
+        
+        for name in REPUTATION_COLUMNS:
+            if name in columns:
+                await conn.execute(text(f"ALTER TABLE users DROP COLUMN {name}"))
+                logger.info(f"Поле {name} удалено из таблицы users")
+            
+    except Exception as e:
+        logger.error(f"Ошибка при удалении полей репутации: {e}")
+        raise
\ No newline at end of file
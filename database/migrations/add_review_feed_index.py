@@ -0,0 +1,34 @@
+from sqlalchemy import text
+import logging
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def upgrade(conn):
+    """Заменяет индекс reviews(reviewed_id) составным индексом для ленты отзывов"""
+    try:
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_review_reviewed_created "
+            "ON reviews (reviewed_id, created_at)"
+        ))
+        # Старый индекс - префикс нового и больше не нужен
+        await conn.execute(text("DROP INDEX IF EXISTS idx_review_reviewed"))
+        logger.info("Индекс idx_review_reviewed_created создан")
+            
+    except Exception as e:
+        logger.error(f"Ошибка при создании индекса ленты отзывов: {e}")
+        raise
+
+async def downgrade(conn):
+    """Возвращает индекс reviews(reviewed_id)"""
+    try:
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_review_reviewed ON reviews (reviewed_id)"
+        ))
+        await conn.execute(text("DROP INDEX IF EXISTS idx_review_reviewed_created"))
+        logger.info("Индекс idx_review_reviewed восстановлен")
+            
+    except Exception as e:
+        logger.error(f"Ошибка при удалении индекса ленты отзывов: {e}")
+        raise
\ No newline at end of file
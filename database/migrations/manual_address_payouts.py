@@ -0,0 +1,42 @@
+from sqlalchemy import text
+import logging
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def upgrade(conn):
+    """Переводит неотправленные выплаты на адрес в ручную обработку (статус manual)"""
+    try:
+        exists = (await conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'payouts'"
+        ))).first()
+        if not exists:
+            logger.info("Таблицы payouts еще нет, миграция не требуется")
+            return
+        
+        result = await conn.execute(text(
+            "UPDATE payouts SET status = 'manual' "
+            "WHERE address IS NOT NULL AND status IN ('pending', 'approved')"
+        ))
+        logger.info(f"Выплат на адрес переведено в ручную обработку: {result.rowcount}")
+            
+    except Exception as e:
+        logger.error(f"Ошибка при переводе выплат на адрес в ручную обработку: {e}")
+        raise
+
+async def downgrade(conn):
+    """Возвращает выплаты на адрес в ожидание одобрения"""
+    try:
+        exists = (await conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'payouts'"
+        ))).first()
+        if not exists:
+            return
+        
+        await conn.execute(text("UPDATE payouts SET status = 'pending' WHERE status = 'manual'"))
+        logger.info("Выплаты на адрес возвращены в ожидание одобрения")
+            
+    except Exception as e:
+        logger.error(f"Ошибка при возврате выплат на адрес: {e}")
+        raise
\ No newline at end of file
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text, Index, BigInteger
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text, Index, BigInteger, UniqueConstraint
 from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.ext.hybrid import hybrid_property
 from datetime import datetime
 from .db import Base
 
@@ -9,9 +10,17 @@ class User(Base):
     telegram_id = Column(Integer, primary_key=True)
     username = Column(String, nullable=True)
     phone_number = Column(String, nullable=True)
-    balance = Column(Float, default=0.0)
+    # Кэш суммы проводок пользователя в ledger_entries (микро-USDT)
+    balance_micro = Column(BigInteger, nullable=False, default=0)
+    # rating = rating_sum / total_reviews, обновляются вместе (database.ratings)
     rating = Column(Float, default=5.0)
+    rating_sum = Column(Integer, nullable=False, default=0)
     total_reviews = Column(Integer, default=0)
+    # Байесовская оценка с затуханием старых отзывов (database.reputation) и ее накопленные суммы
+    reputation = Column(Float, nullable=False, default=4.0)
+    reputation_sum = Column(Float, nullable=False, default=0.0)
+    reputation_weight = Column(Float, nullable=False, default=0.0)
+    reputation_at = Column(DateTime, nullable=True)  # момент, на который посчитаны суммы
     is_blocked = Column(Boolean, default=False)
     is_admin = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -24,6 +33,20 @@ class User(Base):
     disputes_as_buyer = relationship("Dispute", foreign_keys="Dispute.buyer_id", back_populates="buyer")
     disputes_as_seller = relationship("Dispute", foreign_keys="Dispute.seller_id", back_populates="seller")
     won_disputes = relationship("Dispute", foreign_keys="Dispute.winner_id", back_populates="winner")
+    
+    @hybrid_property
+    def balance(self) -> float:
+        """Баланс для отображения; изменяется только через database.ledger"""
+        return self.balance_micro / 1_000_000
+    
+    @balance.expression
+    def balance(cls):
+        return cls.balance_micro / 1_000_000
+    
+    # Индексы
+    __table_args__ = (
+        Index('idx_user_reputation', 'reputation'),
+    )
 
 class PhoneListing(Base):
     __tablename__ = 'phone_listings'
@@ -63,6 +86,7 @@ class Transaction(Base):
     # Связи
     listing = relationship("PhoneListing", back_populates="transactions")
     disputes = relationship("Dispute", back_populates="transaction")
+    reviews = relationship("Review", back_populates="transaction")
     
     # Индексы
     __table_args__ = (
@@ -105,12 +129,14 @@ class Review(Base):
     # Связи
     reviewer = relationship("User", foreign_keys=[reviewer_id], back_populates="reviews_given")
     reviewed = relationship("User", foreign_keys=[reviewed_id], back_populates="reviews_received")
+    transaction = relationship("Transaction", back_populates="reviews")
     
     # Индексы
     __table_args__ = (
         Index('idx_review_transaction', 'transaction_id'),
         Index('idx_review_reviewer', 'reviewer_id'),
-        Index('idx_review_reviewed', 'reviewed_id'),
+        # Лента отзывов о пользователе: выборка по курсору (created_at, id)
+        Index('idx_review_reviewed_created', 'reviewed_id', 'created_at'),
     )
 
 class PromoCode(Base):
@@ -125,4 +151,107 @@ class PromoCode(Base):
     used_by = Column(BigInteger, nullable=True)  # telegram_id пользователя, использовавшего промокод
     created_at = Column(DateTime, default=datetime.utcnow)
     expires_at = Column(DateTime, nullable=True)
-    created_by = Column(BigInteger, nullable=False)  # telegram_id админа, создавшего промокод 
\ No newline at end of file
+    created_by = Column(BigInteger, nullable=False)  # telegram_id админа, создавшего промокод 
+
+class LedgerEntry(Base):
+    """
+    Проводка двойной записи. Каждая операция (txn_id) состоит из проводок,
+    сумма которых равна нулю; суммы хранятся в целых микро-USDT.
+    """
+    __tablename__ = 'ledger_entries'
+    
+    id = Column(Integer, primary_key=True)
+    txn_id = Column(String, nullable=False)  # идемпотентный ключ операции
+    account = Column(String, nullable=False)  # user:<telegram_id> или system:<имя>
+    amount = Column(BigInteger, nullable=False)  # > 0 зачисление, < 0 списание
+    kind = Column(String, nullable=False)  # purchase, deposit, withdrawal, promo, admin, dispute, opening
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Индексы
+    __table_args__ = (
+        UniqueConstraint('txn_id', 'account', name='uq_ledger_txn_account'),
+        Index('idx_ledger_account', 'account'),
+    )
+
+class FsmState(Base):
+    """Состояние диалога aiogram (FSM) и его данные"""
+    __tablename__ = 'fsm_states'
+    
+    key = Column(String, primary_key=True)  # fsm:<chat_id>:<user_id>
+    state = Column(String, nullable=True)
+    data = Column(Text, nullable=False, default='{}')  # JSON
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    # Индексы
+    __table_args__ = (
+        Index('idx_fsm_updated', 'updated_at'),
+    )
+
+class Broadcast(Base):
+    """Рассылка объявления администратора всем пользователям"""
+    __tablename__ = 'broadcasts'
+    
+    id = Column(Integer, primary_key=True)
+    admin_id = Column(BigInteger, nullable=False)
+    text = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default='running')  # running, done, cancelled
+    cursor = Column(BigInteger, nullable=False, default=0)  # telegram_id последнего обработанного пользователя
+    total = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    blocked = Column(Integer, nullable=False, default=0)  # пользователь заблокировал бота
+    failed = Column(Integer, nullable=False, default=0)
+    progress_chat_id = Column(BigInteger, nullable=True)  # сообщение с прогрессом у администратора
+    progress_message_id = Column(Integer, nullable=True)
+    owner = Column(String, nullable=True)  # процесс, который ведет рассылку
+    lease_until = Column(DateTime, nullable=True)  # до этого времени другие процессы ее не продолжают
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    
+    # Индексы
+    __table_args__ = (
+        Index('idx_broadcast_status', 'status'),
+    )
+
+class Invoice(Base):
+    """Счет CryptoBot на пополнение баланса"""
+    __tablename__ = 'invoices'
+    
+    invoice_id = Column(BigInteger, primary_key=True)  # ID счета в CryptoBot
+    user_id = Column(BigInteger, nullable=False)
+    payload = Column(String, nullable=False, unique=True)  # deposit_<user_id>_<uuid>, ключ зачисления в журнале
+    amount_micro = Column(BigInteger, nullable=False)
+    status = Column(String, nullable=False, default='active')  # active, paid, expired, failed
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    paid_at = Column(DateTime, nullable=True)
+    
+    # Индексы
+    __table_args__ = (
+        Index('idx_invoice_status', 'status'),
+    )
+
+class Payout(Base):
+    """
+    Выплата пользователю через CryptoBot. spend_id передается в transfer,
+    поэтому повторная отправка той же выплаты не переведет деньги дважды.
+    """
+    __tablename__ = 'payouts'
+    
+    id = Column(Integer, primary_key=True)
+    spend_id = Column(String, nullable=False, unique=True)
+    user_id = Column(BigInteger, nullable=False)
+    amount_micro = Column(BigInteger, nullable=False)  # списано с баланса (удерживается до завершения)
+    payout_micro = Column(BigInteger, nullable=False)  # переводится через CryptoBot
+    address = Column(String, nullable=True)  # адрес, указанный пользователем (выплата вручную администратором)
+    status = Column(String, nullable=False, default='pending')  # pending, approved, sending, manual, completed, failed, rejected
+    attempts = Column(Integer, nullable=False, default=0)
+    transfer_id = Column(BigInteger, nullable=True)  # ID перевода в CryptoBot
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    
+    # Индексы
+    __table_args__ = (
+        Index('idx_payout_status', 'status'),
+        Index('idx_payout_user', 'user_id'),
+    )
\ No newline at end of file
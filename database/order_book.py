@@ -0,0 +1,229 @@
+import bisect
+import logging
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from database.db import read_session
+from database.listings import active_listings_query, decode_cursor
+from database.models import PhoneListing
+from config import LISTINGS_PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class BookEntry:
+    """Снимок активного объявления, достаточный для показа в каталоге"""
+    id: int
+    seller_id: int
+    service: str
+    price: float
+    rental_period: int
+    created_at: datetime
+    seller_rating: float
+    seller_reputation: float
+
+    @classmethod
+    def from_listing(cls, listing: PhoneListing) -> "BookEntry":
+        """Создает запись из объявления с загруженным продавцом"""
+        return cls(
+            id=listing.id,
+            seller_id=listing.seller_id,
+            service=sys.intern(listing.service),
+            price=listing.price,
+            rental_period=listing.rental_period,
+            created_at=listing.created_at,
+            seller_rating=listing.seller.rating,
+            seller_reputation=listing.seller.reputation
+        )
+
+class _ServiceBook:
+    """Отсортированные индексы объявлений одного сервиса"""
+
+    def __init__(self):
+        self.by_price: List[Tuple[float, int]] = []
+        self.by_recency: List[Tuple[datetime, int]] = []
+        self.by_reputation: List[Tuple[float, int]] = []
+
+    def add(self, entry: BookEntry):
+        bisect.insort(self.by_price, (entry.price, entry.id))
+        bisect.insort(self.by_recency, (entry.created_at, entry.id))
+        bisect.insort(self.by_reputation, (entry.seller_reputation, entry.id))
+
+    def remove(self, entry: BookEntry):
+        for keys, key in ((self.by_price, (entry.price, entry.id)),
+                          (self.by_recency, (entry.created_at, entry.id)),
+                          (self.by_reputation, (entry.seller_reputation, entry.id))):
+            index = bisect.bisect_left(keys, key)
+            if index < len(keys) and keys[index] == key:
+                del keys[index]
+
+    def __len__(self):
+        return len(self.by_price)
+
+class OrderBook:
+    """
+    Локальная для процесса книга активных объявлений по сервисам.
+    Строится один раз при запуске и обновляется обработчиками при каждом
+    изменении объявления, поэтому каталог отдается без запросов к SQLite.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._reset()
+
+    def _reset(self):
+        self.entries: Dict[int, BookEntry] = {}
+        self.services: Dict[str, _ServiceBook] = {}
+        self.all = _ServiceBook()
+        self.seller_listings: Dict[int, Set[int]] = {}
+
+    async def load(self):
+        """Полностью перестраивает книгу по таблице phone_listings"""
+        async with read_session() as session:
+            result = await session.scalars(active_listings_query())
+            listings = result.unique().all()
+
+        self._reset()
+        for listing in listings:
+            self._insert(BookEntry.from_listing(listing))
+        self.loaded = True
+        logger.info(f"Книга объявлений загружена: {len(self.entries)} активных объявлений")
+
+    def _insert(self, entry: BookEntry):
+        self.entries[entry.id] = entry
+        self.services.setdefault(entry.service, _ServiceBook()).add(entry)
+        self.all.add(entry)
+        self.seller_listings.setdefault(entry.seller_id, set()).add(entry.id)
+
+    def add(self, listing: PhoneListing, seller_rating: float, seller_reputation: float):
+        """Добавляет (или обновляет) активное объявление"""
+        self.remove(listing.id)
+        self._insert(BookEntry(
+            id=listing.id,
+            seller_id=listing.seller_id,
+            service=sys.intern(listing.service),
+            price=listing.price,
+            rental_period=listing.rental_period,
+            created_at=listing.created_at,
+            seller_rating=seller_rating,
+            seller_reputation=seller_reputation
+        ))
+
+    def remove(self, listing_id: int):
+        """Убирает объявление из книги (продано или снято)"""
+        entry = self.entries.pop(listing_id, None)
+        if not entry:
+            return
+        self.services[entry.service].remove(entry)
+        self.all.remove(entry)
+        seller_ids = self.seller_listings.get(entry.seller_id)
+        if seller_ids:
+            seller_ids.discard(listing_id)
+            if not seller_ids:
+                del self.seller_listings[entry.seller_id]
+
+    def update_seller(self, seller_id: int, rating: float, reputation: float):
+        """Обновляет рейтинг и репутацию продавца во всех его объявлениях"""
+        for listing_id in self.seller_listings.get(seller_id, ()):
+            entry = self.entries[listing_id]
+            # Ключ индекса by_reputation меняется: переставляем запись
+            self.services[entry.service].remove(entry)
+            self.all.remove(entry)
+            entry.seller_rating = rating
+            entry.seller_reputation = reputation
+            self.services[entry.service].add(entry)
+            self.all.add(entry)
+
+    def count(self, service: Optional[str] = None) -> int:
+        """Количество активных объявлений (всего или по сервису)"""
+        if service is None:
+            return len(self.all)
+        book = self.services.get(service)
+        return len(book) if book else 0
+
+    def page(
+        self,
+        service: Optional[str] = None,
+        exclude_seller_id: Optional[int] = None,
+        order: str = "new",
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        limit: int = LISTINGS_PAGE_SIZE
+    ) -> Tuple[List[BookEntry], bool, bool]:
+        """
+        Страница каталога с теми же курсорами и результатом,
+        что и database.listings.get_listings_page
+        """
+        book = self.all if service is None else self.services.get(service)
+        if not book:
+            return [], False, False
+
+        if order == "new":
+            keys = book.by_recency
+        elif order == "best":
+            keys = book.by_reputation
+        else:
+            keys = book.by_price
+        descending = order != "price_asc"
+        backwards = before is not None
+
+        # Определяем стартовую позицию и шаг обхода индекса
+        if after is not None:
+            cursor = decode_cursor(after, order)
+            if descending:
+                index, step = bisect.bisect_left(keys, cursor) - 1, -1
+            else:
+                index, step = bisect.bisect_right(keys, cursor), 1
+        elif backwards:
+            cursor = decode_cursor(before, order)
+            if descending:
+                index, step = bisect.bisect_right(keys, cursor), 1
+            else:
+                index, step = bisect.bisect_left(keys, cursor) - 1, -1
+        else:
+            index, step = (len(keys) - 1, -1) if descending else (0, 1)
+
+        entries = []
+        while 0 <= index < len(keys) and len(entries) <= limit:
+            entry = self.entries[keys[index][1]]
+            if entry.seller_id != exclude_seller_id:
+                entries.append(entry)
+            index += step
+
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+
+        if backwards:
+            entries.reverse()
+            return entries, has_more, True
+        return entries, after is not None, has_more
+
+    async def check_consistency(self, repair: bool = True) -> bool:
+        """Сверяет книгу с базой данных; при расхождении перестраивает ее"""
+        async with read_session() as session:
+            result = await session.scalars(active_listings_query())
+            expected = {
+                listing.id: BookEntry.from_listing(listing)
+                for listing in result.unique().all()
+            }
+
+        missing = expected.keys() - self.entries.keys()
+        stale = self.entries.keys() - expected.keys()
+        changed = [
+            listing_id for listing_id in expected.keys() & self.entries.keys()
+            if expected[listing_id] != self.entries[listing_id]
+        ]
+
+        if not (missing or stale or changed):
+            return True
+
+        logger.warning(
+            f"Книга объявлений расходится с БД: "
+            f"нет в книге {len(missing)}, лишних {len(stale)}, изменено {len(changed)}"
+        )
+        if repair:
+            await self.load()
+        return False
+
+order_book = OrderBook()
@@ -0,0 +1,129 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import update, select, exists
+from database.db import immediate_session
+from database.ledger import transfer, user_account, to_micro, InsufficientFunds
+from database.models import User, PhoneListing, Transaction
+from database.order_book import order_book
+
+logger = logging.getLogger(__name__)
+
+class PurchaseError(Exception):
+    """Покупка не может быть выполнена"""
+
+    UNAVAILABLE = "unavailable"
+    OWN_LISTING = "own_listing"
+    NOT_REGISTERED = "not_registered"
+    INSUFFICIENT_FUNDS = "insufficient_funds"
+
+    def __init__(self, reason: str, price: float = 0.0, balance: float = 0.0):
+        super().__init__(reason)
+        self.reason = reason
+        self.price = price
+        self.balance = balance
+
+@dataclass
+class PurchaseResult:
+    transaction: Transaction
+    listing: PhoneListing
+    buyer: User
+    seller: User
+
+async def publish_listing(listing_id: int, seller_id: int) -> Optional[PhoneListing]:
+    """
+    Публикует черновик объявления и добавляет его в книгу объявлений.
+    Проданное объявление тоже неактивно, поэтому условный UPDATE публикует
+    только неактивное объявление продавца без транзакций; повторное нажатие
+    кнопки подтверждения ничего не меняет. Возвращает None, если
+    публиковать нечего.
+    """
+    async with immediate_session() as session:
+        result = await session.execute(
+            update(PhoneListing)
+            .where(
+                PhoneListing.id == listing_id,
+                PhoneListing.seller_id == seller_id,
+                PhoneListing.is_active == False,
+                ~exists(select(Transaction.id).where(Transaction.listing_id == listing_id))
+            )
+            .values(is_active=True)
+        )
+        if result.rowcount != 1:
+            return None
+
+        listing = await session.get(PhoneListing, listing_id)
+        seller = await session.get(User, seller_id)
+
+    order_book.add(listing, seller.rating, seller.reputation)
+    logger.info(f"Объявление {listing_id} опубликовано продавцом {seller_id}")
+    return listing
+
+async def purchase_listing(listing_id: int, buyer_id: int) -> PurchaseResult:
+    """
+    Атомарно покупает объявление: снимает его с продажи, переводит средства
+    и создает транзакцию в одной транзакции BEGIN IMMEDIATE.
+    Снятие объявления и списание защищены условными UPDATE
+    (is_active = 1 и balance_micro >= цены), поэтому два покупателя не могут
+    купить одно объявление, а баланс не может уйти в минус.
+    """
+    try:
+        async with immediate_session() as session:
+            listing = await session.get(PhoneListing, listing_id)
+            if not listing or not listing.is_active:
+                raise PurchaseError(PurchaseError.UNAVAILABLE)
+            if listing.seller_id == buyer_id:
+                raise PurchaseError(PurchaseError.OWN_LISTING)
+
+            buyer = await session.get(User, buyer_id)
+            if not buyer:
+                raise PurchaseError(PurchaseError.NOT_REGISTERED)
+
+            price = listing.price
+
+            # Снимаем объявление с продажи, только если оно еще активно
+            result = await session.execute(
+                update(PhoneListing)
+                .where(PhoneListing.id == listing_id, PhoneListing.is_active == True)
+                .values(is_active=False)
+            )
+            if result.rowcount != 1:
+                raise PurchaseError(PurchaseError.UNAVAILABLE)
+
+            now = datetime.utcnow()
+            transaction = Transaction(
+                listing_id=listing_id,
+                buyer_id=buyer_id,
+                seller_id=listing.seller_id,
+                amount=price,
+                status="completed",
+                created_at=now,
+                completed_at=now
+            )
+            session.add(transaction)
+            await session.flush()
+
+            # Переводим средства через журнал; списание защищено условием balance_micro >= price
+            try:
+                await transfer(
+                    session,
+                    f"purchase:{transaction.id}",
+                    user_account(buyer_id),
+                    user_account(listing.seller_id),
+                    to_micro(price),
+                    "purchase"
+                )
+            except InsufficientFunds:
+                raise PurchaseError(PurchaseError.INSUFFICIENT_FUNDS, price, buyer.balance)
+
+            seller = await session.get(User, listing.seller_id)
+            await session.refresh(buyer)
+    except PurchaseError as e:
+        if e.reason == PurchaseError.UNAVAILABLE:
+            order_book.remove(listing_id)
+        raise
+
+    order_book.remove(listing_id)
+    logger.info(f"Объявление {listing_id} куплено пользователем {buyer_id} за {price}")
+    return PurchaseResult(transaction, listing, buyer, seller)
\ No newline at end of file
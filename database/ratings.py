@@ -0,0 +1,96 @@
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+# Добавляем корневую директорию проекта в PYTHONPATH
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from sqlalchemy import select, update, func, cast, Float
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.db import write_session
+from database.models import User, Review
+from database.reputation import add_review_reputation, rebuild_reputation
+from database.user_cache import mark_user_changed
+
+# Рейтинг пользователя без отзывов
+DEFAULT_RATING = 5.0
+
+class RatingUpdate(NamedTuple):
+    rating: float
+    reputation: float
+
+async def add_rating(session: AsyncSession, user_id: int, rating: int) -> Optional[RatingUpdate]:
+    """
+    Учитывает новую оценку одним UPDATE: rating_sum и total_reviews
+    увеличиваются, rating пересчитывается из них же (в SET SQLite видит
+    значения до обновления). Стоимость не зависит от числа отзывов.
+    Затем оценка учитывается в репутации (database.reputation).
+    Возвращает новые рейтинг и репутацию или None, если пользователя нет.
+    Фиксация (commit) остается за вызывающим кодом.
+    """
+    result = await session.execute(
+        update(User)
+        .where(User.telegram_id == user_id)
+        .values(
+            rating_sum=User.rating_sum + rating,
+            total_reviews=User.total_reviews + 1,
+            rating=cast(User.rating_sum + rating, Float) / (User.total_reviews + 1)
+        )
+        .returning(User.rating)
+    )
+    new_rating = result.scalar_one_or_none()
+    if new_rating is None:
+        return None
+    mark_user_changed(session, user_id)
+    reputation = await add_review_reputation(session, user_id, rating)
+    return RatingUpdate(new_rating, reputation)
+
+async def rebuild_ratings(session: AsyncSession) -> int:
+    """
+    Пересчитывает rating_sum, total_reviews и rating всех пользователей
+    по таблице reviews за один проход GROUP BY. Возвращает количество
+    пользователей с отзывами. Фиксация (commit) остается за вызывающим кодом.
+    """
+    totals = (
+        select(
+            Review.reviewed_id.label("user_id"),
+            func.sum(Review.rating).label("rating_sum"),
+            func.count().label("total_reviews")
+        )
+        .group_by(Review.reviewed_id)
+        .subquery()
+    )
+    await session.execute(
+        update(User).values(rating_sum=0, total_reviews=0, rating=DEFAULT_RATING)
+    )
+    result = await session.execute(
+        update(User)
+        .where(User.telegram_id == totals.c.user_id)
+        .values(
+            rating_sum=totals.c.rating_sum,
+            total_reviews=totals.c.total_reviews,
+            rating=cast(totals.c.rating_sum, Float) / totals.c.total_reviews
+        )
+    )
+    mark_user_changed(session)
+    return result.rowcount
+
+async def rebuild():
+    async with write_session() as session:
+        users = await rebuild_ratings(session)
+        await session.commit()
+    print(f"✅ Рейтинги пересчитаны: пользователей с отзывами {users}")
+    await rebuild_reputation()
+    print("✅ Репутация продавцов пересчитана")
+    print("ℹ️ Запущенный бот подхватит новые рейтинги в книге объявлений при следующей сверке")
+
+def main():
+    parser = argparse.ArgumentParser(description="Пересчет рейтингов пользователей по отзывам")
+    parser.parse_args()
+    asyncio.run(rebuild())
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
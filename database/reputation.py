@@ -0,0 +1,124 @@
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select, update, bindparam, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.db import read_session, write_session
+from database.models import User, Review
+from database.user_cache import mark_user_changed
+from config import (
+    REPUTATION_PRIOR, REPUTATION_PRIOR_WEIGHT, REPUTATION_HALF_LIFE_DAYS, REPUTATION_BATCH_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 86400
+
+def decay(since: Optional[datetime], now: datetime) -> float:
+    """Множитель, на который уменьшается вес отзыва с момента since до now"""
+    if since is None or now <= since:
+        return 1.0
+    age_days = (now - since).total_seconds() / SECONDS_PER_DAY
+    return 0.5 ** (age_days / REPUTATION_HALF_LIFE_DAYS)
+
+def score(weighted_sum: float, weight: float) -> float:
+    """
+    Байесовская оценка: среднее взвешенных отзывов, к которым добавлено
+    REPUTATION_PRIOR_WEIGHT воображаемых отзывов с оценкой REPUTATION_PRIOR.
+    Продавец с одним отзывом остается близко к априорной оценке, а
+    с большим числом свежих отзывов - близко к своему среднему.
+    """
+    return (REPUTATION_PRIOR * REPUTATION_PRIOR_WEIGHT + weighted_sum) / (REPUTATION_PRIOR_WEIGHT + weight)
+
+async def add_review_reputation(session: AsyncSession, user_id: int, rating: int,
+                                now: Optional[datetime] = None) -> Optional[float]:
+    """
+    Учитывает новый отзыв в репутации за O(1): накопленные суммы
+    затухают до текущего момента, к ним добавляется отзыв с весом 1.
+    Вызывается в транзакции записи отзыва; возвращает новую репутацию
+    или None, если пользователя нет. Фиксация остается за вызывающим кодом.
+    """
+    now = now or datetime.utcnow()
+    row = (await session.execute(
+        select(User.reputation_sum, User.reputation_weight, User.reputation_at)
+        .where(User.telegram_id == user_id)
+    )).one_or_none()
+    if row is None:
+        return None
+
+    factor = decay(row.reputation_at, now)
+    weighted_sum = row.reputation_sum * factor + rating
+    weight = row.reputation_weight * factor + 1
+    reputation = score(weighted_sum, weight)
+    await session.execute(
+        update(User)
+        .where(User.telegram_id == user_id)
+        .values(
+            reputation=reputation,
+            reputation_sum=weighted_sum,
+            reputation_weight=weight,
+            reputation_at=now
+        )
+    )
+    mark_user_changed(session, user_id)
+    return reputation
+
+async def rebuild_reputation(now: Optional[datetime] = None) -> int:
+    """
+    Пересчитывает репутацию всех пользователей по таблице reviews:
+    отзывы читаются потоком в порядке reviewed_id, суммы считаются на момент
+    now, затем записываются пачками по REPUTATION_BATCH_SIZE. Пользователь,
+    получивший отзыв после начала пересчета, не перезаписывается - его
+    репутацию уже обновил add_review_reputation. Возвращает количество
+    пользователей с отзывами.
+    """
+    now = now or datetime.utcnow()
+    totals: Dict[int, Tuple[float, float]] = {}
+
+    async with read_session() as session:
+        stream = await session.stream(
+            select(Review.reviewed_id, Review.rating, Review.created_at)
+            .where(Review.reviewed_id.is_not(None))
+            .execution_options(yield_per=REPUTATION_BATCH_SIZE)
+        )
+        async for rows in stream.partitions():
+            for user_id, rating, created_at in rows:
+                weight = decay(created_at, now)
+                weighted_sum, total = totals.get(user_id, (0.0, 0.0))
+                totals[user_id] = (weighted_sum + rating * weight, total + weight)
+
+    table = User.__table__
+    statement = (
+        update(table)
+        .where(
+            table.c.telegram_id == bindparam("user_id"),
+            or_(table.c.reputation_at.is_(None), table.c.reputation_at <= now)
+        )
+        .values(
+            reputation=bindparam("reputation"),
+            reputation_sum=bindparam("weighted_sum"),
+            reputation_weight=bindparam("weight"),
+            reputation_at=now
+        )
+    )
+    params: List[dict] = [
+        {"user_id": user_id, "reputation": score(weighted_sum, weight),
+         "weighted_sum": weighted_sum, "weight": weight}
+        for user_id, (weighted_sum, weight) in totals.items()
+    ]
+
+    async with write_session() as session:
+        # Пользователи без отзывов получают априорную оценку
+        reviewed = select(Review.reviewed_id).where(Review.reviewed_id.is_not(None))
+        await session.execute(
+            update(User)
+            .where(User.reputation_weight > 0, User.telegram_id.not_in(reviewed))
+            .values(reputation=REPUTATION_PRIOR, reputation_sum=0, reputation_weight=0, reputation_at=now)
+        )
+        for start in range(0, len(params), REPUTATION_BATCH_SIZE):
+            await session.execute(statement, params[start:start + REPUTATION_BATCH_SIZE])
+        mark_user_changed(session)
+        await session.commit()
+
+    logger.info(f"Репутация пересчитана: пользователей с отзывами {len(totals)}")
+    return len(totals)
\ No newline at end of file
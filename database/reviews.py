@@ -0,0 +1,65 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import contains_eager
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.models import Review
+from database.listings import CURSOR_DATE_FORMAT
+
+# Отзывов на одной странице ленты (в боте показывается по одному)
+REVIEWS_PAGE_SIZE = 1
+
+def encode_review_cursor(review: Review) -> str:
+    """Кодирует позицию отзыва в ленте в строку для callback_data"""
+    return f"{review.created_at.strftime(CURSOR_DATE_FORMAT)}:{review.id}"
+
+def decode_review_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Обратное преобразование для encode_review_cursor"""
+    key, review_id = cursor.split(":")
+    return datetime.strptime(key, CURSOR_DATE_FORMAT), int(review_id)
+
+async def get_reviews_page(
+    session: AsyncSession,
+    reviewed_id: int,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = REVIEWS_PAGE_SIZE
+) -> Tuple[List[Review], bool, bool]:
+    """
+    Возвращает страницу отзывов о пользователе, новые первыми, вместе с автором
+    и сделкой (review.reviewer, review.transaction) одним запросом.
+    Выборка идет по индексу idx_review_reviewed_created от курсора (created_at, id),
+    поэтому ее стоимость не зависит от числа отзывов и номера страницы.
+    Результат: (отзывы, есть_предыдущая, есть_следующая)
+    """
+    key = tuple_(Review.created_at, Review.id)
+    query = (
+        select(Review)
+        .outerjoin(Review.reviewer)
+        .outerjoin(Review.transaction)
+        .options(contains_eager(Review.reviewer), contains_eager(Review.transaction))
+        .where(Review.reviewed_id == reviewed_id)
+    )
+
+    # При движении назад идем в обратном порядке и затем разворачиваем страницу
+    backwards = before is not None
+
+    if after is not None:
+        query = query.where(key < tuple_(*decode_review_cursor(after)))
+    elif backwards:
+        query = query.where(key > tuple_(*decode_review_cursor(before)))
+
+    if backwards:
+        query = query.order_by(Review.created_at.asc(), Review.id.asc())
+    else:
+        query = query.order_by(Review.created_at.desc(), Review.id.desc())
+
+    result = await session.scalars(query.limit(limit + 1))
+    reviews = list(result.all())
+    has_more = len(reviews) > limit
+    reviews = reviews[:limit]
+
+    if backwards:
+        reviews.reverse()
+        return reviews, has_more, True
+    return reviews, after is not None, has_more
\ No newline at end of file
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from database.db import read_session
+from database.models import User
+from config import USER_CACHE_SIZE, USER_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+# Ключ session.info со списком пользователей, измененных в транзакции
+CHANGED_USERS_KEY = "changed_users"
+# Отметка "изменены все пользователи" (массовые пересчеты)
+ALL_USERS = "*"
+
+class UserCache:
+    """
+    Кэш строк users для обработчиков: не больше maxsize записей (вытесняются
+    давно не использованные), каждая живет не дольше ttl секунд. Кэшируется
+    и отсутствие пользователя, чтобы незарегистрированные не шли в базу.
+    Одновременные запросы одного пользователя ждут одну загрузку.
+    Объекты отсоединены от сессии и служат только для чтения: изменения
+    делаются в своей сессии записи и отмечаются через mark_user_changed.
+    """
+
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._values: "OrderedDict[int, Tuple[Optional[User], float]]" = OrderedDict()
+        self._loading: Dict[int, asyncio.Future] = {}
+        # Растет при каждой инвалидации: загрузка, начатая до нее, не сохраняется
+        self._generation = 0
+
+    async def get(self, user_id: int) -> Optional[User]:
+        """Пользователь по telegram_id или None, если он не зарегистрирован"""
+        cached = self._values.get(user_id)
+        if cached is not None:
+            user, loaded_at = cached
+            if time.monotonic() - loaded_at < self.ttl:
+                self._values.move_to_end(user_id)
+                return user
+            del self._values[user_id]
+
+        future = self._loading.get(user_id)
+        if future is None:
+            future = asyncio.ensure_future(self._load(user_id))
+            self._loading[user_id] = future
+        # shield: отмена одного ожидающего не отменяет загрузку для остальных
+        return await asyncio.shield(future)
+
+    async def _load(self, user_id: int) -> Optional[User]:
+        generation = self._generation
+        try:
+            async with read_session() as session:
+                user = await session.get(User, user_id)
+        finally:
+            del self._loading[user_id]
+
+        if generation == self._generation:
+            self._values[user_id] = (user, time.monotonic())
+            if len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id: Optional[int] = None):
+        """Удаляет запись (или все записи, если пользователь не указан)"""
+        self._generation += 1
+        if user_id is None:
+            self._values.clear()
+        else:
+            self._values.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._values)
+
+def mark_user_changed(session: AsyncSession, user_id: Optional[int] = None):
+    """
+    Отмечает, что транзакция сессии меняет пользователя (баланс, блокировку,
+    права, рейтинг); без user_id - всех пользователей. Запись кэша удаляется
+    после фиксации транзакции, а при откате отметка просто сбрасывается.
+    """
+    changed = session.info.setdefault(CHANGED_USERS_KEY, set())
+    changed.add(ALL_USERS if user_id is None else user_id)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session: Session):
+    changed = session.info.pop(CHANGED_USERS_KEY, None)
+    if not changed:
+        return
+    if ALL_USERS in changed:
+        user_cache.invalidate()
+        return
+    for user_id in changed:
+        user_cache.invalidate(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session: Session):
+    session.info.pop(CHANGED_USERS_KEY, None)
+
+# Общий кэш пользователей
+user_cache = UserCache()
\ No newline at end of file
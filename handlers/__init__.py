@@ -5,9 +5,13 @@ from .selling import register_selling_handlers
 from .ratings import register_rating_handlers
 from .disputes import register_dispute_handlers
 from .common import register_common_handlers
+from utils.middlewares import register_middlewares
 
 def register_all_handlers(dp: Dispatcher):
     """Регистрация всех обработчиков"""
+    # Пользователь загружается до фильтров и передается обработчикам аргументом user
+    register_middlewares(dp)
+    
     # Регистрируем обработчики в порядке приоритета
     register_admin_handlers(dp)  # Админские команды должны быть первыми
     register_buying_handlers(dp)
@@ -2,13 +2,20 @@ from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
-from database.db import async_session
-from database.models import User, Transaction, Dispute, PhoneListing, Review, PromoCode
+from database.db import read_session, write_session
+from database.models import User, Transaction, Dispute, PhoneListing, Review, PromoCode, Payout
+from database.order_book import order_book
+from database.gatekeeper import gatekeeper
+from database.user_cache import mark_user_changed
+from database.ledger import transfer, user_account, to_micro, from_micro, InsufficientFunds, SYSTEM_ADMIN, SYSTEM_DISPUTES
 from datetime import datetime, timedelta
 from sqlalchemy import select, func, and_, or_
 import logging
-from config import ADMIN_IDS
+import uuid
 from handlers.common import get_main_keyboard
+from utils.broadcast import broadcaster
+from utils.payouts import payout_queue
+from utils.keyboards import keyboards
 from aiogram import Dispatcher
 from aiogram.filters import Command, StateFilter
 from aiogram.types import Message
@@ -25,6 +32,7 @@ class AdminStates(StatesGroup):
     creating_promo = State()
     entering_promo_code = State()
 
+@keyboards.static
 def get_admin_keyboard():
     """Создает клавиатуру администратора"""
     keyboard = [
@@ -42,18 +50,21 @@ def get_admin_keyboard():
         ],
         [
             KeyboardButton(text="🎁 Управление промокодами"),
+            KeyboardButton(text="💸 Выплаты")
+        ],
+        [
             KeyboardButton(text="❌ Выйти из панели админа")
         ]
     ]
     return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
 
 async def check_admin(user_id: int) -> bool:
-    return user_id in ADMIN_IDS
+    return gatekeeper.is_admin(user_id)
 
 @router.message(F.text == "👑 Админ панель")
 async def show_admin_panel(message: types.Message):
     """Показывает панель администратора"""
-    if message.from_user.id not in ADMIN_IDS:
+    if not gatekeeper.is_admin(message.from_user.id):
         await message.answer(
             "❌ У вас нет доступа к панели администратора.",
             reply_markup=get_main_keyboard(message.from_user.id)
@@ -61,10 +72,13 @@ async def show_admin_panel(message: types.Message):
         return
     
     try:
-        async with async_session() as session:
+        async with read_session() as session:
             # Получаем статистику
             users_count = await session.scalar(select(func.count(User.telegram_id)))
-            active_listings = await session.scalar(select(func.count(PhoneListing.id)).where(PhoneListing.is_active == True))
+            if order_book.loaded:
+                active_listings = order_book.count()
+            else:
+                active_listings = await session.scalar(select(func.count(PhoneListing.id)).where(PhoneListing.is_active == True))
             open_disputes = await session.scalar(select(func.count(Dispute.id)).where(Dispute.status == "open"))
             
             # Получаем последние транзакции
@@ -98,14 +112,14 @@ async def show_admin_panel(message: types.Message):
             reply_markup=get_main_keyboard(message.from_user.id)
         )
 
-@router.message(F.text == "📊 Статистика")
+@router.message(F.text == "📊 Статистика", flags={"throttling_key": "stats"})
 async def show_statistics(message: types.Message):
     """Показывает подробную статистику"""
-    if message.from_user.id not in ADMIN_IDS:
+    if not gatekeeper.is_admin(message.from_user.id):
         return
     
     try:
-        async with async_session() as session:
+        async with read_session() as session:
             # Получаем расширенную статистику
             total_volume = await session.scalar(
                 select(func.sum(Transaction.amount)).where(Transaction.status == "completed")
@@ -150,11 +164,11 @@ async def show_statistics(message: types.Message):
 @router.message(F.text == "👥 Пользователи")
 async def show_users(message: types.Message):
     """Показывает список пользователей"""
-    if message.from_user.id not in ADMIN_IDS:
+    if not gatekeeper.is_admin(message.from_user.id):
         return
     
     try:
-        async with async_session() as session:
+        async with read_session() as session:
             # Получаем последних зарегистрированных пользователей
             users_query = select(User).order_by(User.created_at.desc()).limit(10)
             users_result = await session.execute(users_query)
@@ -180,13 +194,13 @@ async def show_users(message: types.Message):
 @router.message(F.text == "💰 Управление балансами")
 async def manage_balances(message: types.Message, state: FSMContext):
     """Начинает процесс управления балансами"""
-    if message.from_user.id not in ADMIN_IDS:
+    if not gatekeeper.is_admin(message.from_user.id):
         return
     
     try:
-        async with async_session() as session:
+        async with read_session() as session:
             # Получаем список пользователей с их балансами
-            users_query = select(User).order_by(User.balance.desc()).limit(10)
+            users_query = select(User).order_by(User.balance_micro.desc()).limit(10)
             users_result = await session.execute(users_query)
             users = users_result.scalars().all()
             
@@ -258,7 +272,7 @@ async def process_amount(message: types.Message, state: FSMContext):
         user_id = data['user_id']
         action = data['action']
         
-        async with async_session() as session:
+        async with write_session() as session:
             user = await session.get(User, user_id)
             if not user:
                 await message.answer(
@@ -276,11 +290,21 @@ async def process_amount(message: types.Message, state: FSMContext):
             
             # Изменяем баланс
             if action == "add":
-                user.balance += amount
+                debit, credit = SYSTEM_ADMIN, user_account(user_id)
             else:
-                user.balance -= amount
+                debit, credit = user_account(user_id), SYSTEM_ADMIN
+            try:
+                await transfer(session, f"admin:{uuid.uuid4()}", debit, credit, to_micro(amount), "admin")
+            except InsufficientFunds:
+                await session.rollback()
+                await message.answer(
+                    "❌ Недостаточно средств на балансе пользователя.",
+                    reply_markup=get_admin_keyboard()
+                )
+                return
             
             await session.commit()
+            await session.refresh(user)
             
             await message.answer(
                 f"✅ Баланс пользователя успешно {'пополнен' if action == 'add' else 'списан'} на {amount:.2f} ROXY\n"
@@ -315,11 +339,11 @@ async def process_amount(message: types.Message, state: FSMContext):
 @router.message(F.text == "⚠️ Активные споры")
 async def show_active_disputes(message: types.Message):
     """Показывает активные споры"""
-    if message.from_user.id not in ADMIN_IDS:
+    if not gatekeeper.is_admin(message.from_user.id):
         return
     
     try:
-        async with async_session() as session:
+        async with read_session() as session:
             # Получаем активные споры
             disputes_query = select(Dispute).where(
                 Dispute.status == "open"
@@ -359,7 +383,7 @@ async def show_active_disputes(message: types.Message):
 @router.message(F.text == "📢 Сделать объявление")
 async def start_announcement(message: types.Message, state: FSMContext):
     """Начинает процесс создания объявления"""
-    if message.from_user.id not in ADMIN_IDS:
+    if not gatekeeper.is_admin(message.from_user.id):
         return
     
     await state.set_state(AdminStates.entering_message)
@@ -377,33 +401,17 @@ async def process_announcement(message: types.Message, state: FSMContext):
     try:
         announcement_text = message.text.strip()
         
-        async with async_session() as session:
-            # Получаем всех пользователей
-            users_query = select(User.telegram_id)
-            users_result = await session.execute(users_query)
-            users = users_result.scalars().all()
-            
-            # Отправляем объявление всем пользователям
-            success_count = 0
-            fail_count = 0
-            
-            for user_id in users:
-                try:
-                    await message.bot.send_message(
-                        user_id,
-                        f"📢 Объявление от администратора:\n\n{announcement_text}"
-                    )
-                    success_count += 1
-                except Exception as e:
-                    logger.error(f"Failed to send announcement to user {user_id}: {e}")
-                    fail_count += 1
-            
-            await message.answer(
-                f"✅ Объявление отправлено!\n"
-                f"Успешно: {success_count}\n"
-                f"Ошибок: {fail_count}",
-                reply_markup=get_admin_keyboard()
-            )
+        await message.answer("✅ Рассылка объявления запущена.", reply_markup=get_admin_keyboard())
+        
+        # Рассылка идет в фоне, прогресс обновляется в этом сообщении
+        progress = await message.answer("📢 Идет рассылка...")
+        await broadcaster.create(
+            message.bot,
+            message.from_user.id,
+            announcement_text,
+            progress_chat_id=progress.chat.id,
+            progress_message_id=progress.message_id
+        )
             
     except Exception as e:
         logger.error(f"Error in process_announcement: {e}")
@@ -414,14 +422,152 @@ async def process_announcement(message: types.Message, state: FSMContext):
     
     await state.clear()
 
+# Сколько ожидающих выплат показывать списком
+PAYOUTS_SHOWN = 10
+
+async def get_payouts_overview():
+    """Текст и клавиатура со сводкой выплат, ожидающих одобрения"""
+    async with read_session() as session:
+        count, total, last_id = (await session.execute(
+            select(func.count(Payout.id), func.sum(Payout.payout_micro), func.max(Payout.id))
+            .where(Payout.status == "pending")
+        )).one()
+        result = await session.scalars(
+            select(Payout)
+            .where(Payout.status == "pending")
+            .order_by(Payout.id)
+            .limit(PAYOUTS_SHOWN)
+        )
+        payouts = result.all()
+        sending = await session.scalar(
+            select(func.count(Payout.id)).where(Payout.status.in_(["approved", "sending"]))
+        )
+        # Выплаты на адрес администратор переводит вручную
+        manual = (await session.scalars(
+            select(Payout)
+            .where(Payout.status == "manual")
+            .order_by(Payout.id)
+            .limit(PAYOUTS_SHOWN)
+        )).all()
+
+    if not count and not manual:
+        return f"💸 Нет выплат, ожидающих одобрения.\nВ очереди на отправку: {sending}", None
+
+    keyboard = []
+    response = ""
+    if manual:
+        response += "👛 Выплаты на адрес (перевести вручную):\n"
+        for payout in manual:
+            response += f"#{payout.id}: {from_micro(payout.payout_micro)} USDT → {payout.address} ({payout.user_id})\n"
+            keyboard.append([
+                InlineKeyboardButton(text=f"✅ Выплачено #{payout.id}", callback_data=f"payout_paid:{payout.id}"),
+                InlineKeyboardButton(text=f"❌ Отклонить #{payout.id}", callback_data=f"payout_reject:{payout.id}")
+            ])
+        response += "\n"
+
+    response += (
+        f"💸 Ожидают одобрения: {count} на {from_micro(total or 0):.2f} USDT\n"
+        f"В очереди на отправку: {sending}\n\n"
+    )
+    if not count:
+        return response, InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+    for payout in payouts:
+        response += f"#{payout.id}: {from_micro(payout.payout_micro)} USDT → {payout.user_id}"
+        if payout.error:
+            response += f" (⚠️ {payout.error})"
+        response += "\n"
+        keyboard.append([InlineKeyboardButton(
+            text=f"❌ Отклонить #{payout.id}",
+            callback_data=f"payout_reject:{payout.id}"
+        )])
+    if count > len(payouts):
+        response += f"... и еще {count - len(payouts)}\n"
+
+    # Одобряются только выплаты, которые уже были в очереди при показе списка
+    keyboard.insert(0, [InlineKeyboardButton(
+        text=f"✅ Одобрить все ({count})",
+        callback_data=f"payouts_approve:{last_id}"
+    )])
+    return response, InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+@router.message(F.text == "💸 Выплаты")
+async def show_payouts(message: types.Message):
+    """Показывает выплаты, ожидающие одобрения"""
+    if not gatekeeper.is_admin(message.from_user.id):
+        return
+    
+    try:
+        response, keyboard = await get_payouts_overview()
+        await message.answer(response, reply_markup=keyboard or get_admin_keyboard())
+    except Exception as e:
+        logger.error(f"Ошибка при показе выплат: {e}")
+        await message.answer(
+            "Произошла ошибка при загрузке выплат.",
+            reply_markup=get_admin_keyboard()
+        )
+
+@router.callback_query(lambda c: c.data.startswith("payouts_approve:"))
+async def approve_payouts(callback: types.CallbackQuery):
+    """Одобряет все показанные выплаты одним запросом"""
+    if not gatekeeper.is_admin(callback.from_user.id):
+        return
+    
+    up_to_id = int(callback.data.split(":")[1])
+    approved = await payout_queue.approve(up_to_id)
+    logger.info(f"Администратор {callback.from_user.id} одобрил выплат: {approved}")
+    await callback.message.edit_text(f"✅ Одобрено выплат: {approved}. Они будут отправлены в фоне.")
+    await callback.answer()
+
+@router.callback_query(lambda c: c.data.startswith("payout_paid:"))
+async def mark_payout_paid(callback: types.CallbackQuery):
+    """Отмечает выплату на адрес выполненной после ручного перевода"""
+    if not gatekeeper.is_admin(callback.from_user.id):
+        return
+    
+    payout_id = int(callback.data.split(":")[1])
+    payout = await payout_queue.complete_manual(payout_id)
+    if payout is None:
+        await callback.answer("Выплата уже обработана", show_alert=True)
+    else:
+        logger.info(f"Администратор {callback.from_user.id} выплатил вручную #{payout_id}")
+        await callback.answer(f"Выплата #{payout_id} отмечена выполненной")
+    
+    response, keyboard = await get_payouts_overview()
+    try:
+        await callback.message.edit_text(response, reply_markup=keyboard)
+    except Exception:
+        # Текст не изменился
+        pass
+
+@router.callback_query(lambda c: c.data.startswith("payout_reject:"))
+async def reject_payout(callback: types.CallbackQuery):
+    """Отклоняет выплату и возвращает средства пользователю"""
+    if not gatekeeper.is_admin(callback.from_user.id):
+        return
+    
+    payout_id = int(callback.data.split(":")[1])
+    payout = await payout_queue.reject(payout_id)
+    if payout is None:
+        await callback.answer("Выплата уже обработана", show_alert=True)
+    else:
+        await callback.answer(f"Выплата #{payout_id} отклонена")
+    
+    response, keyboard = await get_payouts_overview()
+    try:
+        await callback.message.edit_text(response, reply_markup=keyboard)
+    except Exception:
+        # Текст не изменился
+        pass
+
 @router.message(F.text == "🔒 Заблокировать пользователя")
 async def start_user_block(message: types.Message, state: FSMContext):
     """Начинает процесс блокировки пользователя"""
-    if message.from_user.id not in ADMIN_IDS:
+    if not gatekeeper.is_admin(message.from_user.id):
         return
     
     try:
-        async with async_session() as session:
+        async with read_session() as session:
             # Получаем список пользователей
             users_query = select(User).order_by(User.created_at.desc()).limit(10)
             users_result = await session.execute(users_query)
@@ -458,7 +604,7 @@ async def process_user_block(callback: types.CallbackQuery):
     try:
         user_id = int(callback.data.split(":")[1])
         
-        async with async_session() as session:
+        async with write_session() as session:
             user = await session.get(User, user_id)
             if not user:
                 await callback.message.edit_text(
@@ -472,7 +618,9 @@ async def process_user_block(callback: types.CallbackQuery):
             
             # Меняем статус блокировки
             user.is_blocked = not user.is_blocked
+            mark_user_changed(session, user_id)
             await session.commit()
+            gatekeeper.set_blocked(user_id, user.is_blocked)
             
             # Уведомляем пользователя
             try:
@@ -498,7 +646,7 @@ async def process_user_block(callback: types.CallbackQuery):
 @router.message(F.text == "❌ Выйти из панели админа")
 async def exit_admin_panel(message: types.Message):
     """Выход из панели администратора"""
-    if message.from_user.id not in ADMIN_IDS:
+    if not gatekeeper.is_admin(message.from_user.id):
         return
     
     await message.answer(
@@ -518,7 +666,7 @@ async def cancel_admin_action(callback: types.CallbackQuery, state: FSMContext):
 @router.message(F.text == "🎁 Управление промокодами")
 async def show_promo_menu(message: types.Message):
     """Показывает меню управления промокодами"""
-    if message.from_user.id not in ADMIN_IDS:
+    if not gatekeeper.is_admin(message.from_user.id):
         return
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -643,7 +791,7 @@ async def process_promo_codes(message: types.Message, state: FSMContext):
             )
             return
         
-        async with async_session() as session:
+        async with write_session() as session:
             created_count = 0
             failed_codes = []
             
@@ -695,7 +843,7 @@ async def process_promo_codes(message: types.Message, state: FSMContext):
 @router.callback_query(lambda c: c.data == "list_promos")
 async def show_promos(callback: types.CallbackQuery):
     """Показывает список всех промокодов"""
-    async with async_session() as session:
+    async with read_session() as session:
         promos = await session.scalars(
             select(PromoCode).order_by(PromoCode.created_at.desc())
         )
@@ -742,7 +890,7 @@ async def manage_disputes(callback: types.CallbackQuery):
         return
     
     try:
-        async with async_session() as session:
+        async with read_session() as session:
             # Получаем активные споры
             disputes = await session.scalars(
                 select(Dispute)
@@ -812,7 +960,7 @@ async def resolve_dispute(callback: types.CallbackQuery):
     try:
         dispute_id = int(callback.data.split(":")[1])
         
-        async with async_session() as session:
+        async with read_session() as session:
             dispute = await session.get(Dispute, dispute_id)
             if not dispute or dispute.status != "active":
                 await callback.answer("❌ Спор не найден или уже решен", show_alert=True)
@@ -871,7 +1019,7 @@ async def process_dispute_winner(callback: types.CallbackQuery):
         _, dispute_id, winner = callback.data.split(":")
         dispute_id = int(dispute_id)
         
-        async with async_session() as session:
+        async with write_session() as session:
             dispute = await session.get(Dispute, dispute_id)
             if not dispute or dispute.status != "active":
                 await callback.answer("❌ Спор не найден или уже решен", show_alert=True)
@@ -889,8 +1037,15 @@ async def process_dispute_winner(callback: types.CallbackQuery):
             winner_id = buyer.telegram_id if winner == "buyer" else seller.telegram_id
             winner_user = buyer if winner == "buyer" else seller
             
-            # Переводим средства победителю
-            winner_user.balance += transaction.amount
+            # Переводим средства победителю (txn_id исключает повторную выплату по спору)
+            await transfer(
+                session,
+                f"dispute:{dispute.id}",
+                SYSTEM_DISPUTES,
+                user_account(winner_id),
+                to_micro(transaction.amount),
+                "dispute"
+            )
             
             # Обновляем статусы
             dispute.status = "resolved"
@@ -938,7 +1093,7 @@ async def delete_promo(callback: types.CallbackQuery):
     try:
         promo_id = int(callback.data.split(":")[1])
         
-        async with async_session() as session:
+        async with write_session() as session:
             promo = await session.get(PromoCode, promo_id)
             if not promo:
                 await callback.answer("❌ Промокод не найден", show_alert=True)
@@ -972,7 +1127,7 @@ def register_admin_handlers(dp: Dispatcher):
 
 async def cmd_admin(message: Message):
     """Обработчик команды /admin"""
-    if message.from_user.id not in ADMIN_IDS:
+    if not gatekeeper.is_admin(message.from_user.id):
         await message.answer("У вас нет доступа к панели администратора.")
         return
     
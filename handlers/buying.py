@@ -2,14 +2,18 @@ from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
-from database.db import async_session
+from database.db import read_session
+from database.listings import get_listings_page, encode_cursor, LISTING_ORDERS
+from database.order_book import order_book, BookEntry
+from database.purchases import purchase_listing, PurchaseError
+from utils.keyboards import keyboards
 from database.models import User, PhoneListing, Transaction
 from datetime import datetime
 from sqlalchemy import select, and_
-from config import AVAILABLE_SERVICES
 from handlers.common import get_main_keyboard, check_user_registered
-from .services import available_services, get_services_keyboard
+from .services import services, SERVICE_BUTTON_PREFIX
 from log import logger
+from typing import Optional
 import logging
 from aiogram import Dispatcher
 from aiogram.filters import Command
@@ -24,40 +28,137 @@ class BuyingStates(StatesGroup):
     viewing_listings = State()
     confirming_purchase = State()
 
+@keyboards.static
 def get_filter_keyboard():
     keyboard = ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text="🔍 Поиск по сервису"), KeyboardButton(text="⏰ Поиск по времени")],
             [KeyboardButton(text="💰 Сначала дешевые"), KeyboardButton(text="💰 Сначала дорогие")],
-            [KeyboardButton(text="🔄 Сначала новые"), KeyboardButton(text="❌ Отмена")]
+            [KeyboardButton(text="🔄 Сначала новые"), KeyboardButton(text="⭐️ Сначала лучшие продавцы")],
+            [KeyboardButton(text="❌ Отмена")]
         ],
         resize_keyboard=True
     )
     return keyboard
 
-def get_listing_keyboard(listing_id: int):
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="✅ Купить", callback_data=f"buy_{listing_id}"),
-                InlineKeyboardButton(text="➡️ Следующий", callback_data="next_listing")
-            ]
-        ]
-    )
-    return keyboard
+@keyboards.static
+def _services_keyboard():
+    keyboard = []
+    for service_id, service_name in services.items():
+        keyboard.append([InlineKeyboardButton(
+            text=f"{SERVICE_BUTTON_PREFIX}{service_name}",
+            callback_data=f"buy_service:{service_id}"
+        )])
+    keyboard.append(catalogue_cancel_row())
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 def get_services_keyboard():
+    """
+    Клавиатура выбора сервиса с числом активных объявлений у каждого.
+    Счетчики берутся из книги объявлений за O(1) на сервис, без запросов
+    к базе; пока книга не загружена, отдается статичная клавиатура без них.
+    """
+    if not order_book.loaded:
+        return _services_keyboard()
     keyboard = []
-    for service_id, service_name in AVAILABLE_SERVICES.items():
+    for service_id, service_name in services.items():
         keyboard.append([InlineKeyboardButton(
-            text=f"📱 {service_name}",
+            text=f"{SERVICE_BUTTON_PREFIX}{service_name} ({order_book.count(service_id)})",
             callback_data=f"buy_service:{service_id}"
         )])
-    keyboard.append([InlineKeyboardButton(
+    keyboard.append(catalogue_cancel_row())
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+@keyboards.row
+def catalogue_refresh_row(service_key: str, order: str):
+    return [InlineKeyboardButton(
+        text="🔄 Обновить",
+        callback_data=f"lst:{service_key}:{order}"
+    )]
+
+@keyboards.row
+def catalogue_cancel_row():
+    return [InlineKeyboardButton(
         text="❌ Отмена",
         callback_data="buy_cancel"
-    )])
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+    )]
+
+def build_catalogue_page(listings, service, order: str, has_prev: bool, has_next: bool):
+    """Формирует текст и клавиатуру страницы каталога с навигацией по курсору"""
+    service_key = service or "*"
+    keyboard = []
+    for listing in listings:
+        text = f"💰 {listing.price:.2f} ROXY | ⏰ {listing.rental_period}ч | ⭐️ {listing.seller_rating:.1f}"
+        if service is None:
+            text = f"{services.label(listing.service)} | {text}"
+        keyboard.append([InlineKeyboardButton(
+            text=text,
+            callback_data=f"buy_listing:{listing.id}"
+        )])
+    
+    # Курсоры первой и последней записи страницы передаются в callback_data
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton(
+            text="⬅️ Назад",
+            callback_data=f"lst:{service_key}:{order}:p:{encode_cursor(listings[0], order)}"
+        ))
+    if has_next:
+        navigation.append(InlineKeyboardButton(
+            text="➡️ Далее",
+            callback_data=f"lst:{service_key}:{order}:n:{encode_cursor(listings[-1], order)}"
+        ))
+    if navigation:
+        keyboard.append(navigation)
+    
+    # Постоянные ряды берутся готовыми
+    keyboard.append(catalogue_refresh_row(service_key, order))
+    keyboard.append(catalogue_cancel_row())
+    
+    if service:
+        text = (
+            f"📱 Доступные номера для {services.label(service)}:\n"
+            "Выберите подходящий вариант:"
+        )
+    else:
+        text = (
+            "📱 Доступные номера для покупки:\n\n"
+            "Выберите номер из списка:"
+        )
+    return text, InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+async def load_catalogue_page(
+    user_id: int,
+    service=None,
+    order: str = "new",
+    after=None,
+    before=None
+):
+    """Загружает страницу каталога; возвращает None, если страница пуста"""
+    if order_book.loaded:
+        # Каталог отдается из книги объявлений без обращения к БД
+        listings, has_prev, has_next = order_book.page(
+            service=service,
+            exclude_seller_id=user_id,
+            order=order,
+            after=after,
+            before=before
+        )
+    else:
+        async with read_session() as session:
+            listings, has_prev, has_next = await get_listings_page(
+                session,
+                service=service,
+                exclude_seller_id=user_id,
+                order=order,
+                after=after,
+                before=before
+            )
+        listings = [BookEntry.from_listing(listing) for listing in listings]
+    
+    if not listings:
+        return None
+    return build_catalogue_page(listings, service, order, has_prev, has_next)
 
 # Функция для показа сервисов через сообщение
 async def show_services_message(message: types.Message, state: FSMContext):
@@ -77,66 +178,34 @@ async def show_services_callback(callback: types.CallbackQuery, state: FSMContex
         reply_markup=get_services_keyboard()
     )
 
-@router.message(F.text == "🛒 Купить номер")
-async def start_buying(message: types.Message, state: FSMContext):
+@router.message(F.text == "🛒 Купить номер", flags={"throttling_key": "catalogue"})
+async def start_buying(message: types.Message, state: FSMContext, user: Optional[User]):
     """Начинает процесс покупки номера"""
     try:
-        async with async_session() as session:
-            # Проверяем регистрацию пользователя
-            user = await session.get(User, message.from_user.id)
-            if not user:
-                await message.answer(
-                    "❌ Пожалуйста, сначала зарегистрируйтесь.",
-                    reply_markup=get_main_keyboard()
-                )
-                return
-            
-            # Получаем активные объявления
-            listings = await session.scalars(
-                select(PhoneListing)
-                .where(
-                    PhoneListing.is_active == True,
-                    PhoneListing.seller_id != message.from_user.id
-                )
-                .order_by(PhoneListing.created_at.desc())
+        # Проверяем регистрацию пользователя
+        if user is None:
+            await message.answer(
+                "❌ Пожалуйста, сначала зарегистрируйтесь.",
+                reply_markup=get_main_keyboard(message.from_user.id)
             )
-            listings = listings.all()
-            
-            if not listings:
-                await message.answer(
-                    "📭 Сейчас нет доступных номеров для покупки.",
-                    reply_markup=get_main_keyboard()
-                )
-                return
-            
-            # Формируем клавиатуру с объявлениями
-            keyboard = []
-            for listing in listings:
-                seller = await session.get(User, listing.seller_id)
-                if not seller:
-                    continue
-                    
-                keyboard.append([InlineKeyboardButton(
-                    text=f"{available_services[listing.service]} | {listing.phone_number} | {listing.price:.2f} ROXY",
-                    callback_data=f"buy_listing:{listing.id}"
-                )])
-            
-            keyboard.append([InlineKeyboardButton(
-                text="❌ Отмена",
-                callback_data="cancel_buying"
-            )])
-            
+            return
+        
+        page = await load_catalogue_page(message.from_user.id)
+        if not page:
             await message.answer(
-                "📱 Доступные номера для покупки:\n\n"
-                "Выберите номер из списка:",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+                "📭 Сейчас нет доступных номеров для покупки.",
+                reply_markup=get_main_keyboard(message.from_user.id)
             )
+            return
+        
+        text, keyboard = page
+        await message.answer(text, reply_markup=keyboard)
             
     except Exception as e:
         logger.error(f"Error in start_buying: {e}")
         await message.answer(
             "❌ Произошла ошибка при загрузке списка номеров.",
-            reply_markup=get_main_keyboard()
+            reply_markup=get_main_keyboard(message.from_user.id)
         )
 
 @router.callback_query(F.data == "buy_number")
@@ -172,61 +241,70 @@ async def cancel_buying(callback: types.CallbackQuery, state: FSMContext):
                 reply_markup=get_main_keyboard(callback.from_user.id)
             )
 
-@router.callback_query(lambda c: c.data.startswith("buy_service:"))
+@router.callback_query(lambda c: c.data.startswith("buy_service:"), flags={"throttling_key": "catalogue"})
 async def show_listings(callback: types.CallbackQuery, state: FSMContext):
     service = callback.data.split(":")[1]
+    if service not in services:
+        await callback.answer("❌ Неизвестный сервис", show_alert=True)
+        return
     
-    async with async_session() as session:
-        try:
-            query = select(PhoneListing).where(
-                and_(
-                    PhoneListing.service == service,
-                    PhoneListing.is_active == True
-                )
-            ).order_by(PhoneListing.created_at.desc())
-            
-            result = await session.execute(query)
-            listings = result.scalars().all()
-            
-            if not listings:
-                await callback.message.edit_text(
-                    f"😕 Сейчас нет доступных номеров для {available_services[service]}.\n"
-                    "Попробуйте позже или выберите другой сервис.",
-                    reply_markup=get_services_keyboard()
-                )
-                return
-            
-            keyboard = []
-            for listing in listings:
-                seller_query = select(User).where(User.telegram_id == listing.seller_id)
-                seller_result = await session.execute(seller_query)
-                seller = seller_result.scalar_one_or_none()
-                
-                if seller:
-                    keyboard.append([InlineKeyboardButton(
-                        text=f"💰 {listing.price} USDT | ⏰ {listing.rental_period}ч | ⭐️ {seller.rating:.1f}",
-                        callback_data=f"buy_listing:{listing.id}"
-                    )])
-            
-            keyboard.append([InlineKeyboardButton(
-                text="🔄 Обновить",
-                callback_data=f"buy_service:{service}"
-            )])
-            keyboard.append([InlineKeyboardButton(
-                text="❌ Отмена",
-                callback_data="buy_cancel"
-            )])
-            
+    try:
+        page = await load_catalogue_page(callback.from_user.id, service=service)
+        if not page:
             await callback.message.edit_text(
-                f"📱 Доступные номера для {available_services[service]}:\n"
-                "Выберите подходящий вариант:",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+                f"😕 Сейчас нет доступных номеров для {services.label(service)}.\n"
+                "Попробуйте позже или выберите другой сервис.",
+                reply_markup=get_services_keyboard()
             )
-        except Exception as e:
-            logger.error(f"Error showing listings: {e}")
-            await callback.answer("❌ Произошла ошибка при загрузке объявлений", show_alert=True)
-        finally:
-            await session.close()
+            return
+        
+        text, keyboard = page
+        await callback.message.edit_text(text, reply_markup=keyboard)
+    except Exception as e:
+        logger.error(f"Error showing listings: {e}")
+        await callback.answer("❌ Произошла ошибка при загрузке объявлений", show_alert=True)
+
+@router.callback_query(lambda c: c.data.startswith("lst:"), flags={"throttling_key": "catalogue"})
+async def show_listings_page(callback: types.CallbackQuery, state: FSMContext):
+    """Переход по страницам каталога: lst:<сервис>:<сортировка>[:<n|p>:<курсор>]"""
+    parts = callback.data.split(":", 4)
+    service = None if parts[1] == "*" else parts[1]
+    order = parts[2]
+    after = before = None
+    if order not in LISTING_ORDERS:
+        # Неизвестная сортировка (устаревшая кнопка) - показываем первую страницу по умолчанию
+        order = "new"
+    elif len(parts) == 5:
+        if parts[3] == "n":
+            after = parts[4]
+        else:
+            before = parts[4]
+    
+    try:
+        page = await load_catalogue_page(
+            callback.from_user.id,
+            service=service,
+            order=order,
+            after=after,
+            before=before
+        )
+        if not page and (after or before):
+            # Объявления на странице успели продать - возвращаемся к началу
+            page = await load_catalogue_page(callback.from_user.id, service=service, order=order)
+        
+        if not page:
+            await callback.message.edit_text(
+                "😕 Сейчас нет доступных номеров.\n"
+                "Попробуйте позже или выберите другой сервис.",
+                reply_markup=get_services_keyboard()
+            )
+            return
+        
+        text, keyboard = page
+        await callback.message.edit_text(text, reply_markup=keyboard)
+    except Exception as e:
+        logger.error(f"Error showing listings page: {e}")
+        await callback.answer("❌ Произошла ошибка при загрузке объявлений", show_alert=True)
 
 @router.callback_query(lambda c: c.data.startswith("buy_listing:"))
 async def process_buy(callback: types.CallbackQuery, state: FSMContext):
@@ -234,75 +312,58 @@ async def process_buy(callback: types.CallbackQuery, state: FSMContext):
     try:
         listing_id = int(callback.data.split(":")[1])
         
-        async with async_session() as session:
-            listing = await session.get(PhoneListing, listing_id)
-            if not listing or listing.is_active == False:
-                await callback.answer("❌ Объявление не найдено или уже продано", show_alert=True)
-                return
-            
-            buyer = await session.get(User, callback.from_user.id)
-            seller = await session.get(User, listing.seller_id)
-            
-            # Проверяем баланс покупателя
-            if buyer.balance < listing.price:
+        try:
+            purchase = await purchase_listing(listing_id, callback.from_user.id)
+        except PurchaseError as e:
+            if e.reason == PurchaseError.INSUFFICIENT_FUNDS:
                 await callback.answer(
                     f"❌ Недостаточно средств на балансе\n"
-                    f"Требуется: {listing.price:.2f} ROXY\n"
-                    f"Ваш баланс: {buyer.balance:.2f} ROXY",
+                    f"Требуется: {e.price:.2f} ROXY\n"
+                    f"Ваш баланс: {e.balance:.2f} ROXY",
                     show_alert=True
                 )
-                return
-            
-            # Создаем транзакцию
-            transaction = Transaction(
-                listing_id=listing.id,
-                buyer_id=buyer.telegram_id,
-                seller_id=seller.telegram_id,
-                amount=listing.price,
-                status="completed"
-            )
-            session.add(transaction)
-            
-            # Обновляем балансы
-            buyer.balance -= listing.price
-            seller.balance += listing.price
-            
-            # Деактивируем объявление
-            listing.is_active = False
-            
-            await session.commit()
-            
-            # Уведомляем покупателя
-            buyer_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="⚖️ Открыть спор", callback_data=f"open_dispute:{transaction.id}")],
-                [InlineKeyboardButton(text="⭐️ Оставить отзыв", callback_data=f"leave_review:{transaction.id}")]
-            ])
-            
-            await callback.message.edit_text(
-                f"✅ Номер успешно куплен!\n\n"
-                f"Сервис: {available_services[listing.service]}\n"
-                f"Цена: {listing.price:.2f} ROXY\n"
-                f"Продавец: @{seller.username or 'Пользователь'}\n\n"
-                "Вы можете связаться с продавцом напрямую через его профиль.",
-                reply_markup=buyer_keyboard
-            )
-            
-            # Уведомляем продавца
-            seller_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="📱 Отправить номер", callback_data=f"send_number:{transaction.id}")],
-                [InlineKeyboardButton(text="⭐️ Оставить отзыв", callback_data=f"leave_review:{transaction.id}")]
-            ])
-            
-            await callback.bot.send_message(
-                seller.telegram_id,
-                f"💰 Ваш номер был куплен!\n\n"
-                f"Сервис: {available_services[listing.service]}\n"
-                f"Цена: {listing.price:.2f} ROXY\n"
-                f"Покупатель: @{buyer.username or 'Пользователь'}\n\n"
-                "Вы можете связаться с покупателем напрямую через его профиль.",
-                reply_markup=seller_keyboard
-            )
-            
+            elif e.reason == PurchaseError.OWN_LISTING:
+                await callback.answer("❌ Нельзя купить собственное объявление", show_alert=True)
+            elif e.reason == PurchaseError.NOT_REGISTERED:
+                await callback.answer("❌ Пожалуйста, сначала зарегистрируйтесь с помощью команды /start", show_alert=True)
+            else:
+                await callback.answer("❌ Объявление не найдено или уже продано", show_alert=True)
+            return
+        
+        listing, buyer, seller = purchase.listing, purchase.buyer, purchase.seller
+        transaction = purchase.transaction
+        
+        # Уведомляем покупателя
+        buyer_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="⚖️ Открыть спор", callback_data=f"open_dispute:{transaction.id}")],
+            [InlineKeyboardButton(text="⭐️ Оставить отзыв", callback_data=f"leave_review:{transaction.id}")]
+        ])
+        
+        await callback.message.edit_text(
+            f"✅ Номер успешно куплен!\n\n"
+            f"Сервис: {services.label(listing.service)}\n"
+            f"Цена: {listing.price:.2f} ROXY\n"
+            f"Продавец: @{seller.username or 'Пользователь'}\n\n"
+            "Вы можете связаться с продавцом напрямую через его профиль.",
+            reply_markup=buyer_keyboard
+        )
+        
+        # Уведомляем продавца
+        seller_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="📱 Отправить номер", callback_data=f"send_number:{transaction.id}")],
+            [InlineKeyboardButton(text="⭐️ Оставить отзыв", callback_data=f"leave_review:{transaction.id}")]
+        ])
+        
+        await callback.bot.send_message(
+            seller.telegram_id,
+            f"💰 Ваш номер был куплен!\n\n"
+            f"Сервис: {services.label(listing.service)}\n"
+            f"Цена: {listing.price:.2f} ROXY\n"
+            f"Покупатель: @{buyer.username or 'Пользователь'}\n\n"
+            "Вы можете связаться с покупателем напрямую через его профиль.",
+            reply_markup=seller_keyboard
+        )
+        
     except Exception as e:
         logger.error(f"Error in process_buy: {e}")
         await callback.answer("❌ Произошла ошибка при покупке номера", show_alert=True)
@@ -311,7 +372,7 @@ async def process_buy(callback: types.CallbackQuery, state: FSMContext):
 async def get_number(callback: types.CallbackQuery):
     transaction_id = int(callback.data.split(":")[1])
     
-    async with async_session() as session:
+    async with read_session() as session:
         try:
             transaction = await session.get(Transaction, transaction_id)
             if not transaction or transaction.buyer_id != callback.from_user.id:
@@ -343,7 +404,7 @@ async def get_number(callback: types.CallbackQuery):
             try:
                 await callback.bot.send_message(
                     seller.telegram_id,
-                    f"📱 Покупатель запросил номер для {available_services[listing.service]}.\n"
+                    f"📱 Покупатель запросил номер для {services.label(listing.service)}.\n"
                     f"Пожалуйста, отправьте номер телефона в чате:\n{chat_link}",
                     reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
                         InlineKeyboardButton(text="💬 Перейти в чат", url=chat_link)
@@ -354,7 +415,7 @@ async def get_number(callback: types.CallbackQuery):
             
             await callback.message.edit_text(
                 f"✅ Запрос на получение номера отправлен продавцу!\n\n"
-                f"Сервис: {available_services[listing.service]}\n"
+                f"Сервис: {services.label(listing.service)}\n"
                 f"Продавец: @{seller.username or 'Пользователь'}\n\n"
                 "Вы можете общаться с продавцом в отдельном чате:",
                 reply_markup=chat_keyboard
@@ -368,7 +429,7 @@ async def get_number(callback: types.CallbackQuery):
 async def send_number(callback: types.CallbackQuery):
     transaction_id = int(callback.data.split(":")[1])
     
-    async with async_session() as session:
+    async with read_session() as session:
         try:
             transaction = await session.get(Transaction, transaction_id)
             if not transaction or transaction.seller_id != callback.from_user.id:
@@ -386,7 +447,7 @@ async def send_number(callback: types.CallbackQuery):
             try:
                 await callback.bot.send_message(
                     buyer.telegram_id,
-                    f"📱 Вот ваш номер для {available_services[listing.service]}:\n"
+                    f"📱 Вот ваш номер для {services.label(listing.service)}:\n"
                     f"{listing.phone_number}\n\n"
                     "Спасибо за покупку! 🎉"
                 )
@@ -406,123 +467,68 @@ async def send_number(callback: types.CallbackQuery):
 
 @router.message(F.text == "🔍 Поиск по сервису")
 async def search_by_service(message: types.Message, state: FSMContext):
-    from handlers.selling import get_services_keyboard
     await state.set_state(BuyingStates.choosing_service)
     await message.answer(
         "📱 Выберите сервис:",
         reply_markup=get_services_keyboard()
     )
 
-@router.message(BuyingStates.choosing_service)
+@router.message(BuyingStates.choosing_service, flags={"throttling_key": "catalogue"})
 async def process_service_choice(message: types.Message, state: FSMContext):
-    from handlers.selling import available_services
-    
     if message.text == "❌ Отмена":
         await state.clear()
         from handlers.common import get_main_keyboard
-        await message.answer("Операция отменена.", reply_markup=get_main_keyboard())
+        await message.answer("Операция отменена.", reply_markup=get_main_keyboard(message.from_user.id))
         return
 
-    if message.text not in available_services:
+    # Сервис можно ввести названием, ID или текстом кнопки
+    service = services.resolve(message.text)
+    if service is None:
         await message.answer("❌ Пожалуйста, выберите сервис из списка.")
         return
 
-    async with async_session() as session:
-        query = select(PhoneListing).where(
-            and_(
-                PhoneListing.service == message.text,
-                PhoneListing.is_active == True
-            )
-        ).order_by(PhoneListing.created_at.desc())
-        
-        result = await session.execute(query)
-        listings = result.scalars().all()
-
-        if not listings:
-            await message.answer(
-                "😕 К сожалению, сейчас нет доступных номеров для этого сервиса.\n"
-                "Попробуйте позже или выберите другой сервис."
-            )
-            return
-
-        await state.update_data(current_listing_index=0, listings=[listing.id for listing in listings])
-        await show_listing(message, state, listings[0])
-
-async def show_listing(message: types.Message, state: FSMContext, listing: PhoneListing):
-    async with async_session() as session:
-        seller = await session.get(User, listing.seller_id)
-        
+    page = await load_catalogue_page(message.from_user.id, service=service)
+    if not page:
         await message.answer(
-            f"📱 Номер для {listing.service}\n\n"
-            f"⏰ Длительность: {listing.duration} час(ов)\n"
-            f"💰 Цена: {listing.price} USDT\n"
-            f"👤 Продавец: {seller.username or 'Аноним'}\n"
-            f"⭐️ Рейтинг продавца: {seller.rating}\n"
-            f"📅 Размещено: {listing.created_at.strftime('%d.%m.%Y %H:%M')}",
-            reply_markup=get_listing_keyboard(listing.id)
+            "😕 К сожалению, сейчас нет доступных номеров для этого сервиса.\n"
+            "Попробуйте позже или выберите другой сервис."
         )
-
-@router.callback_query(lambda c: c.data == 'next_listing')
-async def show_next_listing(callback: types.CallbackQuery, state: FSMContext):
-    data = await state.get_data()
-    current_index = data.get('current_listing_index', 0)
-    listings = data.get('listings', [])
-    
-    if current_index + 1 >= len(listings):
-        await callback.answer("Это последнее предложение в списке.")
         return
-    
-    current_index += 1
-    await state.update_data(current_listing_index=current_index)
-    
-    async with async_session() as session:
-        listing = await session.get(PhoneListing, listings[current_index])
-        if listing:
-            await show_listing(callback.message, state, listing)
 
-@router.message(F.text == "💰 Сначала дешевые")
+    text, keyboard = page
+    await message.answer(text, reply_markup=keyboard)
+
+@router.message(F.text == "💰 Сначала дешевые", flags={"throttling_key": "catalogue"})
 async def sort_by_price_asc(message: types.Message, state: FSMContext):
-    async with async_session() as session:
-        query = select(PhoneListing).where(
-            PhoneListing.is_active == True
-        ).order_by(PhoneListing.price.asc())
-        
-        await process_sorted_listings(message, state, session, query)
+    await process_sorted_listings(message, state, "price_asc")
 
-@router.message(F.text == "💰 Сначала дорогие")
+@router.message(F.text == "💰 Сначала дорогие", flags={"throttling_key": "catalogue"})
 async def sort_by_price_desc(message: types.Message, state: FSMContext):
-    async with async_session() as session:
-        query = select(PhoneListing).where(
-            PhoneListing.is_active == True
-        ).order_by(PhoneListing.price.desc())
-        
-        await process_sorted_listings(message, state, session, query)
+    await process_sorted_listings(message, state, "price_desc")
 
-@router.message(F.text == "🔄 Сначала новые")
+@router.message(F.text == "🔄 Сначала новые", flags={"throttling_key": "catalogue"})
 async def sort_by_date(message: types.Message, state: FSMContext):
-    async with async_session() as session:
-        query = select(PhoneListing).where(
-            PhoneListing.is_active == True
-        ).order_by(PhoneListing.created_at.desc())
-        
-        await process_sorted_listings(message, state, session, query)
+    await process_sorted_listings(message, state, "new")
 
-async def process_sorted_listings(message: types.Message, state: FSMContext, session, query):
-    result = await session.execute(query)
-    listings = result.scalars().all()
-    
-    if not listings:
+@router.message(F.text == "⭐️ Сначала лучшие продавцы", flags={"throttling_key": "catalogue"})
+async def sort_by_reputation(message: types.Message, state: FSMContext):
+    await process_sorted_listings(message, state, "best")
+
+async def process_sorted_listings(message: types.Message, state: FSMContext, order: str):
+    page = await load_catalogue_page(message.from_user.id, order=order)
+    if not page:
         await message.answer("😕 Сейчас нет доступных предложений.")
         return
     
-    await state.update_data(current_listing_index=0, listings=[listing.id for listing in listings])
-    await show_listing(message, state, listings[0])
+    text, keyboard = page
+    await message.answer(text, reply_markup=keyboard)
 
 @router.callback_query(F.data.startswith("buy_listing_"))
-async def confirm_purchase(callback: types.CallbackQuery, state: FSMContext):
+async def confirm_purchase(callback: types.CallbackQuery, state: FSMContext, user: Optional[User]):
     listing_id = int(callback.data.split("_")[2])
+    buyer = user
     
-    async with async_session() as session:
+    async with read_session() as session:
         # Получаем объявление
         query = select(PhoneListing).where(PhoneListing.id == listing_id)
         result = await session.execute(query)
@@ -532,12 +538,7 @@ async def confirm_purchase(callback: types.CallbackQuery, state: FSMContext):
             await callback.answer("❌ Это объявление уже неактивно", show_alert=True)
             return
         
-        # Получаем покупателя
-        buyer_query = select(User).where(User.telegram_id == callback.from_user.id)
-        result = await session.execute(buyer_query)
-        buyer = result.scalar_one_or_none()
-        
-        if not buyer:
+        if buyer is None:
             await callback.answer("❌ Вы не зарегистрированы", show_alert=True)
             return
             
@@ -570,7 +571,7 @@ async def confirm_purchase(callback: types.CallbackQuery, state: FSMContext):
         
         await callback.message.edit_text(
             f"📱 Подтверждение покупки:\n\n"
-            f"Сервис: {available_services[listing.service]}\n"
+            f"Сервис: {services.label(listing.service)}\n"
             f"Номер: {listing.phone_number}\n"
             f"Срок аренды: {listing.rental_period} часов\n"
             f"Цена: {listing.price}₽\n\n"
@@ -582,78 +583,46 @@ async def confirm_purchase(callback: types.CallbackQuery, state: FSMContext):
 async def process_purchase(callback: types.CallbackQuery, state: FSMContext):
     listing_id = int(callback.data.split("_")[2])
     
-    async with async_session() as session:
-        # Получаем объявление и проверяем его актуальность
-        query = select(PhoneListing).where(PhoneListing.id == listing_id)
-        result = await session.execute(query)
-        listing = result.scalar_one_or_none()
-        
-        if not listing or not listing.is_active:
+    try:
+        purchase = await purchase_listing(listing_id, callback.from_user.id)
+    except PurchaseError as e:
+        if e.reason == PurchaseError.INSUFFICIENT_FUNDS:
+            await callback.answer("❌ Недостаточно средств на балансе", show_alert=True)
+        elif e.reason == PurchaseError.OWN_LISTING:
+            await callback.answer("❌ Нельзя купить собственное объявление", show_alert=True)
+        elif e.reason == PurchaseError.NOT_REGISTERED:
+            await callback.answer("❌ Ошибка: пользователь не найден", show_alert=True)
+        else:
             await callback.answer("❌ Это объявление уже неактивно", show_alert=True)
-            return
-        
-        # Получаем покупателя и продавца
-        buyer_query = select(User).where(User.telegram_id == callback.from_user.id)
-        seller_query = select(User).where(User.telegram_id == listing.seller_id)
-        
-        result = await session.execute(buyer_query)
-        buyer = result.scalar_one_or_none()
+        return
+    except Exception as e:
+        logger.error(f"Error processing purchase: {e}")
+        await callback.answer("❌ Произошла ошибка при обработке покупки", show_alert=True)
+        return
+    
+    listing, seller = purchase.listing, purchase.seller
+    
+    try:
+        # Отправляем уведомления
+        await callback.bot.send_message(
+            seller.telegram_id,
+            f"💰 Ваш номер {listing.phone_number} был куплен!\n"
+            f"Сумма: {listing.price}₽"
+        )
         
-        result = await session.execute(seller_query)
-        seller = result.scalar_one_or_none()
+        await callback.message.edit_text(
+            "✅ Покупка успешно совершена!\n\n"
+            f"Номер телефона: {listing.phone_number}\n"
+            f"Сервис: {services.label(listing.service)}\n"
+            f"Срок аренды: {listing.rental_period} часов\n"
+            f"Сумма: {listing.price}₽\n\n"
+            "Спасибо за покупку! 🎉"
+        )
         
-        if not buyer or not seller:
-            await callback.answer("❌ Ошибка: пользователь не найден", show_alert=True)
-            return
-            
-        if buyer.balance < listing.price:
-            await callback.answer("❌ Недостаточно средств на балансе", show_alert=True)
-            return
+        await state.clear()
         
-        try:
-            # Создаем транзакцию
-            transaction = Transaction(
-                buyer_id=buyer.telegram_id,
-                seller_id=seller.telegram_id,
-                listing_id=listing.id,
-                amount=listing.price,
-                status="completed",
-                created_at=datetime.utcnow(),
-                completed_at=datetime.utcnow()
-            )
-            session.add(transaction)
-            
-            # Обновляем балансы
-            buyer.balance -= listing.price
-            seller.balance += listing.price
-            
-            # Деактивируем объявление
-            listing.is_active = False
-            
-            await session.commit()
-            
-            # Отправляем уведомления
-            await callback.bot.send_message(
-                seller.telegram_id,
-                f"💰 Ваш номер {listing.phone_number} был куплен!\n"
-                f"Сумма: {listing.price}₽"
-            )
-            
-            await callback.message.edit_text(
-                "✅ Покупка успешно совершена!\n\n"
-                f"Номер телефона: {listing.phone_number}\n"
-                f"Сервис: {available_services[listing.service]}\n"
-                f"Срок аренды: {listing.rental_period} часов\n"
-                f"Сумма: {listing.price}₽\n\n"
-                "Спасибо за покупку! 🎉"
-            )
-            
-            await state.clear()
-            
-        except Exception as e:
-            logger.error(f"Error processing purchase: {e}")
-            await session.rollback()
-            await callback.answer("❌ Произошла ошибка при обработке покупки", show_alert=True)
+    except Exception as e:
+        logger.error(f"Error notifying about purchase: {e}")
 
 @router.callback_query(F.data == "cancel_buy")
 async def cancel_purchase(callback: types.CallbackQuery, state: FSMContext):
@@ -671,18 +640,16 @@ async def back_to_services(callback: types.CallbackQuery, state: FSMContext):
         reply_markup=get_services_keyboard()
     )
 
-async def cmd_buy(message: Message, state: FSMContext):
+async def cmd_buy(message: Message, state: FSMContext, user: Optional[User]):
     """Обработчик команды /buy"""
     try:
-        async with async_session() as session:
-            user = await session.get(User, message.from_user.id)
-            if not user:
-                await message.answer("Пожалуйста, сначала зарегистрируйтесь с помощью команды /start")
-                return
-            
-            # Здесь будет логика покупки номера
-            await message.answer("Выберите сервис для покупки номера:")
-            # TODO: Добавить клавиатуру с сервисами
+        if user is None:
+            await message.answer("Пожалуйста, сначала зарегистрируйтесь с помощью команды /start")
+            return
+        
+        # Здесь будет логика покупки номера
+        await message.answer("Выберите сервис для покупки номера:")
+        # TODO: Добавить клавиатуру с сервисами
     except Exception as e:
         logger.error(f"Ошибка при обработке команды /buy: {e}")
         await message.answer("Произошла ошибка. Пожалуйста, попробуйте позже.")
@@ -1,8 +1,17 @@
 from aiogram import Router, types, Dispatcher, F
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram.fsm.context import FSMContext
-from database.db import async_session
+from database.db import read_session, write_session
 from database.models import User, Transaction, Review, PromoCode, Dispute, PhoneListing
+from database.order_book import order_book
+from database.gatekeeper import gatekeeper
+from utils.keyboards import keyboards
+from handlers.services import services
+from database.ratings import add_rating
+from database.user_cache import user_cache, mark_user_changed
+from utils.payouts import payout_queue
+from database.ledger import transfer, user_account, to_micro, InsufficientFunds, SYSTEM_PROMO
+from typing import Optional
 from sqlalchemy import select, or_, func
 from config import ADMIN_IDS
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -19,7 +28,11 @@ class UserStates(StatesGroup):
     entering_withdrawal_amount = State()
     entering_usdt_address = State()
 
-def get_main_keyboard(user_id: int = None):
+def get_main_keyboard(user_id: int):
+    return _main_keyboard(gatekeeper.is_admin(user_id))
+
+@keyboards.static
+def _main_keyboard(is_admin: bool):
     keyboard = [
         [
             KeyboardButton(text="📱 Купить номер"),
@@ -39,17 +52,19 @@ def get_main_keyboard(user_id: int = None):
         ]
     ]
     
-    if user_id in ADMIN_IDS:
+    if is_admin:
         keyboard.append([KeyboardButton(text="👑 Админ панель")])
     
     return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
 
+@keyboards.static
 def get_start_keyboard():
     return ReplyKeyboardMarkup(
         keyboard=[[KeyboardButton(text="🔄 Начать регистрацию")]],
         resize_keyboard=True
     )
 
+@keyboards.static
 def get_admin_keyboard():
     keyboard = [
         [
@@ -64,17 +79,17 @@ def get_admin_keyboard():
     return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
 
 async def check_user_registered(user_id: int) -> bool:
-    async with async_session() as session:
-        query = select(User).where(User.telegram_id == user_id)
-        result = await session.execute(query)
-        user = result.scalar_one_or_none()
-        return user is not None
+    """
+    Проверка регистрации для кода вне обработчиков; обработчики получают
+    пользователя аргументом user от UserMiddleware
+    """
+    return await user_cache.get(user_id) is not None
 
 @router.message(Command("start"))
 async def cmd_start(message: Message):
     """Обработчик команды /start"""
     try:
-        async with async_session() as session:
+        async with write_session() as session:
             user = await session.get(User, message.from_user.id)
             
             if not user:
@@ -82,11 +97,12 @@ async def cmd_start(message: Message):
                     telegram_id=message.from_user.id,
                     username=message.from_user.username,
                     created_at=datetime.utcnow(),
-                    balance=0.0,
                     rating=5.0,
                     is_blocked=False
                 )
                 session.add(user)
+                # Сбрасываем закэшированное "не зарегистрирован"
+                mark_user_changed(session, user.telegram_id)
                 await session.commit()
                 
                 await message.answer(
@@ -131,18 +147,16 @@ async def cmd_help(message: Message):
     await message.answer(help_text)
 
 @router.message(lambda message: message.text == "👤 Профиль")
-async def show_profile(message: Message):
-    async with async_session() as session:
-        user = await session.get(User, message.from_user.id)
-        
-        if not user:
-            await message.answer(
-                "❌ Вы не зарегистрированы!\n"
-                "Пожалуйста, пройдите регистрацию:",
-                reply_markup=get_start_keyboard()
-            )
-            return
-        
+async def show_profile(message: Message, user: Optional[User]):
+    if user is None:
+        await message.answer(
+            "❌ Вы не зарегистрированы!\n"
+            "Пожалуйста, пройдите регистрацию:",
+            reply_markup=get_start_keyboard()
+        )
+        return
+    
+    async with read_session() as session:
         tx_query = select(Transaction).where(
             or_(
                 Transaction.buyer_id == user.telegram_id,
@@ -155,16 +169,12 @@ async def show_profile(message: Message):
         sold_count = len([tx for tx in transactions if tx.seller_id == user.telegram_id and tx.status == "completed"])
         bought_count = len([tx for tx in transactions if tx.buyer_id == user.telegram_id and tx.status == "completed"])
         
-        reviews_query = select(Review).where(Review.reviewed_id == user.telegram_id)
-        reviews_result = await session.execute(reviews_query)
-        reviews_count = len(reviews_result.scalars().all())
-        
         await message.answer(
             f"📊 Ваш профиль:\n"
             f"ID: {user.telegram_id}\n"
             f"Телефон: {user.phone_number}\n"
             f"Рейтинг: {'⭐️' * round(user.rating)} ({user.rating:.1f})\n"
-            f"Количество отзывов: {reviews_count}\n"
+            f"Количество отзывов: {user.total_reviews}\n"
             f"Баланс: {user.balance} USDT\n"
             f"Продано номеров: {sold_count}\n"
             f"Куплено номеров: {bought_count}\n"
@@ -173,18 +183,17 @@ async def show_profile(message: Message):
         )
 
 @router.message(F.text == "💳 Баланс")
-async def show_balance(message: types.Message):
+async def show_balance(message: types.Message, user: Optional[User]):
     """Показывает баланс пользователя"""
     try:
-        async with async_session() as session:
-            user = await session.get(User, message.from_user.id)
-            if not user:
-                await message.answer(
-                    "❌ Пожалуйста, сначала зарегистрируйтесь.",
-                    reply_markup=get_main_keyboard()
-                )
-                return
-            
+        if user is None:
+            await message.answer(
+                "❌ Пожалуйста, сначала зарегистрируйтесь.",
+                reply_markup=get_main_keyboard(message.from_user.id)
+            )
+            return
+        
+        async with read_session() as session:
             # Получаем статистику транзакций
             transactions_query = select(Transaction).where(
                 or_(
@@ -209,17 +218,17 @@ async def show_balance(message: types.Message):
             response += "🎮 Вы также можете получить бесплатные ROXY в нашей кликер-игре!\n"
             response += "@roxortcoin_bot"
             
-            await message.answer(response, reply_markup=get_main_keyboard())
+            await message.answer(response, reply_markup=get_main_keyboard(message.from_user.id))
     except Exception as e:
         logger.error(f"Error in show_balance: {e}")
         await message.answer(
             "❌ Произошла ошибка при получении баланса.",
-            reply_markup=get_main_keyboard()
+            reply_markup=get_main_keyboard(message.from_user.id)
         )
 
-@router.message(lambda message: message.text == "📱 Купить номер")
-async def start_buying(message: Message, state: FSMContext):
-    if not await check_user_registered(message.from_user.id):
+@router.message(lambda message: message.text == "📱 Купить номер", flags={"throttling_key": "catalogue"})
+async def start_buying(message: Message, state: FSMContext, user: Optional[User]):
+    if user is None:
         await message.answer(
             "❌ Вы не зарегистрированы!\n"
             "Пожалуйста, пройдите регистрацию сначала.",
@@ -231,8 +240,8 @@ async def start_buying(message: Message, state: FSMContext):
     await show_services_message(message, state)
 
 @router.message(lambda message: message.text == "📱 Продать номер")
-async def handle_sell(message: Message, state: FSMContext):
-    if not await check_user_registered(message.from_user.id):
+async def handle_sell(message: Message, state: FSMContext, user: Optional[User]):
+    if user is None:
         await message.answer(
             "❌ Вы не зарегистрированы!\n"
             "Пожалуйста, пройдите регистрацию сначала.",
@@ -244,8 +253,8 @@ async def handle_sell(message: Message, state: FSMContext):
     await start_selling(message, state)
 
 @router.message(lambda message: message.text == "💸 Вывести средства")
-async def handle_withdraw(message: Message, state: FSMContext):
-    if not await check_user_registered(message.from_user.id):
+async def handle_withdraw(message: Message, state: FSMContext, user: Optional[User]):
+    if user is None:
         await message.answer(
             "❌ Вы не зарегистрированы!\n"
             "Пожалуйста, пройдите регистрацию сначала.",
@@ -253,15 +262,13 @@ async def handle_withdraw(message: Message, state: FSMContext):
         )
         return
     
-    async with async_session() as session:
-        user = await session.get(User, message.from_user.id)
-        if user.balance < 10:
-            await message.answer(
-                "❌ Недостаточно средств для вывода.\n"
-                "Минимальная сумма вывода: 10 USDT",
-                reply_markup=get_main_keyboard(message.from_user.id)
-            )
-            return
+    if user.balance < 10:
+        await message.answer(
+            "❌ Недостаточно средств для вывода.\n"
+            "Минимальная сумма вывода: 10 USDT",
+            reply_markup=get_main_keyboard(message.from_user.id)
+        )
+        return
     
     await state.set_state("withdraw_amount")
     await message.answer(
@@ -276,7 +283,7 @@ async def handle_withdraw(message: Message, state: FSMContext):
 async def show_disputes(message: types.Message):
     """Показывает список активных споров"""
     try:
-        async with async_session() as session:
+        async with read_session() as session:
             # Получаем споры, где пользователь является участником
             disputes = await session.scalars(
                 select(Dispute).where(
@@ -291,7 +298,7 @@ async def show_disputes(message: types.Message):
             if not disputes:
                 await message.answer(
                     "📋 У вас нет активных споров.",
-                    reply_markup=get_main_keyboard()
+                    reply_markup=get_main_keyboard(message.from_user.id)
                 )
                 return
             
@@ -318,7 +325,7 @@ async def show_disputes(message: types.Message):
                 text += (
                     f"ID спора: {dispute.id}\n"
                     f"Роль: {role}\n"
-                    f"Сервис: {available_services[listing.service]}\n"
+                    f"Сервис: {services.label(listing.service)}\n"
                     f"Сумма: {transaction.amount:.2f} ROXY\n"
                     f"Оппонент: @{other_party.username or 'Пользователь'}\n"
                     f"Статус: {dispute.status}\n\n"
@@ -339,12 +346,12 @@ async def show_disputes(message: types.Message):
         logger.error(f"Error in show_disputes: {e}")
         await message.answer(
             "❌ Произошла ошибка при получении списка споров.",
-            reply_markup=get_main_keyboard()
+            reply_markup=get_main_keyboard(message.from_user.id)
         )
 
 @router.message(lambda message: message.text == "⭐️ Отзывы")
-async def handle_reviews(message: Message):
-    if not await check_user_registered(message.from_user.id):
+async def handle_reviews(message: Message, user: Optional[User]):
+    if user is None:
         await message.answer(
             "❌ Вы не зарегистрированы!\n"
             "Пожалуйста, пройдите регистрацию сначала.",
@@ -357,7 +364,7 @@ async def handle_reviews(message: Message):
 
 @router.message(lambda message: message.text == "🔑 Панель администратора")
 async def handle_admin_panel(message: Message):
-    if message.from_user.id not in ADMIN_IDS:
+    if not gatekeeper.is_admin(message.from_user.id):
         await message.answer(
             "❌ У вас нет доступа к панели администратора.",
             reply_markup=get_main_keyboard(message.from_user.id)
@@ -393,25 +400,23 @@ async def handle_withdraw_amount(message: Message, state: FSMContext):
             )
             return
         
-        async with async_session() as session:
-            user = await session.get(User, message.from_user.id)
-            if user.balance < amount:
-                await message.answer(
-                    "❌ Недостаточно средств на балансе.\n"
-                    "Попробуйте другую сумму:",
-                    reply_markup=ReplyKeyboardMarkup(
-                        keyboard=[[KeyboardButton(text="❌ Отмена")]],
-                        resize_keyboard=True
-                    )
+        # Сумма удерживается до решения администратора, перевод выполнит очередь выплат
+        try:
+            payout = await payout_queue.enqueue(message.from_user.id, to_micro(amount), approve=False)
+        except InsufficientFunds:
+            await message.answer(
+                "❌ Недостаточно средств на балансе.\n"
+                "Попробуйте другую сумму:",
+                reply_markup=ReplyKeyboardMarkup(
+                    keyboard=[[KeyboardButton(text="❌ Отмена")]],
+                    resize_keyboard=True
                 )
-                return
-            
-            user.balance -= amount
-            await session.commit()
+            )
+            return
         
         await state.clear()
         await message.answer(
-            f"✅ Заявка на вывод {amount} USDT создана.\n"
+            f"✅ Заявка на вывод #{payout.id} на {amount} USDT создана.\n"
             "Администратор проверит и обработает её в ближайшее время.",
             reply_markup=get_main_keyboard(message.from_user.id)
         )
@@ -426,12 +431,12 @@ async def handle_withdraw_amount(message: Message, state: FSMContext):
         )
 
 @router.message(F.text == "🎁 Активировать промокод")
-async def activate_promo(message: types.Message, state: FSMContext):
-    if not await check_user_registered(message.from_user.id):
+async def activate_promo(message: types.Message, state: FSMContext, user: Optional[User]):
+    if user is None:
         await message.answer(
             "❌ Вы не зарегистрированы!\n"
             "Пожалуйста, пройдите регистрацию:",
-            reply_markup=get_main_keyboard()
+            reply_markup=get_main_keyboard(message.from_user.id)
         )
         return
     
@@ -450,7 +455,7 @@ async def process_promo(message: types.Message, state: FSMContext):
     """Обрабатывает ввод промокода"""
     code = message.text.upper()
     
-    async with async_session() as session:
+    async with write_session() as session:
         # Проверяем промокод
         promo = await session.scalar(
             select(PromoCode).where(PromoCode.code == code)
@@ -498,9 +503,22 @@ async def process_promo(message: types.Message, state: FSMContext):
             await state.clear()
             return
         
-        # Активируем промокод
-        user = await session.get(User, message.from_user.id)
-        user.balance += promo.amount
+        # Активируем промокод (txn_id не дает начислить один промокод дважды)
+        credited = await transfer(
+            session,
+            f"promo:{promo.id}:{message.from_user.id}",
+            SYSTEM_PROMO,
+            user_account(message.from_user.id),
+            to_micro(promo.amount),
+            "promo"
+        )
+        if not credited:
+            await message.answer(
+                "❌ Вы уже использовали этот промокод.",
+                reply_markup=get_main_keyboard(message.from_user.id)
+            )
+            await state.clear()
+            return
         promo.current_uses += 1
         promo.used_by = message.from_user.id
         
@@ -527,28 +545,26 @@ async def cancel_promo(callback: types.CallbackQuery, state: FSMContext):
     )
 
 @router.message(F.text == "💳 Вывод в USDT")
-async def start_withdraw(message: types.Message, state: FSMContext):
-    if not await check_user_registered(message.from_user.id):
+async def start_withdraw(message: types.Message, state: FSMContext, user: Optional[User]):
+    if user is None:
         await message.answer(
             "❌ Вы не зарегистрированы!\n"
             "Пожалуйста, пройдите регистрацию:",
-            reply_markup=get_main_keyboard()
+            reply_markup=get_main_keyboard(message.from_user.id)
         )
         return
     
-    async with async_session() as session:
-        user = await session.get(User, message.from_user.id)
-        if user.balance < 100:
-            response = "❌ Минимальная сумма для вывода: 100 ROXY\n"
-            response += f"Ваш баланс: {user.balance} ROXY\n\n"
-            response += "🎮 Вы также можете получить бесплатные ROXY в нашей кликер-игре!\n"
-            response += "@roxortcoin_bot"
-            
-            await message.answer(
-                response,
-                reply_markup=get_main_keyboard(message.from_user.id)
-            )
-            return
+    if user.balance < 100:
+        response = "❌ Минимальная сумма для вывода: 100 ROXY\n"
+        response += f"Ваш баланс: {user.balance} ROXY\n\n"
+        response += "🎮 Вы также можете получить бесплатные ROXY в нашей кликер-игре!\n"
+        response += "@roxortcoin_bot"
+        
+        await message.answer(
+            response,
+            reply_markup=get_main_keyboard(message.from_user.id)
+        )
+        return
     
     await message.answer(
         "Введите сумму для вывода в ROXY (минимум 100):\n\n"
@@ -561,7 +577,7 @@ async def start_withdraw(message: types.Message, state: FSMContext):
     await state.set_state(UserStates.entering_withdrawal_amount)
 
 @router.message(UserStates.entering_withdrawal_amount)
-async def process_withdraw_amount(message: types.Message, state: FSMContext):
+async def process_withdraw_amount(message: types.Message, state: FSMContext, user: Optional[User]):
     try:
         amount = float(message.text)
         if amount < 100:
@@ -574,18 +590,16 @@ async def process_withdraw_amount(message: types.Message, state: FSMContext):
             )
             return
         
-        async with async_session() as session:
-            user = await session.get(User, message.from_user.id)
-            if user.balance < amount:
-                await message.answer(
-                    "❌ Недостаточно средств на балансе.\n"
-                    f"Ваш баланс: {user.balance} ROXY\n"
-                    "Попробуйте еще раз:",
-                    reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
-                        InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_withdraw")
-                    ]])
-                )
-                return
+        if user is None or user.balance < amount:
+            await message.answer(
+                "❌ Недостаточно средств на балансе.\n"
+                f"Ваш баланс: {user.balance if user else 0} ROXY\n"
+                "Попробуйте еще раз:",
+                reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
+                    InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_withdraw")
+                ]])
+            )
+            return
         
         await state.update_data(withdraw_amount=amount)
         await state.set_state(UserStates.entering_usdt_address)
@@ -605,61 +619,56 @@ async def process_withdraw_amount(message: types.Message, state: FSMContext):
         )
 
 @router.message(UserStates.entering_usdt_address)
-async def process_withdraw_address(message: types.Message, state: FSMContext):
+async def process_withdraw_address(message: types.Message, state: FSMContext, user: Optional[User]):
     data = await state.get_data()
     amount = data['withdraw_amount']
     usdt_amount = amount / 10  # Конвертация ROXY в USDT (10:1)
     
-    async with async_session() as session:
-        user = await session.get(User, message.from_user.id)
-        
-        # Списываем средства
-        user.balance -= amount
-        
-        # Создаем транзакцию
-        transaction = Transaction(
-            user_id=user.telegram_id,
-            amount=amount,
-            type="withdraw",
-            status="pending",
-            created_at=datetime.utcnow(),
-            details={
-                "usdt_address": message.text,
-                "usdt_amount": usdt_amount
-            }
+    # Списываем ROXY, а выплату в USDT отправит очередь после одобрения администратором
+    try:
+        payout = await payout_queue.enqueue(
+            user.telegram_id,
+            to_micro(amount),
+            payout_micro=to_micro(usdt_amount),
+            address=message.text,
+            approve=False
         )
-        
-        session.add(transaction)
-        await session.commit()
-        
-        # Уведомляем админов
-        for admin_id in ADMIN_IDS:
-            try:
-                await message.bot.send_message(
-                    admin_id,
-                    f"💰 Новая заявка на вывод!\n\n"
-                    f"Пользователь: @{user.username or 'Пользователь'}\n"
-                    f"Сумма: {amount} ROXY ({usdt_amount} USDT)\n"
-                    f"Адрес: {message.text}\n\n"
-                    "Пожалуйста, обработайте заявку в личных сообщениях с пользователем.",
-                    reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
-                        InlineKeyboardButton(
-                            text="💬 Написать пользователю",
-                            url=f"tg://user?id={user.telegram_id}"
-                        )
-                    ]])
-                )
-            except Exception as e:
-                logger.error(f"Failed to notify admin {admin_id}: {e}")
-        
+    except InsufficientFunds:
         await message.answer(
-            f"✅ Заявка на вывод создана!\n\n"
-            f"Сумма: {amount} ROXY ({usdt_amount} USDT)\n"
-            f"Адрес: {message.text}\n\n"
-            "Администратор свяжется с вами для подтверждения вывода.",
+            "❌ Недостаточно средств на балансе.",
             reply_markup=get_main_keyboard(message.from_user.id)
         )
         await state.clear()
+        return
+    
+    # Уведомляем админов
+    for admin_id in ADMIN_IDS:
+        try:
+            await message.bot.send_message(
+                admin_id,
+                f"💰 Новая заявка на вывод #{payout.id}!\n\n"
+                f"Пользователь: @{user.username or 'Пользователь'}\n"
+                f"Сумма: {amount} ROXY ({usdt_amount} USDT)\n"
+                f"Адрес: {message.text}\n\n"
+                "Переведите вручную и отметьте: 👑 Админ панель → 💸 Выплаты",
+                reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
+                    InlineKeyboardButton(
+                        text="💬 Написать пользователю",
+                        url=f"tg://user?id={user.telegram_id}"
+                    )
+                ]])
+            )
+        except Exception as e:
+            logger.error(f"Failed to notify admin {admin_id}: {e}")
+    
+    await message.answer(
+        f"✅ Заявка на вывод #{payout.id} создана!\n\n"
+        f"Сумма: {amount} ROXY ({usdt_amount} USDT)\n"
+        f"Адрес: {message.text}\n\n"
+        "Средства поступят после подтверждения администратором.",
+        reply_markup=get_main_keyboard(message.from_user.id)
+    )
+    await state.clear()
 
 @router.callback_query(lambda c: c.data == "cancel_withdraw")
 async def cancel_withdraw(callback: types.CallbackQuery, state: FSMContext):
@@ -675,7 +684,7 @@ async def open_dispute(callback: types.CallbackQuery):
     try:
         transaction_id = int(callback.data.split(":")[1])
         
-        async with async_session() as session:
+        async with write_session() as session:
             transaction = await session.get(Transaction, transaction_id)
             if not transaction:
                 await callback.answer("❌ Транзакция не найдена", show_alert=True)
@@ -758,7 +767,7 @@ async def leave_review(callback: types.CallbackQuery, state: FSMContext):
     try:
         transaction_id = int(callback.data.split(":")[1])
         
-        async with async_session() as session:
+        async with read_session() as session:
             transaction = await session.get(Transaction, transaction_id)
             if not transaction:
                 await callback.answer("❌ Транзакция не найдена", show_alert=True)
@@ -797,37 +806,54 @@ async def process_review(callback: types.CallbackQuery):
         transaction_id = int(transaction_id)
         target_user_id = int(target_user_id)
         
-        async with async_session() as session:
+        async with write_session() as session:
             # Проверяем, что пользователь является участником сделки
             transaction = await session.get(Transaction, transaction_id)
             if not transaction or callback.from_user.id not in [transaction.buyer_id, transaction.seller_id]:
                 await callback.answer("❌ У вас нет доступа к этой сделке", show_alert=True)
                 return
             
-            # Получаем пользователя, которому оставляем отзыв
-            target_user = await session.get(User, target_user_id)
-            if not target_user:
+            # Один отзыв от участника на сделку
+            existing_review = await session.scalar(
+                select(Review.id).where(
+                    Review.transaction_id == transaction_id,
+                    Review.reviewer_id == callback.from_user.id
+                )
+            )
+            if existing_review:
+                await callback.answer("❌ Вы уже оставили отзыв по этой сделке", show_alert=True)
+                return
+            
+            # Лайк и дизлайк сохраняются как отзывы с оценкой 5 и 1,
+            # чтобы рейтинг можно было пересчитать по таблице reviews
+            rating = 5 if action == "like" else 1
+            session.add(Review(
+                transaction_id=transaction_id,
+                reviewer_id=callback.from_user.id,
+                reviewed_id=target_user_id,
+                rating=rating,
+                created_at=datetime.utcnow()
+            ))
+            update = await add_rating(session, target_user_id, rating)
+            if update is None:
+                await session.rollback()
                 await callback.answer("❌ Пользователь не найден", show_alert=True)
                 return
             
-            # Обновляем рейтинг
+            await session.commit()
+            order_book.update_seller(target_user_id, update.rating, update.reputation)
+            
             if action == "like":
-                # Увеличиваем рейтинг, но не выше 5.0
-                target_user.rating = min(5.0, target_user.rating + 0.5)
                 await callback.answer("👍 Вы поставили лайк!")
             else:
-                # Уменьшаем рейтинг, но не ниже 0.0
-                target_user.rating = max(0.0, target_user.rating - 0.5)
                 await callback.answer("👎 Вы поставили дизлайк!")
             
-            await session.commit()
-            
             # Обновляем сообщение
-            stars = "⭐️" * round(target_user.rating)
+            stars = "⭐️" * round(update.rating)
             await callback.message.edit_text(
                 "✅ Спасибо за отзыв!\n\n"
                 f"Текущий рейтинг пользователя:\n"
-                f"{stars} ({target_user.rating:.1f})"
+                f"{stars} ({update.rating:.1f})"
             )
             
     except Exception as e:
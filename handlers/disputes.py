@@ -2,13 +2,16 @@ from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
-from database.db import get_session, async_session
+from database.db import read_session, write_session
 from database.models import User, Transaction, Dispute
+from database.ledger import transfer, user_account, to_micro, SYSTEM_DISPUTES
+from database.gatekeeper import gatekeeper
 from datetime import datetime
 from sqlalchemy import select, and_, or_
 from config import ADMIN_IDS
 from handlers.common import get_main_keyboard, check_user_registered
 from log import logger
+from typing import Optional
 import logging
 from aiogram import Dispatcher
 from aiogram.filters import Command
@@ -56,19 +59,15 @@ def get_admin_dispute_keyboard(dispute_id: int):
     return keyboard
 
 @router.message(lambda message: message.text == "⚠️ Споры")
-async def show_disputes_menu(message: types.Message):
-    async with async_session() as session:
+async def show_disputes_menu(message: types.Message, user: Optional[User]):
+    async with read_session() as session:
         try:
             # Проверяем регистрацию пользователя
-            query = select(User).where(User.telegram_id == message.from_user.id)
-            result = await session.execute(query)
-            user = result.scalar_one_or_none()
-            
-            if not user:
+            if user is None:
                 await message.answer(
                     "❌ Вы не зарегистрированы!\n"
                     "Пожалуйста, пройдите регистрацию сначала.",
-                    reply_markup=get_main_keyboard()
+                    reply_markup=get_main_keyboard(message.from_user.id)
                 )
                 return
 
@@ -134,7 +133,7 @@ async def show_disputes_menu(message: types.Message):
 
 @router.callback_query(lambda c: c.data == "refresh_disputes")
 async def refresh_disputes(callback: types.CallbackQuery):
-    async with async_session() as session:
+    async with read_session() as session:
         try:
             # Получаем активные споры пользователя
             disputes_query = select(Dispute).where(
@@ -209,7 +208,7 @@ async def process_dispute_description(message: types.Message, state: FSMContext)
     data = await state.get_data()
     transaction_id = data['transaction_id']
     
-    async with await get_session() as session:
+    async with write_session() as session:
         # Создаем спор
         dispute = Dispute(
             transaction_id=transaction_id,
@@ -256,7 +255,7 @@ async def cancel_dispute(callback: types.CallbackQuery, state: FSMContext):
 
 @router.message(F.text == "📋 Мои споры")
 async def show_my_disputes(message: types.Message):
-    async with await get_session() as session:
+    async with read_session() as session:
         # Получаем все споры пользователя
         query = select(Dispute).where(
             Dispute.initiator_id == message.from_user.id
@@ -290,14 +289,14 @@ async def show_my_disputes(message: types.Message):
 
 @router.callback_query(lambda c: c.data.startswith('resolve_'))
 async def resolve_dispute(callback: types.CallbackQuery):
-    if callback.from_user.id not in ADMIN_IDS:
+    if not gatekeeper.is_admin(callback.from_user.id):
         await callback.answer("❌ У вас нет прав администратора!")
         return
     
     action, dispute_id = callback.data.split('_')[1:]
     dispute_id = int(dispute_id)
     
-    async with await get_session() as session:
+    async with write_session() as session:
         dispute = await session.get(Dispute, dispute_id)
         if not dispute or dispute.status != "open":
             await callback.answer("❌ Спор уже закрыт или не существует!")
@@ -309,7 +308,14 @@ async def resolve_dispute(callback: types.CallbackQuery):
         
         if action == "buyer":
             # Возвращаем средства покупателю
-            buyer.balance += transaction.amount
+            await transfer(
+                session,
+                f"dispute:{dispute_id}",
+                SYSTEM_DISPUTES,
+                user_account(buyer.telegram_id),
+                to_micro(transaction.amount),
+                "dispute"
+            )
             transaction.status = "refunded"
             dispute.status = "resolved"
             
@@ -327,7 +333,14 @@ async def resolve_dispute(callback: types.CallbackQuery):
             
         elif action == "seller":
             # Передаем средства продавцу
-            seller.balance += transaction.amount
+            await transfer(
+                session,
+                f"dispute:{dispute_id}",
+                SYSTEM_DISPUTES,
+                user_account(seller.telegram_id),
+                to_micro(transaction.amount),
+                "dispute"
+            )
             transaction.status = "completed"
             dispute.status = "resolved"
             
@@ -347,13 +360,13 @@ async def resolve_dispute(callback: types.CallbackQuery):
 
 @router.callback_query(lambda c: c.data.startswith('close_dispute_'))
 async def close_dispute(callback: types.CallbackQuery):
-    if callback.from_user.id not in ADMIN_IDS:
+    if not gatekeeper.is_admin(callback.from_user.id):
         await callback.answer("❌ У вас нет прав администратора!")
         return
     
     dispute_id = int(callback.data.split('_')[2])
     
-    async with await get_session() as session:
+    async with write_session() as session:
         dispute = await session.get(Dispute, dispute_id)
         if not dispute or dispute.status != "open":
             await callback.answer("❌ Спор уже закрыт или не существует!")
@@ -369,7 +382,7 @@ async def close_dispute(callback: types.CallbackQuery):
 async def cmd_dispute(message: Message):
     """Обработчик команды /dispute"""
     try:
-        async with async_session() as session:
+        async with read_session() as session:
             user = await session.get(User, message.from_user.id)
             if not user:
                 await message.answer("Пожалуйста, сначала зарегистрируйтесь с помощью команды /start")
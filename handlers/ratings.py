@@ -2,11 +2,16 @@ from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
-from database.db import async_session
+from database.db import read_session, write_session
 from database.models import User, Transaction, Review, PhoneListing
+from database.order_book import order_book
+from database.ratings import add_rating
+from database.reviews import get_reviews_page, encode_review_cursor
+from utils.keyboards import keyboards
 from datetime import datetime, timedelta
+from typing import Optional
 from sqlalchemy import select, and_, or_
-from handlers.common import get_main_keyboard, check_user_registered
+from handlers.common import get_main_keyboard
 import logging
 from aiogram import Dispatcher
 from aiogram.filters import Command
@@ -20,6 +25,7 @@ class ReviewStates(StatesGroup):
     entering_rating = State()
     entering_comment = State()
 
+@keyboards.static
 def get_rating_keyboard():
     keyboard = []
     for rating in range(1, 6):
@@ -34,12 +40,12 @@ def get_rating_keyboard():
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 @router.message(F.text == "⭐️ Отзывы")
-async def show_rating_menu(message: types.Message, state: FSMContext):
-    if not await check_user_registered(message.from_user.id):
+async def show_rating_menu(message: types.Message, state: FSMContext, user: Optional[User]):
+    if user is None:
         await message.answer(
             "❌ Вы не зарегистрированы!\n"
             "Пожалуйста, пройдите регистрацию:",
-            reply_markup=get_main_keyboard()
+            reply_markup=get_main_keyboard(message.from_user.id)
         )
         return
 
@@ -61,7 +67,7 @@ async def show_rating_menu(message: types.Message, state: FSMContext):
 async def start_review(callback: types.CallbackQuery, state: FSMContext):
     week_ago = datetime.utcnow() - timedelta(days=7)
     
-    async with async_session() as session:
+    async with read_session() as session:
         # Получаем завершенные транзакции за последние 7 дней
         query = select(Transaction).where(
             and_(
@@ -170,7 +176,7 @@ async def process_comment(message: types.Message, state: FSMContext):
     transaction_id = data['transaction_id']
     rating = data['rating']
     
-    async with async_session() as session:
+    async with write_session() as session:
         try:
             # Проверяем существование транзакции
             transaction = await session.get(Transaction, transaction_id)
@@ -211,23 +217,18 @@ async def process_comment(message: types.Message, state: FSMContext):
             )
             session.add(review)
             
-            # Обновляем рейтинг пользователя
-            reviewed_user = await session.get(User, reviewed_id)
-            if not reviewed_user:
+            # Обновляем рейтинг пользователя одним UPDATE, не читая его отзывы
+            update = await add_rating(session, reviewed_id, rating)
+            if update is None:
+                await session.rollback()
                 await message.answer(
                     "❌ Ошибка: пользователь не найден.",
                     reply_markup=get_main_keyboard(message.from_user.id)
                 )
                 return
             
-            reviews_query = select(Review).where(Review.reviewed_id == reviewed_id)
-            reviews_result = await session.execute(reviews_query)
-            reviews = reviews_result.scalars().all()
-            
-            total_rating = sum(r.rating for r in reviews) + rating
-            reviewed_user.rating = total_rating / (len(reviews) + 1)
-            
             await session.commit()
+            order_book.update_seller(reviewed_id, update.rating, update.reputation)
             
             await message.answer(
                 "✅ Спасибо за отзыв!\n"
@@ -258,100 +259,81 @@ async def process_comment(message: types.Message, state: FSMContext):
 
 @router.callback_query(lambda c: c.data == "my_reviews")
 async def show_my_reviews(callback: types.CallbackQuery):
-    async with async_session() as session:
-        # Получаем отзывы о пользователе
-        reviews_query = select(Review).where(
-            Review.reviewed_id == callback.from_user.id
-        ).order_by(Review.created_at.desc())
-        
-        result = await session.execute(reviews_query)
-        reviews = result.scalars().all()
-        
-        if not reviews:
-            await callback.message.edit_text(
-                "У вас пока нет отзывов.",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(
-                    text="↩️ Назад",
-                    callback_data="cancel_review"
-                )]])
-            )
-            return
-        
-        # Отправляем первый отзыв с кнопкой "Следующий"
-        if len(reviews) > 1:
-            keyboard = [[InlineKeyboardButton(
-                text="➡️ Следующий",
-                callback_data="next_review:1"
-            )]]
-        else:
-            keyboard = [[InlineKeyboardButton(
-                text="↩️ Назад",
-                callback_data="cancel_review"
-            )]]
-        
-        review = reviews[0]
-        reviewer = await session.get(User, review.reviewer_id)
-        transaction = await session.get(Transaction, review.transaction_id)
-        
-        await callback.message.edit_text(
-            f"⭐️ Отзыв от {'покупателя' if reviewer.telegram_id == transaction.buyer_id else 'продавца'}\n"
-            f"Оценка: {'⭐' * review.rating}\n"
-            f"Комментарий: {review.comment}\n"
-            f"Сумма сделки: {transaction.amount} USDT\n"
-            f"Дата: {review.created_at.strftime('%d.%m.%Y %H:%M')}",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
-        )
+    await show_review_page(callback)
 
 @router.callback_query(lambda c: c.data.startswith("next_review:"))
 async def show_next_review(callback: types.CallbackQuery):
-    current_index = int(callback.data.split(":")[1])
+    # next_review:n:<курсор> - следующий отзыв, next_review:p:<курсор> - предыдущий
+    parts = callback.data.split(":", 2)
+    if len(parts) < 3 or parts[1] not in ("n", "p"):
+        # Кнопка из старого сообщения: начинаем ленту сначала
+        await show_review_page(callback)
+        return
     
-    async with async_session() as session:
-        reviews_query = select(Review).where(
-            Review.reviewed_id == callback.from_user.id
-        ).order_by(Review.created_at.desc())
-        
-        result = await session.execute(reviews_query)
-        reviews = result.scalars().all()
-        
-        if current_index + 1 >= len(reviews):
-            await callback.message.edit_text(
-                "Это был последний отзыв.",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(
-                    text="↩️ Назад",
-                    callback_data="cancel_review"
-                )]])
-            )
-            return
-        
-        review = reviews[current_index + 1]
-        reviewer = await session.get(User, review.reviewer_id)
-        transaction = await session.get(Transaction, review.transaction_id)
-        
-        keyboard = []
-        if current_index + 1 > 0:
-            keyboard.append([InlineKeyboardButton(
-                text="⬅️ Предыдущий",
-                callback_data=f"next_review:{current_index}"
-            )])
-        if current_index + 1 < len(reviews) - 1:
-            keyboard.append([InlineKeyboardButton(
-                text="➡️ Следующий",
-                callback_data=f"next_review:{current_index + 1}"
-            )])
-        keyboard.append([InlineKeyboardButton(
-            text="↩️ Назад",
-            callback_data="cancel_review"
-        )])
-        
+    _, direction, cursor = parts
+    if direction == "n":
+        await show_review_page(callback, after=cursor)
+    else:
+        await show_review_page(callback, before=cursor)
+
+async def show_review_page(callback: types.CallbackQuery, after=None, before=None):
+    """Показывает один отзыв о пользователе с навигацией по курсору"""
+    async with read_session() as session:
+        reviews, has_prev, has_next = await get_reviews_page(
+            session,
+            callback.from_user.id,
+            after=after,
+            before=before
+        )
+    
+    if not reviews:
+        text = "Это был последний отзыв." if after or before else "У вас пока нет отзывов."
         await callback.message.edit_text(
-            f"⭐️ Отзыв от {'покупателя' if reviewer.telegram_id == transaction.buyer_id else 'продавца'}\n"
-            f"Оценка: {'⭐' * review.rating}\n"
-            f"Комментарий: {review.comment}\n"
-            f"Сумма сделки: {transaction.amount} USDT\n"
-            f"Дата: {review.created_at.strftime('%d.%m.%Y %H:%M')}",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+            text,
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(
+                text="↩️ Назад",
+                callback_data="cancel_review"
+            )]])
         )
+        return
+    
+    review = reviews[0]
+    cursor = encode_review_cursor(review)
+    keyboard = []
+    if has_prev:
+        keyboard.append([InlineKeyboardButton(
+            text="⬅️ Предыдущий",
+            callback_data=f"next_review:p:{cursor}"
+        )])
+    if has_next:
+        keyboard.append([InlineKeyboardButton(
+            text="➡️ Следующий",
+            callback_data=f"next_review:n:{cursor}"
+        )])
+    keyboard.append([InlineKeyboardButton(
+        text="↩️ Назад",
+        callback_data="cancel_review"
+    )])
+    
+    transaction = review.transaction
+    if transaction is None:
+        author = "пользователя"
+        amount = "-"
+    else:
+        author = "покупателя" if review.reviewer_id == transaction.buyer_id else "продавца"
+        amount = f"{transaction.amount} USDT"
+    
+    # Лайк и дизлайк сохраняются без комментария
+    comment = f"Комментарий: {review.comment}\n" if review.comment else ""
+    
+    await callback.message.edit_text(
+        f"⭐️ Отзыв от {author}\n"
+        f"Оценка: {'⭐' * review.rating}\n"
+        f"{comment}"
+        f"Сумма сделки: {amount}\n"
+        f"Дата: {review.created_at.strftime('%d.%m.%Y %H:%M')}",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+    )
 
 @router.callback_query(lambda c: c.data == "cancel_review")
 async def cancel_review(callback: types.CallbackQuery, state: FSMContext):
@@ -1,8 +1,9 @@
 from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from database.db import async_session
+from database.db import write_session
 from database.models import User
+from database.user_cache import mark_user_changed
 from sqlalchemy import select
 from handlers.common import get_main_keyboard
 from log import logger
@@ -36,7 +37,7 @@ async def process_phone_number(message: types.Message, state: FSMContext):
     telegram_id = message.from_user.id
     username = message.from_user.username
 
-    async with async_session() as session:
+    async with write_session() as session:
         try:
             # Проверяем, не зарегистрирован ли уже пользователь
             query = select(User).where(User.telegram_id == telegram_id)
@@ -58,6 +59,8 @@ async def process_phone_number(message: types.Message, state: FSMContext):
                 phone_number=phone_number
             )
             session.add(new_user)
+            # Сбрасываем закэшированное "не зарегистрирован"
+            mark_user_changed(session, telegram_id)
             await session.commit()
 
             await message.answer(
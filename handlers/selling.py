@@ -2,12 +2,15 @@ from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
-from database.db import async_session
+from database.db import write_session
 from database.models import User, PhoneListing
+from database.purchases import publish_listing
 from sqlalchemy import select
 from handlers.common import get_main_keyboard
-from .services import available_services
+from .services import services
+from utils.keyboards import keyboards
 from log import logger
+from typing import Optional
 import logging
 from aiogram import Dispatcher
 from aiogram.filters import Command
@@ -24,52 +27,56 @@ class SellingStates(StatesGroup):
     confirming = State()
     selecting_service = State()
 
+@keyboards.static
+def get_sell_services_keyboard():
+    keyboard = []
+    for service_id, service_name in services.items():
+        keyboard.append([InlineKeyboardButton(
+            text=service_name,
+            callback_data=f"select_service:{service_id}"
+        )])
+    
+    keyboard.append([InlineKeyboardButton(
+        text="❌ Отмена",
+        callback_data="cancel_selling"
+    )])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
 @router.message(F.text == "📱 Продать номер")
-async def start_selling(message: types.Message, state: FSMContext):
+async def start_selling(message: types.Message, state: FSMContext, user: Optional[User]):
     """Начинает процесс продажи номера"""
     try:
-        async with async_session() as session:
-            user = await session.get(User, message.from_user.id)
-            if not user:
-                await message.answer(
-                    "❌ Пожалуйста, сначала зарегистрируйтесь.",
-                    reply_markup=get_main_keyboard()
-                )
-                return
-            
-            # Показываем список доступных сервисов
-            keyboard = []
-            for service_id, service_name in available_services.items():
-                keyboard.append([InlineKeyboardButton(
-                    text=service_name,
-                    callback_data=f"select_service:{service_id}"
-                )])
-            
-            keyboard.append([InlineKeyboardButton(
-                text="❌ Отмена",
-                callback_data="cancel_selling"
-            )])
-            
-            await state.set_state(SellingStates.selecting_service)
+        if user is None:
             await message.answer(
-                "Выберите сервис для продажи номера:",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+                "❌ Пожалуйста, сначала зарегистрируйтесь.",
+                reply_markup=get_main_keyboard(message.from_user.id)
             )
+            return
+        
+        # Показываем список доступных сервисов
+        await state.set_state(SellingStates.selecting_service)
+        await message.answer(
+            "Выберите сервис для продажи номера:",
+            reply_markup=get_sell_services_keyboard()
+        )
     except Exception as e:
         logger.error(f"Error in start_selling: {e}")
         await message.answer(
             "❌ Произошла ошибка при начале процесса продажи.",
-            reply_markup=get_main_keyboard()
+            reply_markup=get_main_keyboard(message.from_user.id)
         )
 
 @router.callback_query(lambda c: c.data.startswith("select_service:"))
 async def process_service_selection(callback: types.CallbackQuery, state: FSMContext):
     """Обрабатывает выбор сервиса"""
     service_id = callback.data.split(":")[1]
+    if service_id not in services:
+        await callback.answer("❌ Неизвестный сервис", show_alert=True)
+        return
     await state.update_data(service=service_id)
     
     await callback.message.edit_text(
-        f"Вы выбрали сервис: {available_services[service_id]}\n\n"
+        f"Вы выбрали сервис: {services.label(service_id)}\n\n"
         "Введите номер телефона в формате +7XXXXXXXXXX:",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(
             text="❌ Отмена",
@@ -153,15 +160,15 @@ async def process_price(message: types.Message, state: FSMContext):
         data = await state.get_data()
         service_id = data['service']
         
-        # Создаем объявление
-        async with async_session() as session:
+        # Создаем объявление (активируется после подтверждения)
+        async with write_session() as session:
             listing = PhoneListing(
                 seller_id=message.from_user.id,
                 service=service_id,
                 phone_number=data['phone'],
                 rental_period=data['period'],
                 price=price,
-                is_active=True
+                is_active=False
             )
             session.add(listing)
             await session.commit()
@@ -174,7 +181,7 @@ async def process_price(message: types.Message, state: FSMContext):
             
             await message.answer(
                 f"📱 Создание объявления:\n\n"
-                f"Сервис: {available_services[service_id]}\n"
+                f"Сервис: {services.label(service_id)}\n"
                 f"Номер: {data['phone']}\n"
                 f"Срок аренды: {data['period']} часов\n"
                 f"Цена: {price:.2f} ROXY\n\n"
@@ -194,7 +201,7 @@ async def process_price(message: types.Message, state: FSMContext):
         logger.error(f"Error in process_price: {e}")
         await message.answer(
             "❌ Произошла ошибка при обработке цены.",
-            reply_markup=get_main_keyboard()
+            reply_markup=get_main_keyboard(message.from_user.id)
         )
 
 @router.callback_query(lambda c: c.data.startswith("confirm_listing:"))
@@ -203,27 +210,27 @@ async def confirm_listing(callback: types.CallbackQuery):
     listing_id = int(callback.data.split(":")[1])
     
     try:
-        async with async_session() as session:
-            listing = await session.get(PhoneListing, listing_id)
-            if not listing:
-                await callback.answer("❌ Объявление не найдено", show_alert=True)
-                return
-            
-            # Создаем inline клавиатуру для возврата в главное меню
-            keyboard = [[InlineKeyboardButton(
-                text="↩️ Вернуться в главное меню",
-                callback_data="back_to_main"
-            )]]
-            
-            await callback.message.edit_text(
-                "✅ Объявление успешно создано!\n\n"
-                f"Сервис: {available_services[listing.service]}\n"
-                f"Номер: {listing.phone_number}\n"
-                f"Срок аренды: {listing.rental_period} часов\n"
-                f"Цена: {listing.price:.2f} ROXY\n\n"
-                "Ожидайте покупателя! 🎉",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
-            )
+        # Публикуем черновик; уже опубликованное или проданное объявление не трогаем
+        listing = await publish_listing(listing_id, callback.from_user.id)
+        if not listing:
+            await callback.answer("❌ Объявление не найдено или уже опубликовано", show_alert=True)
+            return
+        
+        # Создаем inline клавиатуру для возврата в главное меню
+        keyboard = [[InlineKeyboardButton(
+            text="↩️ Вернуться в главное меню",
+            callback_data="back_to_main"
+        )]]
+        
+        await callback.message.edit_text(
+            "✅ Объявление успешно создано!\n\n"
+            f"Сервис: {services.label(listing.service)}\n"
+            f"Номер: {listing.phone_number}\n"
+            f"Срок аренды: {listing.rental_period} часов\n"
+            f"Цена: {listing.price:.2f} ROXY\n\n"
+            "Ожидайте покупателя! 🎉",
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+        )
             
     except Exception as e:
         logger.error(f"Error in confirm_listing: {e}")
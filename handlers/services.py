@@ -1,25 +1,67 @@
-from typing import Dict, List
-
-# Доступные сервисы и их описания
-available_services: Dict[str, str] = {
-    "whatsapp": "WhatsApp",
-    "telegram": "Telegram",
-    "viber": "Viber",
-    "vkontakte": "VKontakte",
-    "facebook": "Facebook",
-    "instagram": "Instagram",
-    "twitter": "Twitter",
-    "snapchat": "Snapchat",
-    "tiktok": "TikTok",
-    "google": "Google",
-}
+import sys
+from typing import Dict, Iterator, List, Optional, Tuple
+from config import AVAILABLE_SERVICES
+from utils.keyboards import keyboards
 
+# Префикс кнопок с сервисами в клавиатурах каталога
+SERVICE_BUTTON_PREFIX = "📱 "
+
+class ServiceRegistry:
+    """
+    Каталог сервисов - единственный источник, построенный из
+    config.AVAILABLE_SERVICES. ID сервисов интернированы, поэтому записи
+    книги объявлений и объявления одного сервиса делят одну строку.
+    Поиск в обе стороны (ID -> название, название или ID -> ID) - O(1),
+    неизвестный ID не вызывает KeyError.
+    """
+
+    def __init__(self, services: Dict[str, str]):
+        self._labels: Dict[str, str] = {
+            sys.intern(service_id): label for service_id, label in services.items()
+        }
+        self._interned: Dict[str, str] = {service_id: service_id for service_id in self._labels}
+        # Ввод пользователя: ID, название или текст кнопки, без учета регистра
+        self._ids: Dict[str, str] = {}
+        for service_id, label in self._labels.items():
+            for text in (service_id, label, SERVICE_BUTTON_PREFIX + label):
+                self._ids[text.casefold()] = service_id
+
+    def intern(self, service_id: str) -> str:
+        """Общий объект строки для известного ID (неизвестный возвращается как есть)"""
+        return self._interned.get(service_id, service_id)
+
+    def label(self, service_id: Optional[str]) -> str:
+        """Название сервиса; для неизвестного ID - сам ID"""
+        return self._labels.get(service_id, service_id or "")
+
+    def resolve(self, text: Optional[str]) -> Optional[str]:
+        """ID сервиса по ID, названию или тексту кнопки; None, если такого нет"""
+        if not text:
+            return None
+        return self._ids.get(text.strip().casefold())
+
+    def items(self) -> List[Tuple[str, str]]:
+        return list(self._labels.items())
+
+    def __contains__(self, service_id) -> bool:
+        return service_id in self._labels
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._labels)
+
+    def __len__(self):
+        return len(self._labels)
+
+# Общий каталог сервисов
+services = ServiceRegistry(AVAILABLE_SERVICES)
+
+@keyboards.static
 def get_services_keyboard():
     """Создает клавиатуру с доступными сервисами"""
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
     
     keyboard = []
-    for service_id, service_name in available_services.items():
+    for service_id, service_name in services.items():
         keyboard.append([
             InlineKeyboardButton(
                 text=service_name,
@@ -34,4 +76,4 @@ def get_services_keyboard():
         )
     ])
     
-    return InlineKeyboardMarkup(inline_keyboard=keyboard) 
\ No newline at end of file
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
\ No newline at end of file
@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher, types, F
@@ -5,9 +6,25 @@ from aiogram.types import BotCommand, Message
 from aiogram.filters import Command
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN, ORDER_BOOK_CHECK_INTERVAL, LEDGER_RECONCILE_INTERVAL, TELEGRAM_WEBHOOK_URL,
+    CLUSTER_WORKERS, CLUSTER_BOOK_SYNC_INTERVAL, REPUTATION_REFRESH_INTERVAL,
+    GATEKEEPER_REFRESH_INTERVAL, BROADCAST_LEASE
+)
 from handlers import register_all_handlers
 from database.backup import backup_database
+from database.order_book import order_book
+from database.gatekeeper import gatekeeper
+from database.ledger import reconcile
+from database.reputation import rebuild_reputation
+from database.fsm_storage import fsm_storage
+from utils.broadcast import broadcaster
+from utils.payouts import payout_queue
+from utils.invoices import invoice_poller
+from utils.crypto import crypto_bot
+from utils.keyboards import KeyboardSession
+from utils.webhook import WebhookServer
+from utils.cluster import UpdateRouter, poll_updates, run_worker
 from database.migrations.init_db import init_database
 from database.migrations.run_migrations import run_migrations
 
@@ -18,9 +35,12 @@ logger = logging.getLogger(__name__)
 # Глобальные объекты
 bot = Bot(
     token=BOT_TOKEN,
+    # Сессия отправляет готовый JSON клавиатур из utils.keyboards
+    session=KeyboardSession(),
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
-dp = Dispatcher()
+# Состояния диалогов хранятся в SQLite и переживают перезапуск
+dp = Dispatcher(storage=fsm_storage)
 
 async def setup_database():
     """Инициализация и обновление базы данных"""
@@ -42,7 +62,10 @@ async def setup_database():
         raise
 
 async def run_backup_service():
-    """Сервис автоматического резервного копирования"""
+    """
+    Сервис автоматического резервного копирования: каждый час инкрементный
+    снимок (раз в BACKUP_FULL_INTERVAL часов - полный) и чистка по уровням хранения
+    """
     while True:
         try:
             await backup_database()
@@ -51,17 +74,100 @@ async def run_backup_service():
             logger.error(f"Ошибка при создании резервной копии: {e}")
         await asyncio.sleep(3600)  # Каждый час
 
+async def run_order_book_check(interval: int = ORDER_BOOK_CHECK_INTERVAL):
+    """Периодическая сверка книги объявлений с базой данных"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await order_book.check_consistency()
+        except Exception as e:
+            logger.error(f"Ошибка при сверке книги объявлений: {e}")
+
+async def run_gatekeeper_refresh():
+    """
+    Периодическая перезагрузка списков доступа: блокировки, сделанные
+    в другом процессе, применяются не позже чем через интервал
+    """
+    while True:
+        await asyncio.sleep(GATEKEEPER_REFRESH_INTERVAL)
+        try:
+            await gatekeeper.load()
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке списков доступа: {e}")
+
+async def run_ledger_reconciliation():
+    """Периодическая сверка журнала проводок с балансами пользователей"""
+    while True:
+        try:
+            report = await reconcile()
+            if report.mismatched:
+                logger.error(f"Расхождения балансов (кэш, журнал): {dict(list(report.mismatched.items())[:20])}")
+            if report.unbalanced:
+                logger.error(f"Несбалансированные операции: {dict(list(report.unbalanced.items())[:20])}")
+        except Exception as e:
+            logger.error(f"Ошибка при сверке журнала проводок: {e}")
+        await asyncio.sleep(LEDGER_RECONCILE_INTERVAL)
+
+async def run_broadcast_resume():
+    """
+    Подхватывает рассылки, процесс которых остановился: их аренда
+    истекает через BROADCAST_LEASE секунд без продления
+    """
+    while True:
+        await asyncio.sleep(BROADCAST_LEASE)
+        try:
+            await broadcaster.resume(bot)
+        except Exception as e:
+            logger.error(f"Ошибка при продолжении рассылок: {e}")
+
+async def run_reputation_refresh():
+    """
+    Периодический пересчет репутации продавцов: между отзывами она
+    обновляется только при новых оценках, а затухание старых отзывов
+    учитывается здесь. Книга объявлений сразу сверяется с новыми значениями.
+    """
+    while True:
+        try:
+            await rebuild_reputation()
+            await order_book.check_consistency()
+        except Exception as e:
+            logger.error(f"Ошибка при пересчете репутации: {e}")
+        await asyncio.sleep(REPUTATION_REFRESH_INTERVAL)
+
 @dp.startup()
 async def on_startup():
     """Действия при запуске бота"""
     # Инициализируем базу данных
     await setup_database()
     
+    # Строим книгу активных объявлений
+    await order_book.load()
+    
+    # Загружаем заблокированных и администраторов до приема обновлений
+    await gatekeeper.load()
+    
+    # Открываем пул соединений с CryptoBot
+    await crypto_bot.start()
+    
     # Регистрируем все обработчики
     register_all_handlers(dp)
     
+    # Продолжаем рассылки, прерванные остановкой бота
+    await broadcaster.resume(bot)
+    
+    # Очередь выплат: сначала сверяет переводы, прерванные остановкой бота
+    payout_queue.start(bot)
+    
+    # Проверка оплаты счетов на случай, если веб-хук CryptoBot не дошел
+    invoice_poller.start(bot)
+    
     # Запускаем сервис резервного копирования
     asyncio.create_task(run_backup_service())
+    asyncio.create_task(run_order_book_check())
+    asyncio.create_task(run_ledger_reconciliation())
+    asyncio.create_task(run_reputation_refresh())
+    asyncio.create_task(run_gatekeeper_refresh())
+    asyncio.create_task(run_broadcast_resume())
     
     logger.info("Бот успешно запущен")
 
@@ -75,17 +181,72 @@ async def on_shutdown():
     except Exception as e:
         logger.error(f"Ошибка при создании финальной резервной копии: {e}")
     
+    await payout_queue.stop()
+    await invoice_poller.stop()
+    await crypto_bot.close()
+    
     logger.info("Бот остановлен")
 
-async def main():
+async def run_ingress(workers: int):
+    """
+    Приемный процесс: получает обновления (веб-хук или long polling) и раздает
+    их workers процессам-обработчикам. Фоновые сервисы работают только здесь.
+    """
+    router = UpdateRouter(workers)
+    # Обработчики запускаются после миграций из on_startup и останавливаются последними
+    dp.startup.register(router.start)
+    dp.shutdown.register(router.close)
+    
+    if TELEGRAM_WEBHOOK_URL:
+        await WebhookServer(dp, bot, feed=router.route).run()
+        return
+    
+    await bot.delete_webhook()
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    try:
+        await poll_updates(bot, dp, router.route)
+    finally:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+
+async def run_worker_process(index: int):
+    """Процесс-обработчик: только обработчики обновлений, без миграций и фоновых сервисов"""
+    await order_book.load()
+    await gatekeeper.load()
+    await crypto_bot.start()
+    register_all_handlers(dp)
+    
+    # Объявления меняют и другие процессы, поэтому книга сверяется чаще
+    asyncio.create_task(run_order_book_check(CLUSTER_BOOK_SYNC_INTERVAL))
+    asyncio.create_task(run_gatekeeper_refresh())
+    
+    try:
+        await run_worker(index, dp, bot)
+    finally:
+        await fsm_storage.close()
+        await crypto_bot.close()
+
+async def main(workers: int = CLUSTER_WORKERS, worker: int = None):
     """Основная функция запуска бота"""
     try:
-        # Запускаем бота
-        await dp.start_polling(bot)
+        if worker is not None:
+            await run_worker_process(worker)
+        elif workers > 0:
+            await run_ingress(workers)
+        # Запускаем бота: веб-хук, если задан адрес, иначе long polling
+        elif TELEGRAM_WEBHOOK_URL:
+            await WebhookServer(dp, bot).run()
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}")
     finally:
         await bot.session.close()
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="ROXORT бот")
+    parser.add_argument("--workers", type=int, default=CLUSTER_WORKERS,
+                        help="Число процессов-обработчиков (0 - один процесс)")
+    parser.add_argument("--worker", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    asyncio.run(main(args.workers, args.worker)) 
\ No newline at end of file
@@ -0,0 +1,25 @@
+import sys
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в PYTHONPATH
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from contextlib import asynccontextmanager
+from database import db
+from database.db import Base, create_db_engine
+
+@asynccontextmanager
+async def temporary_database(path: Path):
+    """Привязывает write_session и read_session к новой базе в path"""
+    writer = create_db_engine(path=path / "test.db")
+    async with writer.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    reader = create_db_engine(path=path / "test.db", read_only=True)
+    db.write_session.configure(bind=writer)
+    db.read_session.configure(bind=reader)
+    try:
+        yield
+    finally:
+        await writer.dispose()
+        await reader.dispose()
\ No newline at end of file
@@ -0,0 +1,156 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from sqlalchemy import insert, update
+from database import db
+from database.models import User, Broadcast
+import utils.broadcast as broadcast_module
+from utils.broadcast import Broadcaster
+from tests.conftest import temporary_database
+
+USERS = 30
+BLOCKED_USER = 5
+RATE_LIMITED_USER = 12
+
+class FakeBotSession(BaseSession):
+    """
+    Bot API в памяти: ответы проходят через check_response, как ответы
+    настоящего сервера, поэтому ошибки превращаются в исключения aiogram
+    """
+
+    def __init__(self, on_send=None):
+        super().__init__()
+        self.sent = []
+        self.on_send = on_send
+        self._rate_limited = False
+
+    async def make_request(self, bot, method, timeout=None):
+        status, payload = await self.respond(method)
+        response = self.check_response(bot=bot, method=method, status_code=status, content=json.dumps(payload))
+        return response.result
+
+    async def respond(self, method):
+        if method.__api_method__ != "sendMessage":
+            return 200, {"ok": True, "result": True}
+        if method.chat_id == BLOCKED_USER:
+            return 403, {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}
+        if method.chat_id == RATE_LIMITED_USER and not self._rate_limited:
+            self._rate_limited = True
+            return 429, {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                         "parameters": {"retry_after": 1}}
+        self.sent.append(method.chat_id)
+        if self.on_send is not None:
+            await self.on_send(len(self.sent))
+        return 200, {"ok": True, "result": {
+            "message_id": len(self.sent), "date": 0,
+            "chat": {"id": method.chat_id, "type": "private"}, "text": method.text
+        }}
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+def configure(monkeypatch):
+    monkeypatch.setattr(broadcast_module, "BROADCAST_BATCH_SIZE", 7)
+    monkeypatch.setattr(broadcast_module, "BROADCAST_RATE", 1000)
+    monkeypatch.setattr(broadcast_module, "BROADCAST_BURST", 1000)
+
+async def create_users():
+    async with db.write_session() as session:
+        await session.execute(insert(User), [
+            {"telegram_id": user_id, "balance_micro": 0} for user_id in range(1, USERS + 1)
+        ])
+        await session.commit()
+
+async def create_foreign_broadcast(lease_until: datetime) -> int:
+    """Рассылка, которую ведет другой процесс"""
+    async with db.write_session() as session:
+        broadcast = Broadcast(admin_id=1, text="hello", status="running", cursor=0, total=USERS,
+                              sent=0, blocked=0, failed=0, owner="worker:1", lease_until=lease_until)
+        session.add(broadcast)
+        await session.commit()
+    return broadcast.id
+
+async def wait(broadcaster: Broadcaster):
+    await asyncio.gather(*list(broadcaster._tasks.values()))
+
+async def load(broadcast_id: int) -> Broadcast:
+    async with db.read_session() as session:
+        return await session.get(Broadcast, broadcast_id)
+
+def test_broadcast_delivers_once_per_user(tmp_path, monkeypatch):
+    configure(monkeypatch)
+
+    async def scenario():
+        async with temporary_database(tmp_path):
+            await create_users()
+            session = FakeBotSession()
+            broadcaster = Broadcaster()
+            broadcast = await broadcaster.create(Bot("123:abc", session=session), 1, "hello")
+            await wait(broadcaster)
+
+            assert sorted(session.sent) == [user_id for user_id in range(1, USERS + 1) if user_id != BLOCKED_USER]
+            result = await load(broadcast.id)
+            assert (result.status, result.sent, result.blocked, result.failed) == ("done", USERS - 1, 1, 0)
+
+    asyncio.run(scenario())
+
+def test_resume_skips_broadcast_leased_by_another_process(tmp_path, monkeypatch):
+    configure(monkeypatch)
+
+    async def scenario():
+        async with temporary_database(tmp_path):
+            await create_users()
+            session = FakeBotSession()
+            bot = Bot("123:abc", session=session)
+            broadcast_id = await create_foreign_broadcast(datetime.utcnow() + timedelta(minutes=5))
+
+            broadcaster = Broadcaster()
+            assert await broadcaster.resume(bot) == 0
+            assert session.sent == []
+
+            # Владелец остановился и не продлил аренду: рассылку продолжает этот процесс
+            async with db.write_session() as write:
+                await write.execute(
+                    update(Broadcast)
+                    .where(Broadcast.id == broadcast_id)
+                    .values(lease_until=datetime.utcnow() - timedelta(seconds=1))
+                )
+                await write.commit()
+            assert await broadcaster.resume(bot) == 1
+            assert await Broadcaster().resume(bot) == 0
+            await wait(broadcaster)
+
+            assert len(session.sent) == len(set(session.sent)) == USERS - 1
+            assert (await load(broadcast_id)).status == "done"
+
+    asyncio.run(scenario())
+
+def test_run_stops_when_broadcast_is_taken_over(tmp_path, monkeypatch):
+    configure(monkeypatch)
+
+    async def scenario():
+        async with temporary_database(tmp_path):
+            await create_users()
+
+            async def take_over(sent: int):
+                if sent == 1:
+                    async with db.write_session() as write:
+                        await write.execute(update(Broadcast).values(owner="worker:2"))
+                        await write.commit()
+
+            session = FakeBotSession(on_send=take_over)
+            broadcaster = Broadcaster()
+            broadcast = await broadcaster.create(Bot("123:abc", session=session), 1, "hello")
+            await wait(broadcaster)
+
+            # Дослана только текущая пачка, прогресс нового владельца не перезаписан
+            assert len(session.sent) <= 7
+            result = await load(broadcast.id)
+            assert (result.status, result.cursor, result.owner) == ("running", 0, "worker:2")
+
+    asyncio.run(scenario())
\ No newline at end of file
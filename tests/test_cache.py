@@ -0,0 +1,46 @@
+import asyncio
+from utils.cache import TTLCache
+
+def test_load_started_before_invalidate_is_not_cached():
+    async def scenario():
+        cache = TTLCache(ttl=60)
+        balance = {"value": 10}
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def slow_loader():
+            value = balance["value"]
+            started.set()
+            await release.wait()
+            return value
+
+        async def loader():
+            return balance["value"]
+
+        stale = asyncio.ensure_future(cache.get("balance", slow_loader))
+        await started.wait()
+        # Баланс изменился, пока шла загрузка
+        balance["value"] = 20
+        cache.invalidate("balance")
+        assert await cache.get("balance", loader) == 20
+
+        release.set()
+        assert await stale == 10
+        assert await cache.get("balance", loader) == 20
+
+    asyncio.run(scenario())
+
+def test_concurrent_gets_share_one_load():
+    async def scenario():
+        cache = TTLCache(ttl=60)
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return calls
+
+        assert await asyncio.gather(*(cache.get("rates", loader) for _ in range(10))) == [1] * 10
+        assert calls == 1
+
+    asyncio.run(scenario())
\ No newline at end of file
@@ -0,0 +1,73 @@
+import asyncio
+from sqlalchemy import insert, select
+from database import db
+from database.models import User, Payout
+from database.ledger import transfer, user_account, to_micro, reconcile, SYSTEM_OPENING
+from utils.crypto import crypto_bot
+from utils.payouts import PayoutQueue
+from tests.conftest import temporary_database
+
+async def create_user(user_id: int, balance: float):
+    async with db.write_session() as session:
+        await session.execute(insert(User), [{"telegram_id": user_id, "balance_micro": 0}])
+        await transfer(session, f"open:{user_id}", SYSTEM_OPENING, user_account(user_id), to_micro(balance), "opening")
+        await session.commit()
+
+async def balance_of(user_id: int) -> int:
+    async with db.read_session() as session:
+        return await session.scalar(select(User.balance_micro).where(User.telegram_id == user_id))
+
+async def status_of(payout_id: int) -> str:
+    async with db.read_session() as session:
+        return await session.scalar(select(Payout.status).where(Payout.id == payout_id))
+
+def test_address_payout_is_never_sent_through_cryptobot(tmp_path, monkeypatch):
+    transfers = []
+
+    async def fake_transfer(**kwargs):
+        transfers.append(kwargs)
+        return {"ok": True, "result": {"transfer_id": len(transfers)}}
+
+    monkeypatch.setattr(crypto_bot, "transfer", fake_transfer)
+
+    async def scenario():
+        async with temporary_database(tmp_path):
+            await create_user(1, 100)
+            await create_user(2, 100)
+            queue = PayoutQueue()
+
+            wallet = await queue.enqueue(1, to_micro(10), address="TXYZ", approve=True)
+            assert wallet.status == "manual"
+            assert await balance_of(1) == to_micro(90)
+
+            # Массовое одобрение и фоновая отправка не трогают выплату на адрес
+            regular = await queue.enqueue(2, to_micro(5), approve=False)
+            assert await queue.approve(regular.id) == 1
+            assert await queue._process_batch() == 1
+            assert [call["user_id"] for call in transfers] == [2]
+            assert await status_of(wallet.id) == "manual"
+            assert await status_of(regular.id) == "completed"
+
+            # Администратор перевел вручную и отметил выплату
+            assert (await queue.complete_manual(wallet.id)).id == wallet.id
+            assert await status_of(wallet.id) == "completed"
+            assert await queue.complete_manual(wallet.id) is None
+            assert len(transfers) == 1
+            assert (await reconcile()).ok
+
+    asyncio.run(scenario())
+
+def test_rejected_address_payout_is_refunded(tmp_path):
+    async def scenario():
+        async with temporary_database(tmp_path):
+            await create_user(1, 100)
+            queue = PayoutQueue()
+            payout = await queue.enqueue(1, to_micro(30), address="TXYZ", approve=False)
+            assert await balance_of(1) == to_micro(70)
+
+            assert (await queue.reject(payout.id)).status == "rejected"
+            assert await balance_of(1) == to_micro(100)
+            assert await queue.complete_manual(payout.id) is None
+            assert (await reconcile()).ok
+
+    asyncio.run(scenario())
\ No newline at end of file
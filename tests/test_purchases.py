@@ -0,0 +1,65 @@
+import asyncio
+from sqlalchemy import insert, select
+from database import db
+from database.models import User, PhoneListing
+from database.ledger import transfer, user_account, to_micro, SYSTEM_OPENING
+from database.order_book import order_book
+from database.purchases import publish_listing, purchase_listing, PurchaseError
+from tests.conftest import temporary_database
+
+async def create_user(user_id: int, balance: float):
+    async with db.write_session() as session:
+        await session.execute(insert(User), [{"telegram_id": user_id, "balance_micro": 0}])
+        await transfer(session, f"open:{user_id}", SYSTEM_OPENING, user_account(user_id), to_micro(balance), "opening")
+        await session.commit()
+
+async def create_draft(seller_id: int, price: float) -> int:
+    async with db.write_session() as session:
+        listing = PhoneListing(
+            seller_id=seller_id,
+            service="telegram",
+            phone_number="+79990000000",
+            rental_period=24,
+            price=price,
+            is_active=False
+        )
+        session.add(listing)
+        await session.commit()
+        return listing.id
+
+async def is_active(listing_id: int) -> bool:
+    async with db.read_session() as session:
+        return await session.scalar(select(PhoneListing.is_active).where(PhoneListing.id == listing_id))
+
+def test_sold_listing_cannot_be_confirmed_again(tmp_path):
+    async def scenario():
+        async with temporary_database(tmp_path):
+            order_book._reset()
+            await create_user(1, 1)
+            await create_user(2, 100)
+            listing_id = await create_draft(1, 10)
+
+            # Чужой продавец не может опубликовать черновик
+            assert await publish_listing(listing_id, 2) is None
+
+            assert (await publish_listing(listing_id, 1)).id == listing_id
+            assert order_book.count() == 1
+            # Повторное нажатие не добавляет объявление второй раз
+            assert await publish_listing(listing_id, 1) is None
+            assert order_book.count() == 1
+
+            await purchase_listing(listing_id, 2)
+            assert order_book.count() == 0
+
+            # Старая кнопка подтверждения не возвращает проданное объявление в продажу
+            assert await publish_listing(listing_id, 1) is None
+            assert not await is_active(listing_id)
+            assert order_book.count() == 0
+            try:
+                await purchase_listing(listing_id, 2)
+            except PurchaseError as e:
+                assert e.reason == PurchaseError.UNAVAILABLE
+            else:
+                raise AssertionError("объявление продано дважды")
+
+    asyncio.run(scenario())
\ No newline at end of file
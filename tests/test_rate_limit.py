@@ -0,0 +1,33 @@
+import asyncio
+import pytest
+from utils.rate_limit import CircuitBreaker
+
+def open_breaker() -> CircuitBreaker:
+    # reset_timeout=0: предохранитель сразу переходит в half-open
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == "half-open"
+    return breaker
+
+def test_probe_error_reopens_and_releases_probe():
+    breaker = open_breaker()
+    assert breaker.allow()
+    assert not breaker.allow()
+    with pytest.raises(ValueError):
+        with breaker.attempt():
+            raise ValueError("invalid JSON")
+    # Пробный запрос освобожден: после таймаута пропускается следующий
+    assert breaker.allow()
+    with breaker.attempt():
+        pass
+    assert breaker.state == "closed"
+
+def test_cancelled_probe_is_released_without_failure():
+    breaker = open_breaker()
+    failures = breaker.failures
+    assert breaker.allow()
+    with pytest.raises(asyncio.CancelledError):
+        with breaker.attempt():
+            raise asyncio.CancelledError()
+    assert breaker.failures == failures
+    assert breaker.allow()
\ No newline at end of file
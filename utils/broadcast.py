@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError, TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError,
+    TelegramRetryAfter, TelegramServerError
+)
+from sqlalchemy import select, update, func, or_
+from database.db import read_session, write_session
+from database.models import Broadcast, User
+from utils.rate_limit import TokenBucket
+from config import (
+    BROADCAST_RATE, BROADCAST_BURST, BROADCAST_CONCURRENCY, BROADCAST_BATCH_SIZE,
+    BROADCAST_MAX_RETRIES, BROADCAST_RETRY_DELAY, BROADCAST_PROGRESS_INTERVAL, BROADCAST_LEASE
+)
+
+logger = logging.getLogger(__name__)
+
+# Результаты отправки одному пользователю
+SENT = "sent"
+BLOCKED = "blocked"
+FAILED = "failed"
+
+def format_progress(broadcast: Broadcast) -> str:
+    """Текст сообщения с прогрессом рассылки для администратора"""
+    processed = broadcast.sent + broadcast.blocked + broadcast.failed
+    title = "✅ Рассылка завершена" if broadcast.status == "done" else "📢 Идет рассылка"
+    return (
+        f"{title} #{broadcast.id}\n\n"
+        f"Обработано: {processed} из {broadcast.total}\n"
+        f"Доставлено: {broadcast.sent}\n"
+        f"Заблокировали бота: {broadcast.blocked}\n"
+        f"Ошибок: {broadcast.failed}"
+    )
+
+class Broadcaster:
+    """
+    Рассылка объявлений всем пользователям.
+    Задание хранится в таблице broadcasts вместе с курсором (telegram_id
+    последнего обработанного пользователя), поэтому после перезапуска
+    рассылка продолжается с места остановки. Пользователи выбираются пачками
+    по первичному ключу, сообщения отправляются параллельно, но не чаще
+    BROADCAST_RATE в секунду; ответ 429 приостанавливает всю рассылку на retry_after.
+    Рассылку ведет один процесс - владелец (owner) с арендой до lease_until,
+    которая продлевается после каждой пачки. Другие процессы продолжают ее
+    только после истечения аренды, поэтому сообщения не уходят дважды.
+    """
+
+    def __init__(self):
+        self.bucket = TokenBucket(BROADCAST_RATE, BROADCAST_BURST)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    async def create(self, bot: Bot, admin_id: int, text: str,
+                     progress_chat_id: Optional[int] = None,
+                     progress_message_id: Optional[int] = None) -> Broadcast:
+        """Сохраняет новую рассылку и запускает ее в фоне"""
+        async with read_session() as session:
+            total = await session.scalar(select(func.count()).select_from(User))
+
+        async with write_session() as session:
+            broadcast = Broadcast(
+                admin_id=admin_id,
+                text=text,
+                status="running",
+                cursor=0,
+                total=total,
+                sent=0,
+                blocked=0,
+                failed=0,
+                progress_chat_id=progress_chat_id,
+                progress_message_id=progress_message_id,
+                owner=self.owner,
+                lease_until=datetime.utcnow() + timedelta(seconds=BROADCAST_LEASE)
+            )
+            session.add(broadcast)
+            await session.commit()
+
+        self._start(bot, broadcast)
+        return broadcast
+
+    async def resume(self, bot: Bot) -> int:
+        """
+        Продолжает рассылки, прерванные остановкой бота. Рассылки с действующей
+        арендой ведет другой процесс (например, обработчик, в котором ее создал
+        администратор), и они не трогаются. Возвращает число продолженных.
+        """
+        now = datetime.utcnow()
+        async with read_session() as session:
+            result = await session.scalars(
+                select(Broadcast.id)
+                .where(Broadcast.status == "running", self._lease_expired(now))
+            )
+            broadcast_ids = result.all()
+
+        resumed = 0
+        for broadcast_id in broadcast_ids:
+            if broadcast_id in self._tasks and not self._tasks[broadcast_id].done():
+                continue
+            broadcast = await self._claim(broadcast_id, now)
+            if broadcast is None:
+                # Рассылку успел забрать другой процесс
+                continue
+            logger.info(f"Продолжаем рассылку #{broadcast.id} после пользователя {broadcast.cursor}")
+            self._start(bot, broadcast)
+            resumed += 1
+        return resumed
+
+    @staticmethod
+    def _lease_expired(now: datetime):
+        return or_(Broadcast.lease_until.is_(None), Broadcast.lease_until < now)
+
+    async def _claim(self, broadcast_id: int, now: datetime) -> Optional[Broadcast]:
+        """Забирает рассылку с истекшей арендой одним условным UPDATE"""
+        async with write_session() as session:
+            result = await session.execute(
+                update(Broadcast)
+                .where(
+                    Broadcast.id == broadcast_id,
+                    Broadcast.status == "running",
+                    self._lease_expired(now)
+                )
+                .values(owner=self.owner, lease_until=now + timedelta(seconds=BROADCAST_LEASE))
+            )
+            if result.rowcount != 1:
+                await session.rollback()
+                return None
+            broadcast = await session.get(Broadcast, broadcast_id)
+            await session.commit()
+        return broadcast
+
+    def _start(self, bot: Bot, broadcast: Broadcast):
+        if broadcast.id in self._tasks and not self._tasks[broadcast.id].done():
+            return
+        self._tasks[broadcast.id] = asyncio.create_task(self._run(bot, broadcast))
+
+    async def cancel(self, broadcast_id: int):
+        """Останавливает рассылку; уже отправленные сообщения остаются"""
+        task = self._tasks.pop(broadcast_id, None)
+        if task:
+            task.cancel()
+        async with write_session() as session:
+            await session.execute(
+                update(Broadcast)
+                .where(Broadcast.id == broadcast_id, Broadcast.status == "running")
+                .values(status="cancelled", finished_at=datetime.utcnow())
+            )
+            await session.commit()
+
+    async def _send(self, bot: Bot, user_id: int, text: str) -> str:
+        """Отправляет сообщение одному пользователю с повторами"""
+        delay = BROADCAST_RETRY_DELAY
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            try:
+                await bot.send_message(user_id, text)
+                return SENT
+            except TelegramRetryAfter as e:
+                # Лимит общий для бота: останавливаем всех отправителей, попытка не считается
+                logger.warning(f"Telegram просит подождать {e.retry_after} с")
+                self.bucket.pause(e.retry_after)
+            except TelegramForbiddenError:
+                return BLOCKED
+            except (TelegramNetworkError, TelegramServerError) as e:
+                attempt += 1
+                if attempt > BROADCAST_MAX_RETRIES:
+                    logger.error(f"Не удалось отправить объявление пользователю {user_id}: {e}")
+                    return FAILED
+                await asyncio.sleep(delay)
+                delay *= 2
+            except TelegramAPIError as e:
+                # Неверный чат, удаленный аккаунт и прочие ошибки, которые повтор не исправит
+                logger.warning(f"Не удалось отправить объявление пользователю {user_id}: {e}")
+                return FAILED
+
+    async def _report(self, bot: Bot, broadcast: Broadcast):
+        if not broadcast.progress_chat_id:
+            return
+        try:
+            await bot.edit_message_text(
+                format_progress(broadcast),
+                chat_id=broadcast.progress_chat_id,
+                message_id=broadcast.progress_message_id
+            )
+        except TelegramBadRequest:
+            # Текст не изменился или сообщение удалено
+            pass
+        except Exception as e:
+            logger.warning(f"Не удалось обновить прогресс рассылки #{broadcast.id}: {e}")
+
+    async def _run(self, bot: Bot, broadcast: Broadcast):
+        semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+        text = f"📢 Объявление от администратора:\n\n{broadcast.text}"
+        reported_at = 0.0
+
+        async def send(user_id: int) -> str:
+            async with semaphore:
+                return await self._send(bot, user_id, text)
+
+        try:
+            while True:
+                async with read_session() as session:
+                    result = await session.scalars(
+                        select(User.telegram_id)
+                        .where(User.telegram_id > broadcast.cursor)
+                        .order_by(User.telegram_id)
+                        .limit(BROADCAST_BATCH_SIZE)
+                    )
+                    user_ids = result.all()
+
+                if user_ids:
+                    results = await asyncio.gather(*(send(user_id) for user_id in user_ids))
+                    broadcast.cursor = user_ids[-1]
+                    broadcast.sent += results.count(SENT)
+                    broadcast.blocked += results.count(BLOCKED)
+                    broadcast.failed += results.count(FAILED)
+                    # Пользователи, пришедшие во время рассылки, тоже ее получают
+                    broadcast.total = max(broadcast.total, broadcast.sent + broadcast.blocked + broadcast.failed)
+                if len(user_ids) < BROADCAST_BATCH_SIZE:
+                    broadcast.status = "done"
+                    broadcast.finished_at = datetime.utcnow()
+
+                # Прогресс сохраняется после каждой пачки вместе с продлением аренды:
+                # при перезапуске повторно получат сообщение не больше BROADCAST_BATCH_SIZE
+                # пользователей. Без строки владельца рассылку отменили или забрали.
+                async with write_session() as session:
+                    result = await session.execute(
+                        update(Broadcast)
+                        .where(
+                            Broadcast.id == broadcast.id,
+                            Broadcast.status == "running",
+                            Broadcast.owner == self.owner
+                        )
+                        .values(
+                            cursor=broadcast.cursor,
+                            total=broadcast.total,
+                            sent=broadcast.sent,
+                            blocked=broadcast.blocked,
+                            failed=broadcast.failed,
+                            status=broadcast.status,
+                            finished_at=broadcast.finished_at,
+                            lease_until=datetime.utcnow() + timedelta(seconds=BROADCAST_LEASE)
+                        )
+                    )
+                    await session.commit()
+                if result.rowcount == 0:
+                    logger.warning(f"Рассылка #{broadcast.id} отменена или продолжена другим процессом")
+                    return
+
+                if broadcast.status == "done" or time.monotonic() - reported_at >= BROADCAST_PROGRESS_INTERVAL:
+                    reported_at = time.monotonic()
+                    await self._report(bot, broadcast)
+                if broadcast.status == "done":
+                    logger.info(
+                        f"Рассылка #{broadcast.id} завершена: доставлено {broadcast.sent}, "
+                        f"заблокировали {broadcast.blocked}, ошибок {broadcast.failed}"
+                    )
+                    return
+        except Exception as e:
+            # Рассылка остается в статусе running и продолжится при следующем запуске
+            logger.error(f"Ошибка в рассылке #{broadcast.id}: {e}")
+        finally:
+            self._tasks.pop(broadcast.id, None)
+
+# Общий планировщик рассылок
+broadcaster = Broadcaster()
\ No newline at end of file
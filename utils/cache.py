@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """
+    Асинхронный кэш со сроком жизни записей.
+    Значение моложе ttl отдается сразу. Значение старше ttl, но моложе
+    ttl + stale_ttl тоже отдается сразу, а в фоне запускается обновление.
+    Более старое значение или его отсутствие ведет к загрузке, при этом
+    одновременные вызовы с одним ключом ждут одну и ту же загрузку.
+    Результат, для которого should_cache возвращает False, не сохраняется.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        stale_ttl: float = 0,
+        should_cache: Callable[[Any], bool] = lambda value: True
+    ):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.should_cache = should_cache
+        self._values: Dict[Hashable, Tuple[Any, float]] = {}
+        self._loading: Dict[Hashable, asyncio.Future] = {}
+        # Растет при каждой инвалидации: загрузка, начатая до нее, не сохраняется
+        self._generation = 0
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        cached = self._values.get(key)
+        if cached is not None:
+            value, loaded_at = cached
+            age = time.monotonic() - loaded_at
+            if age < self.ttl:
+                return value
+            if age < self.ttl + self.stale_ttl:
+                if key not in self._loading:
+                    self._start_load(key, loader).add_done_callback(self._log_refresh_error)
+                return value
+
+        future = self._loading.get(key) or self._start_load(key, loader)
+        # shield: отмена одного ожидающего не отменяет загрузку для остальных
+        return await asyncio.shield(future)
+
+    def _start_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        generation = self._generation
+
+        async def load():
+            try:
+                value = await loader()
+                if generation == self._generation and self.should_cache(value):
+                    self._values[key] = (value, time.monotonic())
+                return value
+            finally:
+                # После invalidate здесь может быть уже новая загрузка
+                if self._loading.get(key) is future:
+                    del self._loading[key]
+
+        future = asyncio.ensure_future(load())
+        self._loading[key] = future
+        return future
+
+    @staticmethod
+    def _log_refresh_error(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(f"Ошибка фонового обновления кэша: {future.exception()!r}")
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """
+        Удаляет запись (или все записи, если ключ не указан). Загрузки, начатые
+        до вызова, не сохраняют результат, а следующий get начинает новую.
+        """
+        self._generation += 1
+        if key is None:
+            self._values.clear()
+            self._loading.clear()
+        else:
+            self._values.pop(key, None)
+            self._loading.pop(key, None)
\ No newline at end of file
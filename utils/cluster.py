@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import struct
+import sys
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from aiogram import Bot, Dispatcher
+from aiogram.exceptions import TelegramNetworkError, TelegramServerError
+from aiogram.types import Update
+from config import (
+    CLUSTER_SOCKET_DIR, CLUSTER_WORKER_CONCURRENCY, CLUSTER_START_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+# Кадр в сокете: длина (4 байта) и JSON обновления
+FRAME_HEADER = struct.Struct(">I")
+
+MAIN_SCRIPT = Path(__file__).parent.parent / "main.py"
+
+def socket_path(index: int) -> Path:
+    return Path(CLUSTER_SOCKET_DIR) / f"roxort-worker-{index}.sock"
+
+def worker_command(index: int) -> List[str]:
+    """Команда запуска процесса-обработчика по умолчанию"""
+    return [sys.executable, str(MAIN_SCRIPT), "--worker", str(index)]
+
+def update_key(update: Update) -> int:
+    """
+    Ключ маршрутизации: пользователь, от которого пришло обновление
+    (состояние FSM привязано к нему), иначе чат, иначе само обновление
+    """
+    try:
+        event = update.event
+    except Exception:
+        return update.update_id
+    user = getattr(event, "from_user", None) or getattr(event, "user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(event, "chat", None)
+    if chat is not None:
+        return chat.id
+    return update.update_id
+
+class UpdateRouter:
+    """
+    Приемная сторона: запускает процессы-обработчики и раздает им обновления
+    через Unix-сокеты. Обновления одного пользователя всегда попадают
+    в один процесс и в одном порядке. Упавший процесс перезапускается;
+    обновления, уже записанные в его сокет, теряются.
+    """
+
+    def __init__(self, workers: int, command: Callable[[int], List[str]] = worker_command,
+                 start_timeout: float = CLUSTER_START_TIMEOUT):
+        self.workers = workers
+        self.command = command
+        self.start_timeout = start_timeout
+        self._processes: List[Optional[asyncio.subprocess.Process]] = [None] * workers
+        self._writers: List[Optional[asyncio.StreamWriter]] = [None] * workers
+        self._locks = [asyncio.Lock() for _ in range(workers)]
+        self._watchers: List[asyncio.Task] = []
+        self._closing = False
+
+    async def start(self):
+        await asyncio.gather(*(self._spawn(index) for index in range(self.workers)))
+        logger.info(f"Запущено процессов-обработчиков: {self.workers}")
+
+    async def _spawn(self, index: int):
+        path = socket_path(index)
+        path.unlink(missing_ok=True)
+        process = await asyncio.create_subprocess_exec(*self.command(index))
+
+        deadline = asyncio.get_running_loop().time() + self.start_timeout
+        while True:
+            if process.returncode is not None:
+                raise RuntimeError(f"Процесс-обработчик {index} завершился при запуске с кодом {process.returncode}")
+            try:
+                _, writer = await asyncio.open_unix_connection(str(path))
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if asyncio.get_running_loop().time() > deadline:
+                    process.kill()
+                    raise RuntimeError(f"Процесс-обработчик {index} не открыл сокет за {self.start_timeout} с")
+                await asyncio.sleep(0.1)
+
+        self._processes[index] = process
+        self._writers[index] = writer
+        self._watchers.append(asyncio.create_task(self._watch(index, process)))
+
+    async def _restart(self, index: int, process: asyncio.subprocess.Process):
+        """Перезапускает процесс, если его еще не заменили; вызывается под self._locks[index]"""
+        if self._closing or self._processes[index] is not process:
+            return
+        if process.returncode is None:
+            process.kill()
+        self._writers[index].close()
+        logger.error(f"Процесс-обработчик {index} остановился (код {process.returncode}), перезапускаем")
+        await self._spawn(index)
+
+    async def _watch(self, index: int, process: asyncio.subprocess.Process):
+        await process.wait()
+        async with self._locks[index]:
+            await self._restart(index, process)
+
+    async def route(self, update: Update):
+        """Передает обновление процессу, отвечающему за пользователя"""
+        index = update_key(update) % self.workers
+        data = update.model_dump_json(exclude_unset=True).encode()
+        frame = FRAME_HEADER.pack(len(data)) + data
+        # Блокировка выдается в порядке ожидания, поэтому порядок обновлений сохраняется
+        async with self._locks[index]:
+            while True:
+                process = self._processes[index]
+                try:
+                    self._writers[index].write(frame)
+                    await self._writers[index].drain()
+                    return
+                except (ConnectionError, RuntimeError) as e:
+                    logger.error(f"Не удалось передать обновление процессу {index}: {e}")
+                    await self._restart(index, process)
+
+    async def close(self):
+        """Закрывает сокеты; обработчики доделывают принятые обновления и завершаются"""
+        self._closing = True
+        for watcher in self._watchers:
+            watcher.cancel()
+        for writer in self._writers:
+            if writer is not None:
+                writer.close()
+        for process in self._processes:
+            if process is None:
+                continue
+            try:
+                await asyncio.wait_for(process.wait(), self.start_timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+
+async def poll_updates(bot: Bot, dp: Dispatcher, feed: Callable, timeout: int = 30):
+    """Long polling в приемном процессе: обновления не обрабатываются, а передаются в feed"""
+    offset = None
+    allowed_updates = dp.resolve_used_update_types()
+    while True:
+        try:
+            updates = await bot.get_updates(
+                offset=offset,
+                timeout=timeout,
+                allowed_updates=allowed_updates,
+                request_timeout=timeout + 10
+            )
+        except (TelegramNetworkError, TelegramServerError) as e:
+            logger.error(f"Ошибка при получении обновлений: {e}")
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            offset = update.update_id + 1
+            await feed(update)
+
+async def run_worker(index: int, dp: Dispatcher, bot: Bot):
+    """
+    Процесс-обработчик: принимает обновления из сокета и передает их в dp.
+    Обновления разных пользователей обрабатываются параллельно
+    (не больше CLUSTER_WORKER_CONCURRENCY), одного пользователя - по очереди.
+    Завершается, когда приемный процесс закрывает соединение.
+    """
+    semaphore = asyncio.Semaphore(CLUSTER_WORKER_CONCURRENCY)
+    # Последнее обновление каждого пользователя в обработке
+    tails: Dict[int, asyncio.Task] = {}
+    stopped = asyncio.Event()
+
+    async def process(update: Update, key: int, previous: Optional[asyncio.Task]):
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке обновления {update.update_id}: {e}")
+        finally:
+            semaphore.release()
+            if tails.get(key) is asyncio.current_task():
+                del tails[key]
+
+    async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(FRAME_HEADER.size)
+                    data = await reader.readexactly(FRAME_HEADER.unpack(header)[0])
+                except asyncio.IncompleteReadError:
+                    break
+                update = Update.model_validate_json(data, context={"bot": bot})
+                # Пока все места заняты, сокет не читается и приемный процесс ждет
+                await semaphore.acquire()
+                key = update_key(update)
+                tails[key] = asyncio.create_task(process(update, key, tails.get(key)))
+            if tails:
+                await asyncio.gather(*tails.values(), return_exceptions=True)
+        finally:
+            writer.close()
+            stopped.set()
+
+    path = socket_path(index)
+    path.unlink(missing_ok=True)
+    server = await asyncio.start_unix_server(handle_connection, path=str(path))
+    logger.info(f"Процесс-обработчик {index} слушает {path}")
+    try:
+        await stopped.wait()
+    finally:
+        server.close()
+        path.unlink(missing_ok=True)
\ No newline at end of file
@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import logging
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в PYTHONPATH
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+from database.db import read_session, write_session, create_db_engine
+from database.benchmark import seed, SELLERS, BUYERS
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+TOKEN = "123456:benchmark"
+
+# Сценарий пользователя и начало ответа бота на каждый шаг
+SCENARIO = [
+    ("👤 Профиль", "📊 Ваш профиль"),
+    ("💳 Баланс", "💰 Ваш баланс"),
+    ("📱 Купить номер", "📱 Выберите сервис"),
+    ("❌ Отмена", "Операция отменена"),
+]
+
+class FakeBotAPI:
+    """Минимальный локальный Bot API: принимает ответы бота и запоминает их по чатам"""
+
+    def __init__(self):
+        self.replies = {}
+        self.count = 0
+        self.done = asyncio.Event()
+        self.expected = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        data = dict(await request.post())
+        chat_id = int(data.get("chat_id", 0))
+        self.replies.setdefault(chat_id, []).append(data.get("text", ""))
+        self.count += 1
+        if self.count >= self.expected:
+            self.done.set()
+        return web.json_response({"ok": True, "result": {
+            "message_id": self.count, "date": 0,
+            "chat": {"id": chat_id, "type": "private"}, "text": data.get("text", "")
+        }})
+
+def make_update(update_id: int, user_id: int, text: str) -> Update:
+    user = {"id": user_id, "is_bot": False, "first_name": "user"}
+    return Update.model_validate({"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": text,
+        "chat": {"id": user_id, "type": "private"}, "from": user
+    }})
+
+async def serve_worker(index: int, db_path: Path, api_url: str):
+    """Процесс-обработчик бенчмарка: обработчики бота поверх временной базы и локального Bot API"""
+    from database.fsm_storage import SQLiteStorage
+    from database.order_book import order_book
+    from handlers import register_all_handlers
+    from utils.cluster import run_worker
+
+    writer = create_db_engine(path=db_path)
+    write_session.configure(bind=writer)
+    reader = create_db_engine(path=db_path, read_only=True)
+    read_session.configure(bind=reader)
+
+    bot = Bot(TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)))
+    storage = SQLiteStorage()
+    dp = Dispatcher(storage=storage)
+    register_all_handlers(dp)
+    await order_book.load()
+    try:
+        await run_worker(index, dp, bot)
+    finally:
+        await storage.close()
+        await bot.session.close()
+        await writer.dispose()
+        await reader.dispose()
+
+async def bench(workers: int, args, db_path: Path, api: FakeBotAPI, api_url: str) -> dict:
+    from utils.cluster import UpdateRouter
+
+    def command(index: int):
+        return [sys.executable, __file__, "--serve", str(index), "--db", str(db_path), "--api", api_url]
+
+    router = UpdateRouter(workers, command, start_timeout=args.timeout)
+    await router.start()
+    try:
+        api.replies.clear()
+        api.count = 0
+        api.expected = args.updates
+        api.done.clear()
+
+        users = random.sample(range(SELLERS + 1, SELLERS + BUYERS + 1), args.users)
+        started = time.perf_counter()
+        for update_id in range(args.updates):
+            user_id = users[update_id % len(users)]
+            step = (update_id // len(users)) % len(SCENARIO)
+            await router.route(make_update(update_id + 1, user_id, SCENARIO[step][0]))
+        await asyncio.wait_for(api.done.wait(), args.timeout)
+        elapsed = time.perf_counter() - started
+
+        # Ответы каждому пользователю должны идти в порядке его сообщений
+        out_of_order = 0
+        for user_id, replies in api.replies.items():
+            for step, reply in enumerate(replies):
+                if not reply.startswith(SCENARIO[step % len(SCENARIO)][1]):
+                    out_of_order += 1
+                    break
+        return {"updates/s": args.updates / elapsed, "out of order users": out_of_order}
+    finally:
+        await router.close()
+
+async def main():
+    parser = argparse.ArgumentParser(description="Пропускная способность бота в зависимости от числа процессов-обработчиков")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--updates", type=int, default=6000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--listings", type=int, default=5000)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--dir", default=None, help="Каталог для временной базы (по умолчанию системный)")
+    parser.add_argument("--serve", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--db", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--api", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        await serve_worker(args.serve, Path(args.db), args.api)
+        return
+
+    directory = tempfile.mkdtemp(dir=args.dir)
+    db_path = Path(directory) / "benchmark.db"
+    engine = create_db_engine(path=db_path)
+    write_session.configure(bind=engine)
+    api = FakeBotAPI()
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+    try:
+        random.seed(1)
+        await seed(engine, args.listings)
+        await engine.dispose()
+
+        results = {}
+        for workers in args.workers:
+            results[workers] = await bench(workers, args, db_path, api, f"http://127.0.0.1:{args.port}")
+
+        print(f"{'workers':24}" + "".join(f"{workers:>12}" for workers in results))
+        for metric in next(iter(results.values())):
+            print(f"{metric:24}" + "".join(f"{results[w][metric]:12.1f}" for w in results))
+    finally:
+        await runner.cleanup()
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
@@ -1,39 +1,123 @@
 import aiohttp
+import asyncio
 import hashlib
 import hmac
-from typing import Optional, Dict, Any
+import logging
+import random
+from typing import Optional, Dict, Any, List
+from utils.rate_limit import CircuitBreaker
+from utils.cache import TTLCache
 from config import (
     CRYPTO_BOT_TOKEN,
     CRYPTO_BOT_API_URL,
     CRYPTO_MIN_AMOUNT,
     CRYPTO_CURRENCY,
-    CRYPTO_NETWORK
+    CRYPTO_NETWORK,
+    CRYPTO_POOL_SIZE,
+    CRYPTO_KEEPALIVE_TIMEOUT,
+    CRYPTO_CONNECT_TIMEOUT,
+    CRYPTO_REQUEST_TIMEOUT,
+    CRYPTO_MAX_RETRIES,
+    CRYPTO_RETRY_BASE_DELAY,
+    CRYPTO_BREAKER_THRESHOLD,
+    CRYPTO_BREAKER_RESET,
+    CRYPTO_RATES_TTL,
+    CRYPTO_BALANCE_TTL,
+    CRYPTO_CACHE_STALE_TTL
 )
 
+logger = logging.getLogger(__name__)
+
+# Методы, которые можно безопасно повторить: чтение и перевод
+# (повторный transfer с тем же spend_id CryptoBot не выполняет второй раз)
+IDEMPOTENT_METHODS = {
+    "getMe", "getBalance", "getExchangeRates", "getCurrencies",
+    "getInvoices", "getTransfers", "getStats", "transfer"
+}
+
+# HTTP-статусы, после которых имеет смысл повторить запрос
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def _error(name: str, message: str = "") -> Dict:
+    """Ответ в формате ошибки API, чтобы вызывающий код одинаково проверял поле error"""
+    return {"ok": False, "error": {"code": 0, "name": name, "message": message}}
+
 class CryptoBot:
-    def __init__(self):
-        self.token = CRYPTO_BOT_TOKEN
-        self.api_url = CRYPTO_BOT_API_URL
+    def __init__(self, token: str = CRYPTO_BOT_TOKEN, api_url: str = CRYPTO_BOT_API_URL, ssl=None):
+        self.token = token
+        self.api_url = api_url
+        self.ssl = ssl
+        self.breaker = CircuitBreaker(CRYPTO_BREAKER_THRESHOLD, CRYPTO_BREAKER_RESET)
+        # Ошибки API не кэшируются: следующий вызов повторит запрос
+        self._rates_cache = TTLCache(CRYPTO_RATES_TTL, CRYPTO_CACHE_STALE_TTL, lambda result: result.get("ok"))
+        self._balance_cache = TTLCache(CRYPTO_BALANCE_TTL, CRYPTO_CACHE_STALE_TTL, lambda result: result.get("ok"))
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        """Открывает долгоживущую сессию с пулом keep-alive соединений"""
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=CRYPTO_POOL_SIZE,
+            keepalive_timeout=CRYPTO_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300,
+            ssl=self.ssl
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers={"Crypto-Pay-API-Token": self.token},
+            timeout=aiohttp.ClientTimeout(total=CRYPTO_REQUEST_TIMEOUT, connect=CRYPTO_CONNECT_TIMEOUT)
+        )
+
+    async def close(self):
+        """Закрывает сессию и соединения пула"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
 
     async def _make_request(self, method: str, params: Optional[Dict[str, Any]] = None) -> Dict:
-        """Выполняет запрос к API CryptoBot"""
+        """
+        Выполняет запрос к API CryptoBot через общую сессию.
+        Идемпотентные методы повторяются при сетевых ошибках, таймаутах и 5xx/429
+        с экспоненциальной паузой со случайным разбросом. Пока предохранитель
+        разомкнут, запрос не отправляется и сразу возвращается ошибка.
+        """
+        if self._session is None or self._session.closed:
+            await self.start()
+
         url = f"{self.api_url}/{method}"
-        headers = {"Crypto-Pay-API-Token": self.token}
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=params, headers=headers) as response:
-                return await response.json()
-
-    def verify_signature(self, data: Dict[str, Any], signature: str) -> bool:
-        """Проверяет подпись уведомления от CryptoBot"""
-        sorted_items = sorted(data.items())
-        message = "\n".join(f"{k}={v}" for k, v in sorted_items)
-        hmac_obj = hmac.new(
-            self.token.encode(),
-            message.encode(),
-            hashlib.sha256
-        )
-        return hmac_obj.hexdigest() == signature
+        attempts = CRYPTO_MAX_RETRIES + 1 if method in IDEMPOTENT_METHODS else 1
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                logger.warning(f"CryptoBot недоступен, запрос {method} не отправлен")
+                return _error("SERVICE_UNAVAILABLE", "circuit breaker is open")
+
+            try:
+                # Любое исключение (в том числе неверный JSON) учитывается предохранителем
+                with self.breaker.attempt():
+                    async with self._session.post(url, json=params) as response:
+                        if response.status in RETRY_STATUSES:
+                            raise aiohttp.ClientResponseError(
+                                response.request_info, response.history,
+                                status=response.status, message=response.reason
+                            )
+                        result = await response.json(content_type=None)
+                return result
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Ошибка запроса {method} к CryptoBot (попытка {attempt + 1}): {e!r}")
+                if attempt + 1 < attempts:
+                    await asyncio.sleep(random.uniform(0, CRYPTO_RETRY_BASE_DELAY * 2 ** attempt))
+
+        return _error("REQUEST_FAILED", f"{method} failed after {attempts} attempts")
+
+    def verify_signature(self, body: bytes, signature: str) -> bool:
+        """
+        Проверяет подпись уведомления от CryptoBot:
+        HMAC-SHA256 сырого тела запроса с ключом SHA256(токен)
+        """
+        secret = hashlib.sha256(self.token.encode()).digest()
+        hmac_obj = hmac.new(secret, body, hashlib.sha256)
+        return hmac.compare_digest(hmac_obj.hexdigest(), signature)
 
     async def create_invoice(
         self,
@@ -81,14 +165,34 @@ class CryptoBot:
             "comment": comment
         }
         
-        return await self._make_request("transfer", params)
+        result = await self._make_request("transfer", params)
+        # Перевод меняет баланс приложения
+        self._balance_cache.invalidate()
+        return result
+
+    async def get_invoices(self, invoice_ids: List[int]) -> Dict:
+        """Получает счета по списку ID одним запросом"""
+        params = {
+            "invoice_ids": ",".join(str(invoice_id) for invoice_id in invoice_ids),
+            "count": len(invoice_ids)
+        }
+        return await self._make_request("getInvoices", params)
+
+    async def get_transfers(self, spend_id: Optional[str] = None, count: int = 100) -> Dict:
+        """Получает переводы приложения (по spend_id - только этот перевод)"""
+        params = {"asset": CRYPTO_CURRENCY, "count": count}
+        if spend_id:
+            params["spend_id"] = spend_id
+        return await self._make_request("getTransfers", params)
 
-    async def get_balance(self) -> Dict:
-        """Получает баланс бота"""
-        return await self._make_request("getBalance")
+    async def get_balance(self, fresh: bool = False) -> Dict:
+        """Получает баланс бота (из кэша, если не запрошен свежий)"""
+        if fresh:
+            self._balance_cache.invalidate()
+        return await self._balance_cache.get("balance", lambda: self._make_request("getBalance"))
 
     async def get_exchange_rates(self) -> Dict:
-        """Получает курсы обмена"""
-        return await self._make_request("getExchangeRates")
+        """Получает курсы обмена (из кэша)"""
+        return await self._rates_cache.get("rates", lambda: self._make_request("getExchangeRates"))
 
 crypto_bot = CryptoBot() 
\ No newline at end of file
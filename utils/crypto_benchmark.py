@@ -0,0 +1,150 @@
+import argparse
+import asyncio
+import logging
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в PYTHONPATH
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+import aiohttp
+from aiohttp import web
+from utils.crypto import CryptoBot
+
+logging.basicConfig(level=logging.ERROR)
+
+TOKEN = "1:benchmark"
+
+class StubCryptoPay:
+    """Локальная заглушка Crypto Pay API с задержкой ответа и отказами по запросу"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.failing = False
+        self.requests = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.failing:
+            return web.json_response({"ok": False}, status=503)
+        await asyncio.sleep(self.delay)
+        params = await request.json()
+        return web.json_response({"ok": True, "result": {
+            "invoice_id": self.requests,
+            "amount": params.get("amount"),
+            "pay_url": f"https://t.me/CryptoBot?start=IV{self.requests}"
+        }})
+
+def make_certificate(directory: Path) -> ssl.SSLContext:
+    """Самоподписанный сертификат для localhost через openssl"""
+    cert, key = directory / "cert.pem", directory / "key.pem"
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-keyout", str(key), "-out", str(cert)],
+        check=True, capture_output=True
+    )
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert, key)
+    return context
+
+def percentile(values, share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
+
+async def invoice_per_session(api_url: str, client_ssl) -> dict:
+    """Прежнее поведение: новая сессия (и новое соединение) на каждый запрос"""
+    async with aiohttp.ClientSession() as session:
+        async with session.post(
+            f"{api_url}/createInvoice",
+            json={"asset": "USDT", "amount": "1", "payload": str(uuid.uuid4())},
+            headers={"Crypto-Pay-API-Token": TOKEN},
+            ssl=client_ssl
+        ) as response:
+            return await response.json()
+
+async def measure(create, count: int, concurrency: int) -> dict:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            result = await create()
+            if "error" not in result:
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(count)))
+    elapsed = time.perf_counter() - started
+    return {
+        "invoices/s": len(latencies) / elapsed,
+        "p50, ms": percentile(latencies, 0.5) * 1000,
+        "p95, ms": percentile(latencies, 0.95) * 1000,
+        "errors": count - len(latencies),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Задержка создания счета: сессия на запрос против общего пула")
+    parser.add_argument("--invoices", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 20])
+    parser.add_argument("--delay", type=float, default=0.005, help="Задержка ответа заглушки (в секундах)")
+    parser.add_argument("--no-tls", action="store_true", help="Без TLS (по умолчанию самоподписанный сертификат)")
+    parser.add_argument("--port", type=int, default=8443)
+    args = parser.parse_args()
+
+    stub = StubCryptoPay(args.delay)
+    app = web.Application()
+    app.router.add_post("/api/{method}", stub.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+
+    server_ssl = client_ssl = None
+    scheme = "http"
+    if not args.no_tls:
+        directory = Path(tempfile.mkdtemp())
+        server_ssl = make_certificate(directory)
+        client_ssl = ssl.create_default_context(cafile=str(directory / "cert.pem"))
+        shutil.rmtree(directory, ignore_errors=True)
+        scheme = "https"
+    await web.TCPSite(runner, "127.0.0.1", args.port, ssl_context=server_ssl).start()
+    api_url = f"{scheme}://localhost:{args.port}/api"
+
+    client = CryptoBot(token=TOKEN, api_url=api_url, ssl=client_ssl)
+    await client.start()
+    try:
+        results = {}
+        for concurrency in args.concurrency:
+            results[f"session c={concurrency}"] = await measure(
+                lambda: invoice_per_session(api_url, client_ssl), args.invoices, concurrency
+            )
+            results[f"pooled c={concurrency}"] = await measure(
+                lambda: client.create_invoice(1, "benchmark", payload=str(uuid.uuid4())),
+                args.invoices, concurrency
+            )
+
+        print(f"{'':16}" + "".join(f"{name:>16}" for name in results))
+        for metric in next(iter(results.values())):
+            print(f"{metric:16}" + "".join(f"{results[name][metric]:16.1f}" for name in results))
+
+        # Отказ сервиса: после CRYPTO_BREAKER_THRESHOLD ошибок запросы перестают уходить
+        stub.failing = True
+        stub.requests = 0
+        started = time.perf_counter()
+        for _ in range(50):
+            await client.get_balance()
+        elapsed = time.perf_counter() - started
+        print(f"\nCryptoPay отвечает 503: 50 вызовов getBalance за {elapsed:.2f} с, "
+              f"до сервера дошло {stub.requests} запросов, предохранитель: {client.breaker.state}")
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
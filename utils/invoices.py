@@ -0,0 +1,188 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from aiogram import Bot
+from sqlalchemy import select, update
+from database.db import read_session, write_session
+from database.models import Invoice, User
+from database.ledger import transfer, user_account, to_micro, SYSTEM_DEPOSITS
+from utils.crypto import crypto_bot
+from config import (
+    CRYPTO_CURRENCY, INVOICE_POLL_MIN_INTERVAL, INVOICE_POLL_MAX_INTERVAL,
+    INVOICE_BATCH_SIZE, INVOICE_FORGET_AFTER
+)
+
+logger = logging.getLogger(__name__)
+
+async def credit_deposit(bot: Optional[Bot], payload: str, amount: str) -> bool:
+    """
+    Зачисляет оплаченный счет на баланс пользователя.
+    Ключ операции в журнале - deposit:<payload>, поэтому веб-хук и проверка
+    через getInvoices зачисляют один счет ровно один раз. Возвращает False,
+    если счет уже был зачислен; при неверном payload бросает ValueError.
+    """
+    if not payload.startswith("deposit_"):
+        raise ValueError(f"Неверный payload счета: {payload}")
+    _, user_id, _ = payload.split("_")
+    user_id = int(user_id)
+
+    async with write_session() as session:
+        if await session.get(User, user_id) is None:
+            raise ValueError(f"Пользователь {user_id} не найден")
+
+        credited = await transfer(
+            session,
+            f"deposit:{payload}",
+            SYSTEM_DEPOSITS,
+            user_account(user_id),
+            to_micro(amount),
+            "deposit"
+        )
+        await session.execute(
+            update(Invoice)
+            .where(Invoice.payload == payload, Invoice.status == "active")
+            .values(status="paid", paid_at=datetime.utcnow())
+        )
+        await session.commit()
+
+    if credited and bot is not None:
+        try:
+            await bot.send_message(
+                user_id,
+                f"✅ Баланс пополнен!\n"
+                f"Сумма: {float(amount)} {CRYPTO_CURRENCY}"
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось уведомить пользователя {user_id} о пополнении: {e}")
+    return credited
+
+class InvoicePoller:
+    """
+    Проверка открытых счетов через getInvoices - запасной путь на случай,
+    если уведомление веб-хука не пришло. Открытые счета запрашиваются
+    списками ID по INVOICE_BATCH_SIZE. Интервал между проверками
+    начинается с INVOICE_POLL_MIN_INTERVAL после создания или оплаты счета
+    и удваивается после каждой проверки без изменений до INVOICE_POLL_MAX_INTERVAL.
+    Пока открытых счетов нет, запросы не отправляются.
+    """
+
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._bot: Optional[Bot] = None
+
+    def start(self, bot: Bot):
+        """Запускает фоновую проверку (только в одном процессе)"""
+        self._bot = bot
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def register(self, invoice_id: int, user_id: int, payload: str, amount: float):
+        """Сохраняет созданный счет, чтобы проверять его оплату"""
+        async with write_session() as session:
+            session.add(Invoice(
+                invoice_id=invoice_id,
+                user_id=user_id,
+                payload=payload,
+                amount_micro=to_micro(amount),
+                status="active"
+            ))
+            await session.commit()
+        self._wakeup.set()
+
+    async def _run(self):
+        interval = INVOICE_POLL_MIN_INTERVAL
+        while True:
+            self._wakeup.clear()
+            has_active, changed = True, False
+            try:
+                has_active, changed = await self.check()
+            except Exception as e:
+                logger.error(f"Ошибка при проверке счетов: {e}")
+
+            if changed:
+                interval = INVOICE_POLL_MIN_INTERVAL
+            elif has_active:
+                interval = min(interval * 2, INVOICE_POLL_MAX_INTERVAL)
+            else:
+                interval = INVOICE_POLL_MAX_INTERVAL
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), interval)
+                # Новый счет: скорее всего его оплатят в ближайшие минуты
+                interval = INVOICE_POLL_MIN_INTERVAL
+                await asyncio.sleep(INVOICE_POLL_MIN_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def check(self):
+        """
+        Проверяет все открытые счета. Возвращает пару (остались ли открытые счета,
+        изменился ли статус хотя бы одного).
+        """
+        async with read_session() as session:
+            result = await session.execute(
+                select(Invoice.invoice_id, Invoice.payload, Invoice.created_at)
+                .where(Invoice.status == "active")
+                .order_by(Invoice.invoice_id)
+            )
+            invoices = result.all()
+        if not invoices:
+            return False, False
+
+        changed = 0
+        open_left = 0
+        for start in range(0, len(invoices), INVOICE_BATCH_SIZE):
+            batch = invoices[start:start + INVOICE_BATCH_SIZE]
+            response = await crypto_bot.get_invoices([invoice.invoice_id for invoice in batch])
+            if not response.get("ok"):
+                logger.warning(f"getInvoices не выполнен: {response.get('error')}")
+                return True, False
+            items: Dict[int, dict] = {item["invoice_id"]: item for item in response["result"].get("items", [])}
+
+            expired: List[int] = []
+            forget_before = datetime.utcnow() - timedelta(seconds=INVOICE_FORGET_AFTER)
+            for invoice in batch:
+                item = items.get(invoice.invoice_id)
+                status = item["status"] if item else None
+                if status == "paid":
+                    try:
+                        await credit_deposit(self._bot, invoice.payload, item["amount"])
+                    except ValueError as e:
+                        logger.error(f"Счет {invoice.invoice_id} не зачислен: {e}")
+                        await self._set_status([invoice.invoice_id], "failed")
+                    changed += 1
+                elif status == "expired" or (item is None and invoice.created_at < forget_before):
+                    expired.append(invoice.invoice_id)
+                else:
+                    open_left += 1
+
+            if expired:
+                await self._set_status(expired, "expired")
+                changed += len(expired)
+
+        if changed:
+            logger.info(f"Проверка счетов: изменилось {changed}, открыто {open_left}")
+        return open_left > 0, changed > 0
+
+    async def _set_status(self, invoice_ids: List[int], status: str):
+        async with write_session() as session:
+            await session.execute(
+                update(Invoice)
+                .where(Invoice.invoice_id.in_(invoice_ids), Invoice.status == "active")
+                .values(status=status)
+            )
+            await session.commit()
+
+# Общая проверка счетов
+invoice_poller = InvoicePoller()
\ No newline at end of file
@@ -0,0 +1,69 @@
+import argparse
+import logging
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в PYTHONPATH
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import SendMessage
+from utils.keyboards import KeyboardSession, keyboards
+from database.order_book import BookEntry
+from handlers.common import _main_keyboard, get_admin_keyboard
+from handlers.buying import get_filter_keyboard, _services_keyboard, build_catalogue_page
+from config import LISTINGS_PAGE_SIZE
+
+logging.basicConfig(level=logging.ERROR)
+
+TOKEN = "1:benchmark"
+
+def catalogue_page():
+    """Страница каталога из LISTINGS_PAGE_SIZE объявлений с навигацией"""
+    listings = [
+        BookEntry(
+            id=i, seller_id=i, service="telegram", price=1.5 + i, rental_period=24,
+            created_at=datetime(2025, 1, 1), seller_rating=4.5, seller_reputation=4.2
+        )
+        for i in range(LISTINGS_PAGE_SIZE)
+    ]
+    return build_catalogue_page(listings, "telegram", "new", True, True)[1]
+
+def measure(render, session, bot: Bot, count: int) -> float:
+    """Среднее время в микросекундах: клавиатура + тело запроса sendMessage"""
+    started = time.perf_counter()
+    for _ in range(count):
+        method = SendMessage(chat_id=1, text="меню", reply_markup=render())
+        session.build_form_data(bot, method)
+    return (time.perf_counter() - started) / count * 1_000_000
+
+def main():
+    parser = argparse.ArgumentParser(description="Стоимость клавиатуры на одно обновление: сборка заново против реестра")
+    parser.add_argument("--count", type=int, default=5000, help="Повторов на каждую клавиатуру")
+    args = parser.parse_args()
+
+    bot = Bot(TOKEN)
+    plain, cached = AiohttpSession(), KeyboardSession()
+    # builder.__wrapped__ - исходный построитель без кэша
+    cases = {
+        "главное меню": (lambda: _main_keyboard.__wrapped__(False), lambda: _main_keyboard(False)),
+        "меню админа": (get_admin_keyboard.__wrapped__, get_admin_keyboard),
+        "фильтры": (get_filter_keyboard.__wrapped__, get_filter_keyboard),
+        "сервисы": (_services_keyboard.__wrapped__, _services_keyboard),
+        "каталог": (catalogue_page, catalogue_page),
+    }
+
+    print(f"{'':16}{'заново, мкс':>14}{'реестр, мкс':>14}{'ускорение':>12}")
+    for name, (fresh, registered) in cases.items():
+        registered()  # первая сборка регистрирует клавиатуру
+        before = measure(fresh, plain, bot, args.count)
+        after = measure(registered, cached, bot, args.count)
+        print(f"{name:16}{before:14.1f}{after:14.1f}{before / after:11.1f}x")
+    print(f"\nЗарегистрировано клавиатур: {len(keyboards)}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,107 @@
+import logging
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from aiohttp import FormData
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import InlineKeyboardMarkup, ReplyKeyboardMarkup, InlineKeyboardButton, KeyboardButton
+
+logger = logging.getLogger(__name__)
+
+Markup = Union[InlineKeyboardMarkup, ReplyKeyboardMarkup]
+
+class KeyboardRegistry:
+    """
+    Клавиатуры, которые строятся один раз: статические меню (по варианту,
+    например для администратора и обычного пользователя) и готовые ряды
+    кнопок для сборки динамических клавиатур. Для каждой зарегистрированной
+    клавиатуры заранее готовится JSON для Bot API, и KeyboardSession
+    отправляет его, не сериализуя клавиатуру заново.
+    Зарегистрированные объекты общие для всех вызовов - их нельзя изменять.
+    """
+
+    def __init__(self):
+        # id(клавиатуры) -> (клавиатура, готовый JSON)
+        self._serialized: Dict[int, Tuple[Markup, str]] = {}
+
+    def register(self, markup: Markup) -> Markup:
+        """Запоминает клавиатуру и ее JSON"""
+        self._serialized[id(markup)] = (markup, markup.model_dump_json(exclude_none=True))
+        return markup
+
+    def serialized(self, markup: Any) -> Optional[str]:
+        """Готовый JSON клавиатуры или None, если она не зарегистрирована"""
+        entry = self._serialized.get(id(markup))
+        if entry is not None and entry[0] is markup:
+            return entry[1]
+        return None
+
+    def static(self, builder: Callable[..., Markup]) -> Callable[..., Markup]:
+        """
+        Декоратор построителя статической клавиатуры: для каждого набора
+        аргументов (варианта) клавиатура строится и регистрируется один раз
+        """
+        variants: Dict[tuple, Markup] = {}
+
+        @wraps(builder)
+        def get(*args) -> Markup:
+            markup = variants.get(args)
+            if markup is None:
+                markup = variants[args] = self.register(builder(*args))
+            return markup
+
+        return get
+
+    @staticmethod
+    def row(builder: Callable[..., List[Union[InlineKeyboardButton, KeyboardButton]]]):
+        """
+        Декоратор построителя ряда кнопок: ряд для каждого набора аргументов
+        создается один раз и переиспользуется в динамических клавиатурах
+        """
+        rows: Dict[tuple, list] = {}
+
+        @wraps(builder)
+        def get(*args) -> list:
+            row = rows.get(args)
+            if row is None:
+                row = rows[args] = builder(*args)
+            return row
+
+        return get
+
+    def __len__(self):
+        return len(self._serialized)
+
+class KeyboardSession(AiohttpSession):
+    """
+    Сессия Bot API с быстрой сериализацией клавиатур: для зарегистрированных
+    подставляется готовый JSON, остальные (каталог и другие динамические)
+    сериализуются одним вызовом pydantic вместо рекурсивного prepare_value
+    """
+
+    def build_form_data(self, bot: Bot, method: TelegramMethod) -> FormData:
+        markup = getattr(method, "reply_markup", None)
+        if not isinstance(markup, (InlineKeyboardMarkup, ReplyKeyboardMarkup)):
+            return super().build_form_data(bot, method)
+        serialized = keyboards.serialized(markup) or markup.model_dump_json(exclude_none=True)
+
+        # То же, что AiohttpSession.build_form_data, но клавиатура уже сериализована
+        form = FormData(quote_fields=False)
+        files: Dict[str, Any] = {}
+        for key, value in method.model_dump(warnings=False, exclude={"reply_markup"}).items():
+            value = self.prepare_value(value, bot=bot, files=files)
+            if not value:
+                continue
+            form.add_field(key, value)
+        form.add_field("reply_markup", serialized)
+        for key, value in files.items():
+            form.add_field(
+                key,
+                value.read(bot),
+                filename=value.filename or key
+            )
+        return form
+
+# Общий реестр клавиатур
+keyboards = KeyboardRegistry()
\ No newline at end of file
@@ -0,0 +1,104 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import TelegramObject, CallbackQuery, Message
+from database.user_cache import user_cache
+from database.gatekeeper import gatekeeper
+from utils.rate_limit import RateLimiter
+from config import THROTTLE_RATES, THROTTLE_CALLBACK_DEBOUNCE
+
+logger = logging.getLogger(__name__)
+
+class GatekeeperMiddleware(BaseMiddleware):
+    """
+    Отбрасывает обновления заблокированных пользователей до фильтров,
+    обработчиков и запросов к базе; остальным передает аргумент is_admin.
+    Проверки идут по множествам gatekeeper в памяти.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        if from_user is not None and gatekeeper.is_blocked(from_user.id):
+            logger.debug(f"Обновление заблокированного пользователя {from_user.id} отброшено")
+            return None
+        data["is_admin"] = from_user is not None and gatekeeper.is_admin(from_user.id)
+        return await handler(event, data)
+
+class UserMiddleware(BaseMiddleware):
+    """
+    Загружает пользователя, от которого пришло обновление, один раз на
+    обновление (через user_cache) и передает его обработчикам аргументом
+    user: объект User или None, если пользователь не зарегистрирован.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        data["user"] = await user_cache.get(from_user.id) if from_user else None
+        return await handler(event, data)
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Ограничивает частоту запросов пользователя к каждому обработчику:
+    ведро токенов на пару (пользователь, throttling_key) с лимитами из
+    THROTTLE_RATES. Ключ задается флагом обработчика
+    flags={"throttling_key": ...}, без флага используется "default".
+    Повторное нажатие той же inline-кнопки раньше THROTTLE_CALLBACK_DEBOUNCE
+    секунд молча игнорируется. На администраторов действуют только лимиты
+    обработчиков с явным ключом (например, тяжелая статистика).
+    """
+
+    def __init__(self):
+        self.limiter = RateLimiter()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        if from_user is None:
+            return await handler(event, data)
+
+        if isinstance(event, CallbackQuery):
+            debounce_key = (from_user.id, "callback", event.data)
+            if not self.limiter.allow(debounce_key, 1 / THROTTLE_CALLBACK_DEBOUNCE, 1):
+                await event.answer()
+                return None
+
+        key = get_flag(data, "throttling_key", default="default")
+        if key == "default" and data.get("is_admin"):
+            return await handler(event, data)
+        rate, burst = THROTTLE_RATES.get(key, THROTTLE_RATES["default"])
+        if self.limiter.allow((from_user.id, key), rate, burst):
+            return await handler(event, data)
+
+        logger.info(f"Запрос пользователя {from_user.id} к {key} отклонен ограничением частоты")
+        if isinstance(event, CallbackQuery):
+            await event.answer("⏳ Слишком часто, подождите немного")
+        elif isinstance(event, Message):
+            # Предупреждаем не чаще раза в 10 секунд, чтобы не отвечать на каждое сообщение флуда
+            if self.limiter.allow((from_user.id, "notice"), 0.1, 1):
+                await event.answer("⏳ Слишком много запросов, подождите немного")
+        return None
+
+def register_middlewares(dp: Dispatcher):
+    """Регистрация промежуточных обработчиков для всех обновлений"""
+    # Порядок важен: заблокированные отсекаются до загрузки пользователя
+    dp.update.outer_middleware(GatekeeperMiddleware())
+    dp.update.outer_middleware(UserMiddleware())
+    # Внутренние: срабатывают после фильтров, когда известен обработчик и его флаги
+    throttling = ThrottlingMiddleware()
+    dp.message.middleware(throttling)
+    dp.callback_query.middleware(throttling)
\ No newline at end of file
@@ -0,0 +1,379 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from aiogram import Bot
+from sqlalchemy import select, update
+from database.db import read_session, write_session
+from database.models import Payout
+from database.ledger import (
+    transfer, user_account, to_micro, from_micro, InsufficientFunds,
+    SYSTEM_PAYOUTS, SYSTEM_WITHDRAWALS
+)
+from utils.crypto import crypto_bot
+from config import (
+    ADMIN_IDS, CRYPTO_CURRENCY, PAYOUT_AUTO_APPROVE_LIMIT, PAYOUT_CONCURRENCY, PAYOUT_BATCH_SIZE,
+    PAYOUT_POLL_INTERVAL, PAYOUT_RECONCILE_DELAY, PAYOUT_MAX_ATTEMPTS
+)
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых неизвестно, дошел ли перевод до CryptoBot
+UNCERTAIN_ERRORS = {"REQUEST_FAILED", "SERVICE_UNAVAILABLE"}
+
+# Ошибки, которые исправляет администратор (например, пополнив баланс приложения)
+HOLD_ERRORS = {"INSUFFICIENT_FUNDS"}
+
+def format_request(payout: Payout) -> str:
+    """Ответ пользователю о принятой заявке на вывод"""
+    text = (
+        f"✅ Заявка на вывод #{payout.id} принята.\n"
+        f"Сумма: {from_micro(payout.payout_micro)} {CRYPTO_CURRENCY}\n\n"
+    )
+    if payout.status == "approved":
+        return text + "Средства поступят на ваш счет в @CryptoBot в течение нескольких минут."
+    if payout.status == "manual":
+        return text + "Администратор отправит средства на указанный адрес и сообщит о выплате."
+    return text + "Заявка ожидает одобрения администратора, мы сообщим о выплате."
+
+class PayoutQueue:
+    """
+    Очередь выплат через CryptoBot.
+    Заявка сохраняется в таблице payouts в одной транзакции со списанием суммы
+    на удерживающий счет SYSTEM_PAYOUTS, поэтому обработчик отвечает сразу.
+    Фоновый обработчик забирает одобренные выплаты пачками, помечает их
+    отправляемыми (sending) до запроса и переводит не больше PAYOUT_CONCURRENCY
+    одновременно. Выплата, по которой нет ответа (сбой сети, перезапуск бота),
+    сверяется через getTransfers по spend_id: найденный перевод завершается,
+    ненайденный отправляется снова с тем же spend_id.
+    Выплаты на внешний адрес (address) CryptoBot не переводит: они получают
+    статус manual, администратор отправляет их вручную и отмечает выполненными.
+    """
+
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._bot: Optional[Bot] = None
+
+    def start(self, bot: Bot):
+        """Запускает фоновый обработчик (только в одном процессе)"""
+        self._bot = bot
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def enqueue(self, user_id: int, amount_micro: int, payout_micro: Optional[int] = None,
+                      address: Optional[str] = None, approve: bool = True) -> Payout:
+        """
+        Создает выплату и удерживает amount_micro с баланса пользователя.
+        Без approve или свыше PAYOUT_AUTO_APPROVE_LIMIT выплата ждет одобрения
+        администратора; выплата на address всегда выполняется вручную.
+        При нехватке средств бросает InsufficientFunds.
+        """
+        if payout_micro is None:
+            payout_micro = amount_micro
+        spend_id = str(uuid.uuid4())
+        approved = approve and address is None and payout_micro <= to_micro(PAYOUT_AUTO_APPROVE_LIMIT)
+        if address is not None:
+            status = "manual"
+        else:
+            status = "approved" if approved else "pending"
+
+        async with write_session() as session:
+            payout = Payout(
+                spend_id=spend_id,
+                user_id=user_id,
+                amount_micro=amount_micro,
+                payout_micro=payout_micro,
+                address=address,
+                status=status,
+                attempts=0
+            )
+            session.add(payout)
+            try:
+                await transfer(
+                    session,
+                    f"payout:{spend_id}",
+                    user_account(user_id),
+                    SYSTEM_PAYOUTS,
+                    amount_micro,
+                    "withdrawal"
+                )
+            except InsufficientFunds:
+                await session.rollback()
+                raise
+            await session.commit()
+
+        if approved:
+            self._wakeup.set()
+        return payout
+
+    async def approve(self, up_to_id: int) -> int:
+        """
+        Одобряет одним запросом все ожидающие выплаты с id не больше up_to_id,
+        то есть те, что видел администратор. Выплаты на адрес не затрагиваются.
+        Возвращает количество одобренных.
+        """
+        async with write_session() as session:
+            result = await session.execute(
+                update(Payout)
+                .where(Payout.status == "pending", Payout.address.is_(None), Payout.id <= up_to_id)
+                .values(status="approved", attempts=0, error=None, updated_at=datetime.utcnow())
+            )
+            await session.commit()
+        self._wakeup.set()
+        return result.rowcount
+
+    async def complete_manual(self, payout_id: int) -> Optional[Payout]:
+        """
+        Отмечает выплату на адрес выполненной после ручного перевода
+        администратором. Возвращает None, если выплата уже обработана.
+        """
+        async with read_session() as session:
+            payout = await session.get(Payout, payout_id)
+        if payout is None or payout.status != "manual":
+            return None
+        if not await self._complete(payout, None, from_status="manual"):
+            return None
+        return payout
+
+    async def reject(self, payout_id: int) -> Optional[Payout]:
+        """Отклоняет ожидающую выплату и возвращает сумму на баланс пользователя"""
+        payout = await self._refund(payout_id, ("pending", "manual"), "rejected", "отклонена администратором")
+        if payout is not None:
+            await self._notify(
+                payout.user_id,
+                f"❌ Заявка на вывод #{payout.id} отклонена администратором.\n"
+                f"Сумма {from_micro(payout.amount_micro)} возвращена на баланс."
+            )
+        return payout
+
+    async def _run(self):
+        try:
+            await self.reconcile(delay=0)
+        except Exception as e:
+            logger.error(f"Ошибка при сверке выплат после запуска: {e}")
+
+        while True:
+            self._wakeup.clear()
+            claimed = 0
+            try:
+                claimed = await self._process_batch()
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"Ошибка в очереди выплат: {e}")
+            if claimed < PAYOUT_BATCH_SIZE:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), PAYOUT_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _process_batch(self) -> int:
+        """Забирает пачку одобренных выплат и отправляет их. Возвращает размер пачки"""
+        async with write_session() as session:
+            result = await session.scalars(
+                select(Payout)
+                .where(Payout.status == "approved", Payout.address.is_(None))
+                .order_by(Payout.id)
+                .limit(PAYOUT_BATCH_SIZE)
+            )
+            payouts = result.all()
+            if not payouts:
+                return 0
+            # Статус sending фиксируется до запроса: после сбоя такие выплаты
+            # не отправляются повторно, пока сверка не покажет, что перевода не было
+            await session.execute(
+                update(Payout)
+                .where(Payout.id.in_([payout.id for payout in payouts]))
+                .values(status="sending", attempts=Payout.attempts + 1, updated_at=datetime.utcnow())
+            )
+            await session.commit()
+
+        semaphore = asyncio.Semaphore(PAYOUT_CONCURRENCY)
+
+        async def send(payout: Payout):
+            async with semaphore:
+                try:
+                    await self._send(payout)
+                except Exception as e:
+                    # Выплата остается в статусе sending и будет сверена
+                    logger.error(f"Ошибка при отправке выплаты #{payout.id}: {e}")
+
+        await asyncio.gather(*(send(payout) for payout in payouts))
+        return len(payouts)
+
+    async def _send(self, payout: Payout):
+        try:
+            result = await crypto_bot.transfer(
+                user_id=payout.user_id,
+                amount=from_micro(payout.payout_micro),
+                spend_id=payout.spend_id,
+                comment="Вывод средств из ROXORT SMS"
+            )
+        except ValueError as e:
+            await self._fail(payout, str(e))
+            return
+
+        if result.get("ok"):
+            await self._complete(payout, result["result"].get("transfer_id"))
+            return
+
+        error = result.get("error") or {}
+        name = error.get("name", "")
+        if name in UNCERTAIN_ERRORS:
+            logger.warning(f"Нет ответа на выплату #{payout.id}, она будет сверена позже")
+        elif name in HOLD_ERRORS:
+            await self._hold(payout, name)
+        else:
+            await self._fail(payout, name or str(error))
+
+    async def reconcile(self, delay: Optional[float] = None) -> int:
+        """
+        Сверяет с CryptoBot выплаты, которые находятся в статусе sending дольше
+        delay секунд (по умолчанию PAYOUT_RECONCILE_DELAY).
+        Возвращает количество выплат, судьба которых выяснена.
+        """
+        if delay is None:
+            delay = PAYOUT_RECONCILE_DELAY
+        border = datetime.utcnow() - timedelta(seconds=delay)
+        async with read_session() as session:
+            result = await session.scalars(
+                select(Payout)
+                .where(Payout.status == "sending", Payout.updated_at <= border)
+                .order_by(Payout.id)
+            )
+            payouts = result.all()
+        if not payouts:
+            return 0
+
+        semaphore = asyncio.Semaphore(PAYOUT_CONCURRENCY)
+
+        async def check(payout: Payout) -> bool:
+            async with semaphore:
+                result = await crypto_bot.get_transfers(spend_id=payout.spend_id)
+            if not result.get("ok"):
+                # CryptoBot недоступен: сверим в следующий раз
+                return False
+            items = result["result"].get("items", [])
+            done = next((item for item in items if item.get("spend_id") == payout.spend_id), None)
+            if done is not None:
+                await self._complete(payout, done.get("transfer_id"))
+            elif payout.attempts >= PAYOUT_MAX_ATTEMPTS:
+                await self._hold(payout, f"не удалось отправить за {payout.attempts} попыток")
+            else:
+                # Перевода не было: отправляем снова с тем же spend_id
+                async with write_session() as session:
+                    await session.execute(
+                        update(Payout)
+                        .where(Payout.id == payout.id, Payout.status == "sending")
+                        .values(status="approved", updated_at=datetime.utcnow())
+                    )
+                    await session.commit()
+                self._wakeup.set()
+            return True
+
+        results = await asyncio.gather(*(check(payout) for payout in payouts))
+        resolved = sum(results)
+        logger.info(f"Сверка выплат: проверено {len(payouts)}, выяснено {resolved}")
+        return resolved
+
+    async def _complete(self, payout: Payout, transfer_id: Optional[int], from_status: str = "sending") -> bool:
+        """Завершает выплату: удержанная сумма уходит со счета платформы"""
+        now = datetime.utcnow()
+        async with write_session() as session:
+            result = await session.execute(
+                update(Payout)
+                .where(Payout.id == payout.id, Payout.status == from_status)
+                .values(status="completed", transfer_id=transfer_id, error=None,
+                        updated_at=now, finished_at=now)
+            )
+            if result.rowcount == 0:
+                await session.rollback()
+                return False
+            await transfer(
+                session,
+                f"withdrawal:{payout.spend_id}",
+                SYSTEM_PAYOUTS,
+                SYSTEM_WITHDRAWALS,
+                payout.amount_micro,
+                "withdrawal"
+            )
+            await session.commit()
+
+        logger.info(f"Выплата #{payout.id} пользователю {payout.user_id} выполнена (перевод {transfer_id})")
+        await self._notify(
+            payout.user_id,
+            f"✅ Средства успешно выведены!\n"
+            f"Сумма: {from_micro(payout.payout_micro)} {CRYPTO_CURRENCY}"
+        )
+        return True
+
+    async def _fail(self, payout: Payout, error: str):
+        """Выплата отклонена CryptoBot: сумма возвращается пользователю"""
+        logger.error(f"Выплата #{payout.id} отклонена CryptoBot: {error}")
+        if await self._refund(payout.id, ("sending",), "failed", error) is not None:
+            await self._notify(
+                payout.user_id,
+                f"❌ Не удалось вывести средства (заявка #{payout.id}).\n"
+                f"Сумма {from_micro(payout.amount_micro)} возвращена на баланс."
+            )
+
+    async def _refund(self, payout_id: int, from_statuses: Tuple[str, ...], status: str, error: str) -> Optional[Payout]:
+        now = datetime.utcnow()
+        async with write_session() as session:
+            payout = await session.get(Payout, payout_id)
+            if payout is None or payout.status not in from_statuses:
+                return None
+            payout.status = status
+            payout.error = error
+            payout.updated_at = now
+            payout.finished_at = now
+            await transfer(
+                session,
+                f"payout_refund:{payout.spend_id}",
+                SYSTEM_PAYOUTS,
+                user_account(payout.user_id),
+                payout.amount_micro,
+                "withdrawal"
+            )
+            await session.commit()
+        return payout
+
+    async def _hold(self, payout: Payout, error: str):
+        """Возвращает выплату на одобрение администратора; удержание сохраняется"""
+        async with write_session() as session:
+            await session.execute(
+                update(Payout)
+                .where(Payout.id == payout.id, Payout.status == "sending")
+                .values(status="pending", error=error, updated_at=datetime.utcnow())
+            )
+            await session.commit()
+
+        logger.warning(f"Выплата #{payout.id} ждет администратора: {error}")
+        for admin_id in ADMIN_IDS:
+            await self._notify(
+                admin_id,
+                f"⚠️ Выплата #{payout.id} остановлена: {error}\n"
+                f"Сумма: {from_micro(payout.payout_micro)} {CRYPTO_CURRENCY}\n"
+                "Одобрите ее повторно в разделе «💸 Выплаты»."
+            )
+
+    async def _notify(self, chat_id: int, text: str):
+        if self._bot is None:
+            return
+        try:
+            await self._bot.send_message(chat_id, text)
+        except Exception as e:
+            logger.warning(f"Не удалось отправить уведомление о выплате {chat_id}: {e}")
+
+# Общая очередь выплат
+payout_queue = PayoutQueue()
\ No newline at end of file
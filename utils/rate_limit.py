@@ -0,0 +1,173 @@
+import asyncio
+import math
+import time
+from contextlib import contextmanager
+from typing import Dict, Hashable, List, Optional, Set
+
+class TokenBucket:
+    """
+    Ограничитель частоты «ведро токенов»: не больше rate операций в секунду
+    в среднем и не больше capacity подряд. Ожидающие обслуживаются по очереди.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, tokens: float = 1):
+        """Ждет, пока в ведре наберется tokens токенов, и забирает их"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Останавливает выдачу токенов на seconds секунд (например, после ответа 429)"""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0
+        self._updated_at = max(self._updated_at, self._paused_until)
+
+class CircuitBreaker:
+    """
+    Предохранитель для внешнего сервиса: после failure_threshold неудач подряд
+    размыкается и reset_timeout секунд сразу отказывает, затем пропускает
+    один пробный запрос и по его результату замыкается или размыкается снова.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Можно ли выполнять запрос сейчас"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    @contextmanager
+    def attempt(self):
+        """
+        Учитывает результат запроса, пропущенного allow: выход без исключения -
+        успех, любое исключение - неудача. Отмена неудачей не считается, но
+        пробный запрос освобождается, иначе предохранитель не замкнулся бы никогда.
+        """
+        probing = self._probing
+        try:
+            yield
+        except asyncio.CancelledError:
+            if probing:
+                self._probing = False
+            raise
+        except BaseException:
+            self.record_failure()
+            raise
+        else:
+            self.record_success()
+
+    def record_success(self):
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+class RateLimiter:
+    """
+    Неблокирующие ведра токенов для множества ключей (например, пары
+    пользователь - обработчик): allow сразу отвечает, можно ли выполнить
+    операцию. Ведро, которое успело снова наполниться, ничем не отличается
+    от отсутствующего, поэтому удаляется; сроки удаления хранятся в колесе
+    времени из wheel_size ячеек по tick секунд, и очистка за вызов стоит
+    O(число истекших ключей), а не O(всех ключей).
+    """
+
+    def __init__(self, wheel_size: int = 64, tick: float = 1.0):
+        self.tick = tick
+        # ключ -> [токены, время обновления, время полного наполнения]
+        self._buckets: Dict[Hashable, List[float]] = {}
+        self._wheel: List[Set[Hashable]] = [set() for _ in range(wheel_size)]
+        self._swept_tick: Optional[int] = None
+
+    def allow(self, key: Hashable, rate: float, capacity: float, now: Optional[float] = None) -> bool:
+        """Забирает токен из ведра key, если он есть (rate токенов в секунду, не больше capacity)"""
+        now = time.monotonic() if now is None else now
+        self._sweep(now)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = capacity
+        else:
+            tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+
+        full_at = now + (capacity - tokens) / rate
+        self._buckets[key] = [tokens, now, full_at]
+        self._schedule(key, full_at)
+        return allowed
+
+    def _schedule(self, key: Hashable, at: float):
+        # Срок дальше оборота колеса попадает в последнюю ячейку и переносится при очистке
+        slot_tick = min(math.ceil(at / self.tick), self._swept_tick + len(self._wheel))
+        self._wheel[slot_tick % len(self._wheel)].add(key)
+
+    def _sweep(self, now: float):
+        current = math.floor(now / self.tick)
+        if self._swept_tick is None:
+            self._swept_tick = current
+        # Пропущено больше оборота: достаточно обойти каждую ячейку один раз
+        start = max(self._swept_tick + 1, current - len(self._wheel) + 1)
+        for slot_tick in range(start, current + 1):
+            slot = self._wheel[slot_tick % len(self._wheel)]
+            if not slot:
+                continue
+            keys = list(slot)
+            slot.clear()
+            for key in keys:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    continue
+                if bucket[2] <= now:
+                    del self._buckets[key]
+                else:
+                    self._schedule(key, bucket[2])
+        self._swept_tick = max(self._swept_tick, current)
+
+    def __len__(self):
+        return len(self._buckets)
\ No newline at end of file
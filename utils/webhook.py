@@ -0,0 +1,104 @@
+import asyncio
+import hmac
+import logging
+import secrets
+from typing import Callable, Optional, Set
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from handlers.payments import process_crypto_payment
+from config import (
+    WEBHOOK_PATH, TELEGRAM_WEBHOOK_PATH, TELEGRAM_WEBHOOK_URL, WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONNECTIONS, WEBHOOK_MAX_CONCURRENT_UPDATES, WEBHOOK_MAX_BODY_SIZE,
+    WEBAPP_HOST, WEBAPP_PORT
+)
+
+logger = logging.getLogger(__name__)
+
+class WebhookServer:
+    """
+    Одно aiohttp-приложение для обновлений Telegram и уведомлений CryptoBot.
+    Обновление подтверждается сразу после постановки в обработку, но не больше
+    WEBHOOK_MAX_CONCURRENT_UPDATES одновременно: при заполнении запрос ждет
+    свободного места, и Telegram сам придерживает следующие обновления.
+    Если задан feed, обновления не обрабатываются здесь, а передаются в него
+    (приемный процесс в режиме нескольких обработчиков).
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, feed: Optional[Callable] = None):
+        self.dp = dp
+        self.bot = bot
+        self.feed = feed
+        self.secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+        self._semaphore = asyncio.Semaphore(WEBHOOK_MAX_CONCURRENT_UPDATES)
+        self._tasks: Set[asyncio.Task] = set()
+
+    def create_app(self) -> web.Application:
+        # Тело больше WEBHOOK_MAX_BODY_SIZE aiohttp отклоняет с кодом 413, не читая целиком
+        app = web.Application(client_max_size=WEBHOOK_MAX_BODY_SIZE)
+        app.router.add_post(TELEGRAM_WEBHOOK_PATH, self.handle_update)
+        app.router.add_post(WEBHOOK_PATH, self.handle_crypto_payment)
+        return app
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        """Принимает обновление Telegram"""
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(token, self.secret):
+            return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except ValueError as e:
+            logger.warning(f"Некорректное обновление Telegram: {e}")
+            return web.Response(status=400)
+
+        if self.feed is not None:
+            await self.feed(update)
+            return web.Response()
+
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке обновления {update.update_id}: {e}")
+        finally:
+            self._semaphore.release()
+
+    async def handle_crypto_payment(self, request: web.Request) -> web.Response:
+        """Принимает уведомление CryptoBot; подпись проверяется по сырому телу запроса"""
+        body = await request.read()
+        if await process_crypto_payment(body, request.headers, self.bot):
+            return web.Response()
+        return web.Response(status=400)
+
+    async def run(self):
+        """Запускает сервер и регистрирует веб-хук; работает до отмены"""
+        await self.dp.emit_startup(bot=self.bot, dispatcher=self.dp)
+
+        runner = web.AppRunner(self.create_app())
+        await runner.setup()
+        site = web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT)
+        await site.start()
+
+        await self.bot.set_webhook(
+            TELEGRAM_WEBHOOK_URL,
+            secret_token=self.secret,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=self.dp.resolve_used_update_types()
+        )
+        logger.info(f"Веб-хук зарегистрирован: {TELEGRAM_WEBHOOK_URL}, сервер на {WEBAPP_HOST}:{WEBAPP_PORT}")
+
+        try:
+            await asyncio.Event().wait()
+        finally:
+            # Веб-хук не удаляется: пока бот перезапускается, Telegram копит обновления
+            await runner.cleanup()
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self.dp.emit_shutdown(bot=self.bot, dispatcher=self.dp)
\ No newline at end of file